@@ -0,0 +1,162 @@
+"""
+Flux d'événements du dashboard admin (GET /admin/events, SSE).
+
+Chaque tour sauvegardé par turns.save_turn() ajoute, dans le même commit,
+une ligne à la table admin_events : la conversation (créée ou mise à
+jour), les messages ajoutés et son état. Le dashboard applique ces deltas
+sans recharger la liste. Types d'événement :
+  conversation  première sauvegarde d'une conversation
+  message       nouveaux messages dans une conversation existante
+  handoff       la conversation passe à l'état done (client à rappeler)
+
+Les identifiants sont croissants : le dashboard reprend après le plus
+grand reçu (en-tête Last-Event-ID). Mais un id est attribué à l'insertion
+et visible au commit : sous Postgres, un id plus petit peut apparaître
+après un plus grand. Chaque lecture reprend donc aussi les événements des
+ADMIN_EVENTS_LOOKBACK_SECONDS dernières secondes (parmi les
+ADMIN_EVENTS_LOOKBACK_IDS derniers ids) ; le flux et le dashboard ignorent
+ceux déjà envoyés ou reçus. Dans le worker qui a écrit l'événement, les
+flux ouverts sont réveillés tout de suite (event_hub.notify) ; ceux des
+autres workers uvicorn le lisent au plus ADMIN_EVENTS_POLL_SECONDS après.
+Les événements de plus de ADMIN_EVENTS_RETENTION_HOURS sont purgés.
+"""
+import asyncio
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, delete, func, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import AdminEvent
+
+ADMIN_EVENTS_POLL_SECONDS = float(os.getenv("ADMIN_EVENTS_POLL_SECONDS", "2"))
+ADMIN_EVENTS_HEARTBEAT_SECONDS = float(os.getenv("ADMIN_EVENTS_HEARTBEAT_SECONDS", "15"))
+ADMIN_EVENTS_RETENTION_HOURS = float(os.getenv("ADMIN_EVENTS_RETENTION_HOURS", "24"))
+ADMIN_EVENTS_LOOKBACK_SECONDS = float(os.getenv("ADMIN_EVENTS_LOOKBACK_SECONDS", "10"))
+ADMIN_EVENTS_LOOKBACK_IDS = int(os.getenv("ADMIN_EVENTS_LOOKBACK_IDS", "1000"))
+ADMIN_EVENTS_BATCH_SIZE = 200
+ADMIN_EVENTS_PRUNE_SECONDS = 3600
+
+
+def turn_event(ctx, messages: list, conversation: dict, created: bool) -> AdminEvent:
+    """Événement d'un tour, ajouté à la session avant le commit de save_turn()."""
+    if ctx.state == "done" and ctx.start_state != "done":
+        kind = "handoff"
+    elif created:
+        kind = "conversation"
+    else:
+        kind = "message"
+    payload = {
+        "conversation": conversation,
+        "created": created,
+        "previous_state": ctx.start_state,
+        "messages": [{"role": m.role, "content": m.content} for m in messages],
+    }
+    return AdminEvent(client_token=ctx.client_token, conversation_id=ctx.conv_id, kind=kind,
+                      payload=json.dumps(payload, ensure_ascii=False), created_at=datetime.utcnow())
+
+
+def conversation_item(conv_id: str, created_at: Optional[datetime], state: Optional[str],
+                      message_count: Optional[int], contact_info: Optional[str]) -> dict:
+    """Même forme qu'un élément de GET /admin/conversations."""
+    state = state or "normal"
+    return {
+        "id": conv_id,
+        "created_at": str(created_at)[:16] if created_at else "--",
+        "message_count": message_count or 0,
+        "needs_human": state == "done",
+        "contact_info": contact_info if state == "done" else None,
+        "state": state,
+        "archived": False,  # un tour sauvegardé a restauré la conversation (retention.py)
+    }
+
+
+async def latest_event_id(db: AsyncSession) -> int:
+    return (await db.execute(select(func.max(AdminEvent.id)))).scalar() or 0
+
+
+async def oldest_event_id(db: AsyncSession) -> Optional[int]:
+    return (await db.execute(select(func.min(AdminEvent.id)))).scalar()
+
+
+async def events_after(db: AsyncSession, client_token: str, after_id: int, seen=()) -> list:
+    """
+    Événements d'id > after_id, plus les récents d'id plus petit (commités
+    en retard) absents de seen, les ids déjà envoyés sur ce flux.
+    """
+    late = and_(
+        AdminEvent.id > after_id - ADMIN_EVENTS_LOOKBACK_IDS,
+        AdminEvent.created_at >= datetime.utcnow() - timedelta(seconds=ADMIN_EVENTS_LOOKBACK_SECONDS),
+    )
+    if seen:
+        late = and_(late, AdminEvent.id.notin_(list(seen)))
+    return (await db.execute(
+        select(AdminEvent.id, AdminEvent.kind, AdminEvent.payload, AdminEvent.created_at)
+        .where(AdminEvent.client_token == client_token, or_(AdminEvent.id > after_id, late))
+        .order_by(AdminEvent.id).limit(ADMIN_EVENTS_BATCH_SIZE)
+    )).all()
+
+
+class SentEvents:
+    """Ids envoyés sur un flux, gardés le temps de la fenêtre de reprise."""
+
+    def __init__(self):
+        self.ids = {}  # id → created_at
+
+    def add(self, event_id: int, created_at: datetime):
+        self.ids[event_id] = created_at
+
+    def prune(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=ADMIN_EVENTS_LOOKBACK_SECONDS)
+        for event_id in [i for i, created_at in self.ids.items() if created_at < cutoff]:
+            del self.ids[event_id]
+
+
+class EventHub:
+    """Réveil des flux ouverts dans ce worker, par client."""
+
+    def __init__(self):
+        self._listeners = defaultdict(set)
+
+    def listen(self, client_token: str) -> asyncio.Event:
+        event = asyncio.Event()
+        self._listeners[client_token].add(event)
+        return event
+
+    def unlisten(self, client_token: str, event: asyncio.Event):
+        listeners = self._listeners.get(client_token)
+        if listeners is not None:
+            listeners.discard(event)
+            if not listeners:
+                del self._listeners[client_token]
+
+    def notify(self, client_token: str):
+        """À appeler après le commit d'un événement."""
+        for event in self._listeners.get(client_token, ()):
+            event.set()
+
+    def streams(self) -> int:
+        return sum(len(listeners) for listeners in self._listeners.values())
+
+
+event_hub = EventHub()
+
+
+async def prune_events():
+    cutoff = datetime.utcnow() - timedelta(hours=ADMIN_EVENTS_RETENTION_HOURS)
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(AdminEvent).where(AdminEvent.created_at < cutoff))
+        await db.commit()
+
+
+async def prune_loop():
+    while True:
+        try:
+            await prune_events()
+        except Exception as e:
+            print("ADMIN EVENTS ERROR:", e)
+        await asyncio.sleep(ADMIN_EVENTS_PRUNE_SECONDS)
@@ -0,0 +1,95 @@
+"""
+Cache des réponses GPT aux premières questions des visiteurs, par client.
+
+Sur un site de TPE, beaucoup de conversations commencent par la même
+question ("horaires ?", "vos prix ?", "where are you located?"). Au premier
+tour, la réponse de GPT ne dépend que de la question, du prompt du client
+et de la page visitée : elle est mise en cache sous
+(client, hash du prompt, hash de la page, question normalisée). Les
+tokens qui ne correspondent à aucun client partagent le client "unknown"
+(même prompt par défaut, mêmes réponses) : lookups reste borné.
+
+Le hash du prompt fait partie de la clé : après /superadmin/update-client,
+les anciennes réponses ne sont plus jamais servies (ici ou dans un autre
+worker, dès que son cache de tenants a vu la nouvelle version) ;
+invalidate() libère en plus la mémoire localement.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+from typing import Optional
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2000"))  # 0 = désactivé
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Au-delà, la question est trop spécifique pour se répéter
+ANSWER_CACHE_MAX_QUESTION_CHARS = 200
+
+PUNCT_RE = re.compile(r"[^\w\s]")
+
+
+def normalize_question(text: str) -> str:
+    """'Vos horaires ?' et 'vos  HORAIRES' → 'vos horaires'."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(PUNCT_RE.sub(" ", text).split())
+
+
+def prompt_hash(text: Optional[str]) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:16]
+
+
+class AnswerCache:
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()  # invalidate() vient du threadpool (endpoints admin)
+        # client → [hits, misses]
+        self.lookups = defaultdict(lambda: [0, 0])
+
+    def key(self, tenant_token: str, system_prompt: Optional[str], page_digest: str, question: str):
+        """None si la question ne se prête pas au cache."""
+        if not self.max_size or len(question) > ANSWER_CACHE_MAX_QUESTION_CHARS:
+            return None
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        return tenant_token, prompt_hash(system_prompt), page_digest, normalized
+
+    def get(self, key) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                self.lookups[key[0]][1] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.lookups[key[0]][0] += 1
+            return entry[1]
+
+    def put(self, key, answer: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tenant_token: str):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == tenant_token]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        hits = sum(h for h, _ in self.lookups.values())
+        misses = sum(m for _, m in self.lookups.values())
+        return {
+            "size": len(self._entries), "hits": hits, "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+        }
+
+
+answer_cache = AnswerCache()
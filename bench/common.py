@@ -0,0 +1,63 @@
+"""
+Outils communs aux scripts de bench : stub + application dans le même
+process, sur une base SQLite temporaire, et calcul des percentiles.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# uvicorn ferme une connexion keep-alive inactive après 5 s par défaut : sous
+# charge, le client du bench la réutilise au même moment (httpx.ReadError)
+BENCH_KEEP_ALIVE_SECONDS = 120
+
+
+def serve_in_thread(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning",
+                                           timeout_keep_alive=BENCH_KEEP_ALIVE_SECONDS))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise SystemExit("impossible de demarrer le serveur sur le port %d" % port)
+        time.sleep(0.05)
+    return server
+
+
+def start_stack(stub_port: int, app_port: int, latency: float, token_delay: float = 0.03,
+                email_latency: float = 0.2, email_fail_rate: float = 0.0):
+    """
+    Lance le stub OpenAI/Resend puis chatbot.app, configuré pour l'utiliser.
+    Retourne (app du stub, URL de l'application).
+    """
+    tmp = tempfile.mkdtemp(prefix="replai-bench-")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmp, "bench.db")
+    os.environ["OPENAI_BASE_URL"] = "http://127.0.0.1:%d/v1" % stub_port
+    os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ["RESEND_API_URL"] = "http://127.0.0.1:%d" % stub_port
+    os.environ["RESEND_API_KEY"] = "stub"
+    os.environ.setdefault("OUTBOX_RETRY_BASE_SECONDS", "1")
+    # Stub, application et client partagent la boucle : sous charge, une
+    # transaction d'écriture SQLite peut dépasser les 5 s par défaut
+    os.environ.setdefault("SQLITE_BUSY_TIMEOUT_MS", "30000")
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+    from openai_stub import make_app
+    import chatbot
+
+    stub = make_app(latency, token_delay, email_latency, email_fail_rate)
+    serve_in_thread(stub, stub_port)
+    serve_in_thread(chatbot.app, app_port)
+    return stub, "http://127.0.0.1:%d" % app_port
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
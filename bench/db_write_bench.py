@@ -0,0 +1,114 @@
+"""
+Débit d'écriture SQLite des tours de chat : réglages d'origine vs profil
+de database.py (WAL, synchronous=NORMAL, busy_timeout, mmap).
+
+Chaque profil tourne dans un process séparé (les réglages sont lus à
+l'import de database.py) sur une base temporaire neuve. --concurrency
+tâches enchaînent des tours complets (turns.load_turn puis save_turn :
+une lecture, un commit de deux messages + résumé de la conversation)
+sur --conversations conversations.
+
+    python bench/db_write_bench.py --turns 3000 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT, percentile
+
+# Réglages vides / à 0 = comportement des drivers, comme avant le profil
+PROFILES = {
+    "origine": {"SQLITE_JOURNAL_MODE": "", "SQLITE_SYNCHRONOUS": "", "SQLITE_BUSY_TIMEOUT_MS": "0",
+                "SQLITE_MMAP_SIZE": "0"},
+    "profil": {},
+}
+
+
+async def run_turns(total: int, concurrency: int, conversations: int) -> dict:
+    from sqlalchemy.exc import OperationalError
+    from database import AsyncSessionLocal, async_engine
+    from turns import load_turn, save_turn
+
+    latencies = []
+    locked = 0
+    queue = iter(range(total))
+    conv_ids = ["bench-%d" % i for i in range(conversations)]
+
+    async def worker():
+        nonlocal locked
+        for i in queue:
+            conv_id = random.choice(conv_ids)
+            t0 = time.perf_counter()
+            try:
+                async with AsyncSessionLocal() as db:
+                    ctx = await load_turn(conv_id, "", db)
+                    ctx.add_user_message("Quels sont vos horaires ? (%d)" % i)
+                    await save_turn(ctx, db, "Nous sommes ouverts du lundi au vendredi de 9h a 18h.")
+            except OperationalError as e:
+                locked += 1
+                if locked == 1:
+                    print("  erreur :", str(e.orig), file=sys.stderr)
+                continue
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - t0
+    await async_engine.dispose()
+    return {"turns": len(latencies), "errors": locked, "wall": wall,
+            "p50": percentile(latencies, 50) if latencies else 0,
+            "p95": percentile(latencies, 95) if latencies else 0}
+
+
+def child(args):
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    from database import engine
+    from migrations import migrate
+    from search import init_search
+
+    migrate()
+    init_search(engine)
+    engine.dispose()
+    result = asyncio.run(run_turns(args.turns, args.concurrency, args.conversations))
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Débit d'écriture SQLite : réglages d'origine vs profil")
+    parser.add_argument("--turns", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    results = {}
+    for name, overrides in PROFILES.items():
+        tmp = tempfile.mkdtemp(prefix="replai-dbbench-")
+        env = dict(os.environ, DATABASE_URL="sqlite:///" + os.path.join(tmp, "bench.db"), **overrides)
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--turns", str(args.turns),
+             "--concurrency", str(args.concurrency), "--conversations", str(args.conversations)],
+            env=env, check=True, stdout=subprocess.PIPE, text=True
+        ).stdout
+        results[name] = json.loads(out.strip().splitlines()[-1])
+
+    print("%d tours, concurrence %d, %d conversations" % (args.turns, args.concurrency, args.conversations))
+    print("%-8s %10s %8s %9s %9s" % ("", "tours/s", "erreurs", "p50", "p95"))
+    for name, r in results.items():
+        print("%-8s %10.1f %8d %8.1fms %8.1fms" % (
+            name, r["turns"] / r["wall"], r["errors"], r["p50"] * 1000, r["p95"] * 1000))
+    base, tuned = results["origine"], results["profil"]
+    print("gain     : x%.1f" % ((tuned["turns"] / tuned["wall"]) / max(base["turns"] / base["wall"], 1e-9)))
+
+
+if __name__ == "__main__":
+    main()
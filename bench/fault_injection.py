@@ -0,0 +1,175 @@
+"""
+Pannes OpenAI simulées : vérifie échéances, retries et disjoncteur
+(resilience.py) contre bench/openai_stub.py.
+
+Phases successives, chacune avec --requests messages (un sur cinq via
+/chat/stream) et --concurrency en vol :
+  sain       aucune panne                → réponses GPT
+  instable   --flaky-rate d'erreurs 500  → absorbées par les retries
+  panne      100 % d'erreurs 500         → réponse de repli, disjoncteur
+                                            ouvert, plus d'appels au stub
+  reprise    après le délai du disjoncteur → réponses GPT
+  blocage    OpenAI ne répond plus       → repli en moins de l'échéance
+  reprise    idem
+Chaque vérification affiche OK ou ECHEC ; code de sortie 1 si une échoue.
+
+    python bench/fault_injection.py --requests 60 --concurrency 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+
+from common import percentile, start_stack
+
+
+class Phase:
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = []
+        self.normal = 0
+        self.fallback = 0
+        self.errors = 0
+        self.stub_calls = 0
+
+
+def stream_result(text: str):
+    for block in text.split("\n\n"):
+        if block.startswith("event: done"):
+            return json.loads(block.split("data: ", 1)[1])
+    return None
+
+
+async def run_phase(http, base_url: str, token: str, phase: Phase, total: int, concurrency: int, unavailable: str):
+    queue = iter(range(total))
+
+    async def visitor():
+        for i in queue:
+            body = {"message": "Question %s numero %d ?" % (phase.name, i), "client_token": token,
+                    "conversation_id": str(uuid.uuid4())}
+            t0 = time.perf_counter()
+            try:
+                if i % 5 == 4:
+                    r = await http.post(base_url + "/chat/stream", json=body)
+                    data = stream_result(r.text) if r.status_code == 200 else None
+                else:
+                    r = await http.post(base_url + "/chat", json=body)
+                    data = r.json() if r.status_code == 200 else None
+            except Exception as e:
+                print("ERREUR", phase.name, type(e).__name__, e)
+                data = None
+            phase.latencies.append(time.perf_counter() - t0)
+            if data is None:
+                phase.errors += 1
+            elif data["reply"] == unavailable:
+                phase.fallback += 1
+            else:
+                phase.normal += 1
+
+    await asyncio.gather(*(visitor() for _ in range(concurrency)))
+
+
+def check(label: str, ok: bool, failures: list):
+    print("  %-6s %s" % ("OK" if ok else "ECHEC", label))
+    if not ok:
+        failures.append(label)
+
+
+async def run(base_url: str, stub, args) -> list:
+    import httpx
+    import chatbot
+    from resilience import OPENAI_DEADLINES, openai_breaker
+
+    deadline = OPENAI_DEADLINES["main"]
+    failures = []
+    async with httpx.AsyncClient(timeout=120) as http:
+        r = await http.post(base_url + "/superadmin/create-client", json={
+            "business_name": "Fault", "admin_password": "bench", "client_email": "owner@example.com",
+            "superadmin_password": args.superadmin_password,
+        })
+        r.raise_for_status()
+        token = r.json()["token"]
+
+        async def phase(name: str, error_rate: float, stall_rate: float) -> Phase:
+            stub.state.error_rate = error_rate
+            stub.state.stall_rate = stall_rate
+            p = Phase(name)
+            calls = stub.state.calls
+            t0 = time.perf_counter()
+            await run_phase(http, base_url, token, p, args.requests, args.concurrency, chatbot.MSG_UNAVAILABLE)
+            p.stub_calls = stub.state.calls - calls
+            print("%-10s %5.1fs  normales=%d repli=%d erreurs=%d  p50=%.0fms p95=%.0fms max=%.0fms  "
+                  "appels stub=%d  disjoncteur=%s" % (
+                      name, time.perf_counter() - t0, p.normal, p.fallback, p.errors,
+                      percentile(p.latencies, 50) * 1000, percentile(p.latencies, 95) * 1000,
+                      max(p.latencies) * 1000, p.stub_calls, openai_breaker.state))
+            return p
+
+        async def recover(name: str):
+            stub.state.error_rate = stub.state.stall_rate = 0.0
+            await asyncio.sleep(openai_breaker.cooldown + 0.2)
+            # Premier message seul (et hors cache de réponses) : c'est l'appel
+            # d'essai qui referme le disjoncteur
+            await http.post(base_url + "/chat", json={"message": "Question d'essai %s ?" % name,
+                                                      "client_token": token})
+            p = await phase(name, 0.0, 0.0)
+            check("disjoncteur refermé", openai_breaker.state == "closed", failures)
+            check("toutes les réponses viennent de GPT", p.normal == args.requests, failures)
+
+        p = await phase("sain", 0.0, 0.0)
+        check("toutes les réponses viennent de GPT", p.normal == args.requests, failures)
+
+        p = await phase("instable", args.flaky_rate, 0.0)
+        check("aucune erreur HTTP", p.errors == 0, failures)
+        check("au moins 90 % de réponses GPT malgré les erreurs", p.normal >= 0.9 * args.requests, failures)
+
+        p = await phase("panne", 1.0, 0.0)
+        check("aucune erreur HTTP", p.errors == 0, failures)
+        check("réponse de repli partout", p.fallback == args.requests, failures)
+        check("disjoncteur ouvert", openai_breaker.state == "open", failures)
+        check("le stub n'est plus appelé pour chaque message", p.stub_calls < args.requests, failures)
+        await recover("reprise")
+
+        p = await phase("blocage", 0.0, 1.0)
+        check("aucune erreur HTTP", p.errors == 0, failures)
+        check("réponse de repli partout", p.fallback == args.requests, failures)
+        check("aucune réponse au-delà de l'échéance (%.0fs)" % deadline, max(p.latencies) < deadline + 1.5, failures)
+        check("disjoncteur ouvert", openai_breaker.state == "open", failures)
+        await recover("reprise 2")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pannes OpenAI simulées contre le stub local")
+    parser.add_argument("--requests", type=int, default=60, help="messages par phase")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.1, help="latence simulée du modèle (s)")
+    parser.add_argument("--flaky-rate", type=float, default=0.3, help="part d'erreurs 500 en phase instable")
+    parser.add_argument("--superadmin-password", default="superadmin123")
+    parser.add_argument("--stub-port", type=int, default=8910)
+    parser.add_argument("--app-port", type=int, default=8911)
+    args = parser.parse_args()
+
+    # Échéance et délai du disjoncteur courts pour que le scénario dure peu
+    os.environ.setdefault("OPENAI_DEADLINE_MAIN", "2")
+    os.environ.setdefault("OPENAI_RETRY_BASE_SECONDS", "0.05")
+    os.environ.setdefault("OPENAI_STREAM_IDLE_SECONDS", "2")
+    os.environ.setdefault("OPENAI_BREAKER_COOLDOWN_SECONDS", "2")
+    os.environ.setdefault("TRANSLATION_WARMUP_LANGS", "")
+    # Un seul client de bench : pas de limite par client (scheduler.py)
+    os.environ.setdefault("LLM_TENANT_RATE", "10000")
+    os.environ.setdefault("LLM_TENANT_BURST", "10000")
+
+    stub, base_url = start_stack(args.stub_port, args.app_port, args.latency, token_delay=0.005)
+    stub.state.stall_seconds = 60
+    failures = asyncio.run(run(base_url, stub, args))
+    print()
+    print("ECHEC : " + ", ".join(failures) if failures else "tout est OK")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Hedging de la réponse principale (routing.py) contre bench/openai_stub.py
+avec une latence à longue traîne (--latency-dist).
+
+Pour /chat puis /chat/stream : --requests messages sans hedging, puis
+autant avec. Rapport : p50 / p95 / p99 (réponse complète pour /chat,
+premier token pour /chat/stream) et appels au stub par message, c'est-à-
+dire le surcoût du hedging.
+
+    python bench/hedging_bench.py --requests 400 --concurrency 20 --latency 0.2 --latency-dist tail:0.03:3
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+from common import percentile, start_stack
+
+
+async def run_batch(http, base_url: str, token: str, endpoint: str, label: str, total: int, concurrency: int) -> list:
+    latencies = []
+    queue = iter(range(total))
+
+    async def visitor():
+        for i in queue:
+            body = {"message": "Question %s numero %d ?" % (label, i), "client_token": token,
+                    "conversation_id": str(uuid.uuid4())}
+            t0 = time.perf_counter()
+            if endpoint == "chat/stream":
+                async with http.stream("POST", base_url + "/chat/stream", json=body) as r:
+                    first = None
+                    async for line in r.aiter_lines():
+                        if first is None and line.startswith("event: token"):
+                            first = time.perf_counter() - t0
+                latencies.append(first if first is not None else time.perf_counter() - t0)
+            else:
+                r = await http.post(base_url + "/chat", json=body)
+                r.raise_for_status()
+                latencies.append(time.perf_counter() - t0)
+
+    await asyncio.gather(*(visitor() for _ in range(concurrency)))
+    return latencies
+
+
+async def run(base_url: str, stub, args):
+    import httpx
+    import routing
+
+    async with httpx.AsyncClient(timeout=120) as http:
+        r = await http.post(base_url + "/superadmin/create-client", json={
+            "business_name": "Hedging", "admin_password": "bench", "client_email": "owner@example.com",
+            "superadmin_password": args.superadmin_password,
+        })
+        r.raise_for_status()
+        token = r.json()["token"]
+
+        print("%-12s %-8s %8s %8s %8s %14s %8s" % ("endpoint", "hedging", "p50", "p95", "p99", "appels/message", "doubles"))
+        for endpoint in ("chat", "chat/stream"):
+            tracker = routing.latency_trackers["first_token" if endpoint == "chat/stream" else "complete"]
+            for enabled in (False, True):
+                routing.HEDGE_ENABLED = enabled
+                hedges = tracker.hedges
+                calls = stub.state.calls
+                label = endpoint + ("-on" if enabled else "-off")
+                latencies = await run_batch(http, base_url, token, endpoint, label, args.requests, args.concurrency)
+                print("%-12s %-8s %7.0fms %7.0fms %7.0fms %14.2f %8d" % (
+                    endpoint, "oui" if enabled else "non", percentile(latencies, 50) * 1000,
+                    percentile(latencies, 95) * 1000, percentile(latencies, 99) * 1000,
+                    (stub.state.calls - calls) / args.requests, tracker.hedges - hedges))
+        print()
+        print("routing :", routing.routing_stats()["hedging"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hedging de la réponse principale contre le stub local")
+    parser.add_argument("--requests", type=int, default=400, help="messages par mesure")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="latence simulée du modèle (s)")
+    parser.add_argument("--latency-dist", default="tail:0.03:3", help="voir bench/openai_stub.py")
+    parser.add_argument("--superadmin-password", default="superadmin123")
+    parser.add_argument("--stub-port", type=int, default=8920)
+    parser.add_argument("--app-port", type=int, default=8921)
+    args = parser.parse_args()
+
+    os.environ.setdefault("TRANSLATION_WARMUP_LANGS", "")
+    # Un seul client de bench : pas de limite par client (scheduler.py)
+    os.environ.setdefault("LLM_TENANT_RATE", "10000")
+    os.environ.setdefault("LLM_TENANT_BURST", "10000")
+
+    stub, base_url = start_stack(args.stub_port, args.app_port, args.latency, token_delay=0.005)
+    from openai_stub import latency_sampler
+    stub.state.latency = latency_sampler(args.latency, args.latency_dist)
+    asyncio.run(run(base_url, stub, args))
+
+
+if __name__ == "__main__":
+    main()
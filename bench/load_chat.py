@@ -0,0 +1,105 @@
+"""
+Test de charge de /chat contre le faux serveur OpenAI (bench/openai_stub.py).
+
+Lance le stub et l'application dans le même process (uvicorn, deux threads),
+sur une base SQLite temporaire, puis envoie --requests messages avec
+--concurrency conversations en vol simultanément.
+
+L'ancien /chat synchrone occupait un thread du threadpool Starlette (40 par
+défaut) pendant tout l'appel GPT : son débit plafonne à 40 / latence req/s.
+Le chemin async n'est limité que par la latence du modèle, la base et le
+scheduler (scheduler.py) : le bench lève son plafond d'appels GPT en vol
+(LLM_MAX_CONCURRENCY, 64 par défaut) et sa limite par client, tous ses
+messages venant du même client.
+
+Le stub, l'application et le client partagent un process : vers 35 req/s
+c'est le CPU qui limite, pas le chemin async. Le gain se mesure donc avec
+une latence modèle qui met le plafond sync (40 / latence) bien en dessous :
+
+    python bench/load_chat.py --requests 1000 --concurrency 200 --latency 10
+    → environ 17 req/s, gain x4 (x5 au mieux : 200 conversations / 40 threads)
+
+Les erreurs réseau du client sont comptées par requête (ERREURS RESEAU).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from common import percentile, start_stack
+
+SYNC_THREADPOOL_SIZE = 40  # limite par défaut d'anyio pour les endpoints "def"
+
+
+async def run_load(base_url: str, total: int, concurrency: int, token: str) -> list:
+    import httpx
+
+    latencies = []
+    errors = 0
+    transport_errors = 0
+    queue = iter(range(total))
+
+    async def worker(http):
+        nonlocal errors, transport_errors
+        for i in queue:
+            t0 = time.perf_counter()
+            try:
+                # Question différente à chaque message : le cache de réponses
+                # (answers.py) ne doit pas court-circuiter l'appel GPT mesuré
+                r = await http.post(base_url + "/chat", json={
+                    "message": "Question %d : quels sont vos horaires ?" % i, "client_token": token,
+                })
+            except httpx.TransportError as e:
+                transport_errors += 1
+                print("ERREUR", type(e).__name__, e)
+                continue
+            latencies.append(time.perf_counter() - t0)
+            if r.status_code != 200:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as http:
+        await asyncio.gather(*(worker(http) for _ in range(concurrency)))
+    if errors:
+        print("ERREURS HTTP :", errors)
+    if transport_errors:
+        print("ERREURS RESEAU :", transport_errors)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge /chat (async) contre un stub OpenAI local")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=10.0, help="latence simulée du modèle (s)")
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--app-port", type=int, default=8901)
+    args = parser.parse_args()
+
+    os.environ.setdefault("TRANSLATION_WARMUP_LANGS", "")
+    # Un seul client de bench, des centaines de conversations en vol : pas
+    # de limite par client ni de plafond d'appels en cours (scheduler.py)
+    os.environ.setdefault("LLM_TENANT_RATE", "10000")
+    os.environ.setdefault("LLM_TENANT_BURST", "10000")
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", "10000")
+    stub, base_url = start_stack(args.stub_port, args.app_port, args.latency)
+
+    t0 = time.perf_counter()
+    latencies = asyncio.run(run_load(base_url, args.requests, args.concurrency, ""))
+    wall = time.perf_counter() - t0
+
+    ceiling = SYNC_THREADPOOL_SIZE / max(args.latency, 1e-3)
+    print("requetes      : %d (concurrence %d, latence modele %.2fs)" % (len(latencies), args.concurrency, args.latency))
+    print("appels stub   : %d" % stub.state.calls)
+    print("duree totale  : %.2fs" % wall)
+    print("debit         : %.1f req/s" % (len(latencies) / wall))
+    print("latence p50   : %.3fs" % statistics.median(latencies))
+    print("latence p95   : %.3fs" % percentile(latencies, 95))
+    print("latence max   : %.3fs" % max(latencies))
+    print("plafond sync  : %.1f req/s (%d threads / %.2fs)" % (ceiling, SYNC_THREADPOOL_SIZE, args.latency))
+    print("gain          : x%.1f" % ((len(latencies) / wall) / ceiling))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Test de charge réaliste : conversations multi-tours qui parcourent la
+machine à états du handoff, plus un tableau de bord admin qui consulte
+les conversations en parallèle. Tout tourne hors ligne contre
+bench/openai_stub.py (OpenAI + Resend simulés).
+
+Chaque visiteur virtuel joue un scénario tiré au hasard (--mix) :
+  info      3 questions, réponses GPT
+  handoff   question, demande d'un humain, "oui", coordonnées → email
+  decline   demande d'un humain, "non merci", question
+  button    bouton "Parler à un humain" (/contact-human), coordonnées
+  stream    2 questions via /chat/stream
+La moitié des conversations est en anglais (traductions du handoff).
+Les réponses sont vérifiées (état attendu, needs_human) : un écart est
+compté comme erreur de scénario.
+
+Rapport : débit, p50 / p95 / p99 par étape et au total.
+
+    python bench/load_scenarios.py --conversations 300 --concurrency 100 --latency 0.8
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+from collections import defaultdict
+
+from common import percentile, start_stack
+
+QUESTIONS = {
+    "fr": ["Bonjour, quels sont vos horaires ?", "Quels sont vos tarifs ?", "Vous livrez a domicile ?"],
+    "en": ["Hello, what are your opening hours?", "How much does it cost?", "Do you deliver?"],
+}
+ASK_HUMAN = {"fr": "je veux parler a un humain", "en": "I want to talk to a human"}
+YES = {"fr": "oui", "en": "yes please"}
+NO = {"fr": "non merci", "en": "no thanks"}
+CONTACT = {"fr": "Jean 06 12 34 56 78", "en": "John +44 20 7946 0958"}
+
+# (endpoint, message, needs_human attendu ou None si indifférent)
+SCENARIOS = {
+    "info": lambda lang: [("chat", q, False) for q in QUESTIONS[lang]],
+    "handoff": lambda lang: [
+        ("chat", QUESTIONS[lang][0], False), ("chat", ASK_HUMAN[lang], False),
+        ("chat", YES[lang], False), ("chat", CONTACT[lang], True),
+    ],
+    "decline": lambda lang: [
+        ("chat", ASK_HUMAN[lang], False), ("chat", NO[lang], False), ("chat", QUESTIONS[lang][1], False),
+    ],
+    "button": lambda lang: [
+        ("chat", QUESTIONS[lang][2], False), ("contact-human", None, False), ("chat", CONTACT[lang], True),
+    ],
+    "stream": lambda lang: [("chat/stream", q, None) for q in QUESTIONS[lang][:2]],
+}
+DEFAULT_MIX = "info=4,handoff=2,decline=1,button=1,stream=2"
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, name: str, seconds: float, ok: bool = True):
+        self.latencies[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+
+async def timed(rec: Recorder, name: str, coro):
+    t0 = time.perf_counter()
+    try:
+        response = await coro
+    except Exception as e:
+        rec.add(name, time.perf_counter() - t0, False)
+        print("ERREUR", name, type(e).__name__, e)
+        return None
+    rec.add(name, time.perf_counter() - t0, response.status_code == 200)
+    return response if response.status_code == 200 else None
+
+
+async def run_conversation(http, base_url: str, token: str, scenario: str, lang: str, rec: Recorder):
+    conv_id = str(uuid.uuid4())
+    for endpoint, message, expect_human in SCENARIOS[scenario](lang):
+        name = endpoint + " (" + scenario + ")"
+        if endpoint == "contact-human":
+            r = await timed(rec, name, http.post(base_url + "/contact-human",
+                                                 json={"conversation_id": conv_id, "client_token": token}))
+        else:
+            r = await timed(rec, name, http.post(base_url + "/" + endpoint, json={
+                "message": message, "conversation_id": conv_id, "client_token": token,
+            }))
+        if r is None:
+            rec.errors["scenario " + scenario] += 1
+            return
+        if endpoint != "chat/stream" and expect_human is not None and r.json()["needs_human"] != expect_human:
+            rec.errors["scenario " + scenario] += 1
+            return
+        if endpoint == "chat/stream" and "event: done" not in r.text:
+            rec.errors["scenario " + scenario] += 1
+            return
+
+
+async def run_admin(http, base_url: str, token: str, password: str, rec: Recorder, stop: asyncio.Event,
+                    interval: float):
+    headers = {"X-Admin-Password": password}
+    await timed(rec, "admin login", http.post(base_url + "/admin/login",
+                                              json={"client_token": token, "password": password}))
+    while not stop.is_set():
+        r = await timed(rec, "admin list", http.get(base_url + "/admin/conversations",
+                                                    params={"client_token": token, "limit": 50}, headers=headers))
+        if r is not None:
+            data = r.json()
+            if data["next_cursor"]:
+                await timed(rec, "admin list (page 2)", http.get(
+                    base_url + "/admin/conversations",
+                    params={"client_token": token, "limit": 50, "cursor": data["next_cursor"]}, headers=headers))
+            if data["items"]:
+                conv_id = random.choice(data["items"])["id"]
+                await timed(rec, "admin detail", http.get(base_url + "/admin/conversations/" + conv_id,
+                                                          params={"client_token": token}, headers=headers))
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_load(base_url: str, args) -> tuple:
+    import httpx
+
+    mix = []
+    for part in args.mix.split(","):
+        name, weight = part.split("=")
+        mix += [name] * int(weight)
+
+    rec = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency + 10, max_keepalive_connections=args.concurrency + 10)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as http:
+        r = await http.post(base_url + "/superadmin/create-client", json={
+            "business_name": "Bench", "admin_password": "bench", "client_email": "owner@example.com",
+            "superadmin_password": args.superadmin_password,
+        })
+        r.raise_for_status()
+        token = r.json()["token"]
+
+        queue = iter(range(args.conversations))
+        counts = defaultdict(int)
+
+        async def visitor():
+            for i in queue:
+                scenario = random.choice(mix)
+                counts[scenario] += 1
+                await run_conversation(http, base_url, token, scenario, "fr" if i % 2 else "en", rec)
+
+        stop = asyncio.Event()
+        admin = asyncio.create_task(run_admin(http, base_url, token, "bench", rec, stop, args.admin_interval))
+        t0 = time.perf_counter()
+        await asyncio.gather(*(visitor() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - t0
+        stop.set()
+        await admin
+        # Laisser l'outbox envoyer les derniers emails
+        await asyncio.sleep(1.5)
+    return rec, wall, counts
+
+
+def report(rec: Recorder, wall: float, counts: dict, stub):
+    print("conversations : %s" % ", ".join("%s=%d" % kv for kv in sorted(counts.items())))
+    print("duree totale  : %.2fs" % wall)
+    print("appels stub   : %d chat.completions, %d emails (%d echecs simules)" % (
+        stub.state.calls, stub.state.emails, stub.state.email_failures))
+    print()
+    print("%-28s %7s %9s %8s %8s %8s %7s" % ("etape", "n", "req/s", "p50", "p95", "p99", "erreurs"))
+    everything = []
+    for name in sorted(rec.latencies):
+        values = rec.latencies[name]
+        everything += values
+        print("%-28s %7d %9.1f %7.0fms %7.0fms %7.0fms %7d" % (
+            name, len(values), len(values) / wall, percentile(values, 50) * 1000,
+            percentile(values, 95) * 1000, percentile(values, 99) * 1000, rec.errors.get(name, 0)))
+    print("%-28s %7d %9.1f %7.0fms %7.0fms %7.0fms %7d" % (
+        "TOTAL", len(everything), len(everything) / wall, percentile(everything, 50) * 1000,
+        percentile(everything, 95) * 1000, percentile(everything, 99) * 1000, sum(rec.errors.values())))
+    failed = {k: v for k, v in rec.errors.items() if k.startswith("scenario ")}
+    if failed:
+        print("scenarios en echec :", failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversations multi-tours + admin contre un stub OpenAI/Resend local")
+    parser.add_argument("--conversations", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="poids des scenarios (defaut %s)" % DEFAULT_MIX)
+    parser.add_argument("--latency", type=float, default=0.8, help="latence simulée du modèle (s)")
+    parser.add_argument("--token-delay", type=float, default=0.03, help="délai entre tokens en streaming (s)")
+    parser.add_argument("--email-latency", type=float, default=0.2)
+    parser.add_argument("--email-fail-rate", type=float, default=0.0)
+    parser.add_argument("--admin-interval", type=float, default=0.5, help="pause entre deux rafraîchissements admin (s)")
+    parser.add_argument("--superadmin-password", default="superadmin123")
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--app-port", type=int, default=8901)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    # Un seul client de bench, des centaines de conversations en vol : pas
+    # de limite par client ni de plafond d'appels en cours (scheduler.py)
+    os.environ.setdefault("LLM_TENANT_RATE", "10000")
+    os.environ.setdefault("LLM_TENANT_BURST", "10000")
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", "10000")
+    stub, base_url = start_stack(args.stub_port, args.app_port, args.latency, args.token_delay,
+                                 args.email_latency, args.email_fail_rate)
+    rec, wall, counts = asyncio.run(run_load(base_url, args))
+    report(rec, wall, counts, stub)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Faux serveur OpenAI (POST /v1/chat/completions) et Resend (POST /emails)
+pour les tests de charge hors ligne.
+
+Chaque appel chat.completions attend --latency secondes avant de répondre,
+comme un vrai modèle qui génère sa réponse. --latency-dist en fait une
+distribution (hedging de routing.py) :
+  lognormal:0.5    latency * loi log-normale de sigma 0.5
+  tail:0.05:8      latency, mais 8 s pour 5 % des appels
+
+Le format de réponse est celui de l'API chat.completions, le SDK openai
+l'accepte donc tel quel. Avec stream=True, la réponse est envoyée mot par
+mot (chat.completion.chunk), un mot toutes les --token-delay secondes
+après le premier.
+
+L'usage renvoyé simule le cache de prompt d'OpenAI : les tokens du plus
+long préfixe de messages déjà vu (si >= 1024 tokens, par tranches de 128)
+sont comptés dans prompt_tokens_details.cached_tokens.
+
+Les emails attendent --email-latency secondes ; --email-fail-rate en fait
+échouer une partie (HTTP 500) pour exercer les retries de l'outbox
+(app.state.email_fail_rate en cours de route).
+
+Pannes injectées (resilience.py) : --error-rate fait échouer une part des
+appels chat.completions (HTTP 500), --stall-rate en fait attendre
+--stall-seconds avant de répondre. Modifiables en cours de route via
+app.state.error_rate / stall_rate / stall_seconds (bench/fault_injection.py).
+
+    python bench/openai_stub.py --port 8900 --latency 1.0 --token-delay 0.03
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=stub \
+    RESEND_API_URL=http://127.0.0.1:8900 RESEND_API_KEY=stub uvicorn chatbot:app
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from starlette.requests import ClientDisconnect
+
+
+def usage_for(body: dict, content: str, seen_prefixes: set) -> dict:
+    """Usage estimé (~4 caractères par token) avec simulation du cache de prompt."""
+    digest = hashlib.sha256()
+    tokens = cached = 0
+    for message in body.get("messages", []):
+        digest.update(json.dumps(message, sort_keys=True).encode("utf-8"))
+        tokens += 4 + len(str(message.get("content", ""))) // 4
+        prefix = digest.hexdigest()
+        if prefix in seen_prefixes:
+            cached = tokens
+        seen_prefixes.add(prefix)
+    cached = cached // 128 * 128 if cached >= 1024 else 0
+    completion_tokens = max(1, len(content) // 4)
+    return {"prompt_tokens": tokens, "completion_tokens": completion_tokens,
+            "total_tokens": tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached}}
+
+
+def completion(content: str, model: str, usage: dict) -> dict:
+    return {
+        "id": "chatcmpl-" + uuid.uuid4().hex[:12],
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": usage,
+    }
+
+
+def chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    data = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return "data: " + json.dumps(data) + "\n\n"
+
+
+def fake_translations(body: dict) -> str:
+    """Réponse JSON de fetch_handoff_translations : messages préfixés par la langue."""
+    prompt = body["messages"][-1]["content"]
+    messages = json.loads(prompt.split("Messages: ", 1)[1])
+    return json.dumps({"language": "en", "translations": ["[en] " + m for m in messages]})
+
+
+def fake_reply(body: dict) -> str:
+    """Réponse plausible selon le type d'appel fait par chatbot.py."""
+    if body.get("max_tokens") == 5:
+        return "YES"  # classify_yes_no
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        return fake_translations(body)
+    return "Bonjour ! Nous sommes ouverts du lundi au vendredi de 9h a 18h."
+
+
+def latency_sampler(latency: float, dist: str = ""):
+    """Fonction sans argument qui tire une latence selon --latency-dist."""
+    kind, _, params = dist.partition(":")
+    if kind == "lognormal":
+        sigma = float(params)
+        return lambda: latency * random.lognormvariate(0, sigma)
+    if kind == "tail":
+        rate, slow = (float(p) for p in params.split(":"))
+        return lambda: slow if random.random() < rate else latency
+    if kind:
+        raise ValueError("distribution inconnue : " + dist)
+    return lambda: latency
+
+
+def make_app(latency: float, token_delay: float = 0.03, email_latency: float = 0.2,
+             email_fail_rate: float = 0.0, error_rate: float = 0.0, stall_rate: float = 0.0,
+             stall_seconds: float = 30.0, latency_dist: str = "") -> FastAPI:
+    app = FastAPI()
+    app.state.calls = 0
+    app.state.latency = latency_sampler(latency, latency_dist)
+    app.state.error_rate = error_rate
+    app.state.stall_rate = stall_rate
+    app.state.stall_seconds = stall_seconds
+    app.state.injected_errors = 0
+    app.state.injected_stalls = 0
+    app.state.seen_prefixes = set()
+    app.state.email_fail_rate = email_fail_rate
+    app.state.emails = 0
+    app.state.email_failures = 0
+
+    @app.post("/emails")
+    async def send_email(request: Request):
+        await request.json()
+        await asyncio.sleep(email_latency)
+        if random.random() < app.state.email_fail_rate:
+            app.state.email_failures += 1
+            return JSONResponse({"name": "internal_server_error", "message": "stub failure"}, status_code=500)
+        app.state.emails += 1
+        return {"id": str(uuid.uuid4())}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        try:
+            body = await request.json()
+        except ClientDisconnect:
+            return Response(status_code=499)  # appel perdant d'un hedging, annulé
+        app.state.calls += 1
+        if random.random() < app.state.error_rate:
+            app.state.injected_errors += 1
+            return JSONResponse({"error": {"message": "stub failure", "type": "server_error"}}, status_code=500)
+        if random.random() < app.state.stall_rate:
+            app.state.injected_stalls += 1
+            await asyncio.sleep(app.state.stall_seconds)
+        model = body.get("model", "stub")
+        content = fake_reply(body)
+        usage = usage_for(body, content, app.state.seen_prefixes)
+        if not body.get("stream"):
+            await asyncio.sleep(app.state.latency())
+            return completion(content, model, usage)
+
+        async def chunks():
+            completion_id = "chatcmpl-" + uuid.uuid4().hex[:12]
+            await asyncio.sleep(app.state.latency())
+            yield chunk(completion_id, model, {"role": "assistant", "content": ""})
+            for i, word in enumerate(content.split(" ")):
+                if i:
+                    await asyncio.sleep(token_delay)
+                yield chunk(completion_id, model, {"content": word if i == 0 else " " + word})
+            yield chunk(completion_id, model, {}, "stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield "data: " + json.dumps({"id": completion_id, "object": "chat.completion.chunk",
+                                             "created": int(time.time()), "model": model,
+                                             "choices": [], "usage": usage}) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--token-delay", type=float, default=0.03)
+    parser.add_argument("--email-latency", type=float, default=0.2)
+    parser.add_argument("--email-fail-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    parser.add_argument("--stall-seconds", type=float, default=30.0)
+    parser.add_argument("--latency-dist", default="", help="lognormal:SIGMA ou tail:PART:SECONDES")
+    args = parser.parse_args()
+    app = make_app(args.latency, args.token_delay, args.email_latency, args.email_fail_rate,
+                   args.error_rate, args.stall_rate, args.stall_seconds, args.latency_dist)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -1,50 +1,85 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
 from typing import Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, func, or_, and_, case
+from datetime import datetime
 import uuid
+import asyncio
+import time
+import json
 import os
 import re
-import resend
 
 from dotenv import load_dotenv
-from openai import OpenAI
-
-from database import SessionLocal, engine
-from models import Base, Client, Conversation, Message as MessageModel
+from openai import AsyncOpenAI
+
+from database import engine, SessionLocal, AsyncSessionLocal
+from models import Client, Conversation, Message as MessageModel, AdminEvent
+from translations import translation_cache, normalize_language
+from language import detect_language
+from yesno import classify_yes_no_local, yesno_stats
+from pages import page_store, page_hash, HASH_RE
+from answers import answer_cache
+from prompts import build_messages
+from history import fit_history, messages_to_summarize
+from turns import TurnContext, load_turn, save_turn
+from notifications import enqueue_handoff_email, outbox_worker
+from migrations import migrate
+from retention import archive_loop, restore_conversation
+from export import export_conversations, parse_date, to_csv, to_ndjson
+from search import init_search, search_messages, render_snippet, SEARCH_PAGE_SIZE, SEARCH_PAGE_SIZE_MAX
+from metrics import registry, stage, record_usage, STAGE_SECONDS, STAGE_ERRORS, TURN_SECONDS
+from scheduler import llm_scheduler, Busy
+from resilience import call_openai, openai_breaker, openai_outcomes
+from routing import model_for, hedged_completion, hedged_stream, latency_trackers, routing_stats
+from tenants import tenant_cache, tenant_label, get_tenant, get_tenant_async, bump_tenants_version
+from admin_events import (event_hub, events_after, latest_event_id, oldest_event_id, prune_loop, SentEvents,
+                          ADMIN_EVENTS_BATCH_SIZE, ADMIN_EVENTS_POLL_SECONDS, ADMIN_EVENTS_HEARTBEAT_SECONDS)
 
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-resend.api_key = os.getenv("RESEND_API_KEY")
+# Retries gérés par resilience.py (échéance + disjoncteur), pas par le SDK
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
 SUPERADMIN_PASSWORD = os.getenv("SUPERADMIN_PASSWORD", "superadmin123")
-
-app = FastAPI()
+# En dessous de cette confiance, la classification locale oui/non passe la main à GPT
+YESNO_MIN_CONFIDENCE = float(os.getenv("YESNO_MIN_CONFIDENCE", "0.8"))
+# Langues traduites au démarrage pour que le premier handoff soit déjà en cache
+TRANSLATION_WARMUP_LANGS = [l for l in os.getenv("TRANSLATION_WARMUP_LANGS", "en,es,it,de,pt,nl").split(",") if l.strip()]
+# Si défini, /metrics exige "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    migrate()  # une lecture de schema_version si la base est à jour
+    init_search(engine)
+    await translation_cache.load()
+    warmup = asyncio.create_task(warm_up_translations())
+    outbox = asyncio.create_task(outbox_worker.run())
+    prune = asyncio.create_task(prune_loop())
+    archive = asyncio.create_task(archive_loop())
+    yield
+    warmup.cancel()
+    outbox.cancel()
+    prune.cancel()
+    archive.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],  # lu par le widget après un 429
 )
-Base.metadata.create_all(bind=engine)
-
-
-# ── Migration automatique ─────────────────────────────────────────────────────
-def run_migrations():
-    with engine.connect() as conn:
-        try:
-            conn.execute(text("ALTER TABLE conversations ADD COLUMN state VARCHAR DEFAULT 'normal'"))
-            conn.commit()
-            print("Migration OK: colonne state ajoutee")
-        except Exception:
-            pass  # colonne deja existante
-
-run_migrations()
 
 
 def get_db():
@@ -55,6 +90,11 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 # ── États de conversation ─────────────────────────────────────────────────────
 # normal   → conversation normale
 # proposed → l'IA a proposé un humain, on attend oui/non
@@ -71,6 +111,10 @@ MSG_PROPOSAL  = "Souhaitez-vous etre contacte par notre equipe ?"
 MSG_ASKING    = "Parfait ! Donnez-moi votre prenom et votre numero de telephone, notre equipe vous contactera rapidement."
 MSG_CONFIRMED = "Merci ! Notre equipe va vous contacter tres rapidement. A bientot !"
 MSG_DECLINED  = "Pas de probleme, je reste a votre disposition si besoin !"
+# Réponse de repli quand OpenAI est indisponible (resilience.py) : traduite
+# avec le handoff, donc déjà en cache le jour où GPT ne répond plus
+MSG_UNAVAILABLE = "Notre assistant est momentanement indisponible. Souhaitez-vous etre contacte par notre equipe ?"
+HANDOFF_MESSAGES = [MSG_PROPOSAL, MSG_ASKING, MSG_CONFIRMED, MSG_DECLINED, MSG_UNAVAILABLE]
 
 
 # ── Détection demande humain — multilingue (FR/EN/IT/ES/DE/PT/NL) ───────────
@@ -109,70 +153,137 @@ GPT_PROPOSES_HUMAN = re.compile(
 
 # ── Fonctions GPT pour l'international ───────────────────────────────────────
 
-def get_visitor_messages(conv_id: str, db: Session) -> list:
-    """Retourne les derniers messages du visiteur pour détecter la langue."""
-    msgs = db.query(MessageModel).filter(
-        MessageModel.conversation_id == conv_id,
-        MessageModel.role == "user"
-    ).order_by(MessageModel.created_at).all()
-    return [m.content for m in msgs]
+async def fetch_handoff_translations(context: str = "", lang: Optional[str] = None, tenant: str = "") -> Optional[str]:
+    """
+    Un seul appel GPT traduit les 4 messages du handoff et les met en cache.
+    Sans langue connue, GPT la détecte depuis le contexte visiteur.
+    Retourne le code de langue (ISO 639-1) ou None si la réponse est inutilisable.
+    """
+    if lang:
+        instruction = "Translate each message of the JSON list into the language with ISO 639-1 code '" + lang + "'. "
+        user_content = "Messages: " + json.dumps(HANDOFF_MESSAGES, ensure_ascii=False)
+    else:
+        instruction = (
+            "Detect the language from the conversation context and translate each message of the JSON list into that language. "
+            "The context may contain multiple messages separated by | — use the overall language pattern, "
+            "not just the last message (which may contain a name or phone number). "
+            "If the language is unclear, use English. "
+        )
+        user_content = "Conversation context: " + context[:400] + "\n\nMessages: " + json.dumps(HANDOFF_MESSAGES, ensure_ascii=False)
+    async with llm_scheduler.slot(tenant, "translate"):
+        response = await call_openai(
+            "translate", client.chat.completions.create,
+            model=model_for("translate"),
+            max_tokens=500,
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": instruction + (
+                    'Answer ONLY with JSON: {"language": "<ISO 639-1 code>", "translations": [<messages in the same order>]}'
+                )},
+                {"role": "user", "content": user_content}
+            ]
+        )
+    record_usage("translate", tenant, response.usage)
+    data = json.loads(response.choices[0].message.content)
+    detected = lang or normalize_language(data.get("language"))
+    translated = data.get("translations") or []
+    if not detected or len(translated) != len(HANDOFF_MESSAGES):
+        return None
+    await translation_cache.store(detected, {
+        m: str(t).strip() for m, t in zip(HANDOFF_MESSAGES, translated)
+    })
+    return detected
+
+
+async def warm_up_translations():
+    """Pré-traduit les messages du handoff pour les langues courantes (au démarrage)."""
+    for lang in TRANSLATION_WARMUP_LANGS:
+        lang = normalize_language(lang)
+        if not lang or translation_cache.has_all(lang, HANDOFF_MESSAGES):
+            continue
+        try:
+            await fetch_handoff_translations(lang=lang)
+        except Exception as e:
+            print("TRANSLATION WARMUP ERROR:", lang, e)
+            return  # API indisponible : inutile d'insister pour les autres langues
+
 
-def translate_to_visitor_language(canonical_msg: str, visitor_messages: list) -> str:
+def update_language(ctx: TurnContext):
+    """Détection locale de la langue (< 1 ms), enregistrée avec le tour."""
+    lang = detect_language(ctx.visitor_messages())
+    if lang and lang != ctx.language:
+        ctx.language = lang
+
+
+async def translate_to_visitor_language(canonical_msg: str, visitor_messages: list, ctx: Optional[TurnContext] = None) -> str:
     """
     Traduit un message canonique dans la langue du visiteur.
-    Prend une liste des derniers messages visiteur pour un contexte fiable.
+    Si la langue de la conversation est connue (détection locale, voir
+    update_language) et la traduction en cache, aucun appel réseau. Si la
+    détection locale n'a pas tranché, GPT détecte la langue depuis les
+    derniers messages visiteur, traduit tout le handoff d'un coup, et la
+    langue est mémorisée sur la conversation.
     Fonctionne avec TOUTES les langues (japonais, arabe, russe, etc.)
     Si erreur → retourne le message français (fallback sûr).
     """
+    lang = ctx.language if ctx is not None else None
+    cached = translation_cache.get(lang, canonical_msg)
+    if cached:
+        return cached
     # Concaténer les derniers messages visiteur pour détecter la langue de manière fiable
     context = " | ".join(visitor_messages[-3:]) if visitor_messages else ""
-    if not context:
+    if not context and not lang:
         return canonical_msg
+    tenant = ctx.tenant_label if ctx is not None else ""
     try:
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            max_tokens=120,
-            messages=[
-                {"role": "system", "content": (
-                    "Detect the language from the conversation context and translate the message into that language. "
-                    "The context may contain multiple messages separated by | — use the overall language pattern, "
-                    "not just the last message (which may contain a name or phone number). "
-                    "Return ONLY the translated message, nothing else. "
-                    "If the language is unclear, return the message in English."
-                )},
-                {"role": "user", "content": "Conversation context: " + context[:400] + "\n\nMessage to translate: " + canonical_msg}
-            ]
-        )
-        result = response.choices[0].message.content.strip()
-        return result if result else canonical_msg
+        with stage("translate", tenant, ctx.state if ctx is not None else ""):
+            lang = await fetch_handoff_translations(context, lang, tenant)
     except Exception as e:
         print("TRANSLATE ERROR:", e)
+        STAGE_ERRORS.inc(1, "translate", tenant)
         return canonical_msg
+    if ctx is not None and lang:
+        ctx.language = lang  # enregistrée avec le tour
+    return translation_cache.get(lang, canonical_msg) or canonical_msg
 
 
-def classify_yes_no(visitor_message: str) -> bool:
+async def classify_yes_no(visitor_message: str, tenant: str = "") -> bool:
     """
     Classifie si la réponse du visiteur est affirmative.
+    Les réponses courantes ("oui", "ok", "non merci"…) sont tranchées en
+    local (yesno.py) ; GPT n'est appelé que si la confiance est insuffisante.
     Fonctionne dans TOUTES les langues via GPT.
     Fallback regex si erreur API.
     """
+    answer, confidence = classify_yes_no_local(visitor_message)
+    if answer is not None and confidence >= YESNO_MIN_CONFIDENCE:
+        yesno_stats["fast_path"] += 1
+        return answer
+    yesno_stats["llm"] += 1
     try:
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            max_tokens=5,
-            messages=[
-                {"role": "system", "content": (
-                    "The user was asked if they want to be contacted by a team member. "
-                    "Classify their reply. Answer ONLY with YES or NO. "
-                    "YES = they accept (any language: oui, yes, si, ja, da, hai, etc. or any positive phrasing). "
-                    "NO = they decline or refuse."
-                )},
-                {"role": "user", "content": visitor_message[:300]}
-            ]
-        )
+        async with llm_scheduler.slot(tenant, "classify"):
+            with stage("classify", tenant, STATE_PROPOSED):
+                response = await call_openai(
+                    "classify", client.chat.completions.create,
+                    model=model_for("classify"),
+                    max_tokens=5,
+                    messages=[
+                        {"role": "system", "content": (
+                            "The user was asked if they want to be contacted by a team member. "
+                            "Classify their reply. Answer ONLY with YES or NO. "
+                            "YES = they accept (any language: oui, yes, si, ja, da, hai, etc. or any positive phrasing). "
+                            "NO = they decline or refuse."
+                        )},
+                        {"role": "user", "content": visitor_message[:300]}
+                    ]
+                )
+        record_usage("classify", tenant, response.usage)
         return "YES" in response.choices[0].message.content.upper()
     except Exception as e:
         print("CLASSIFY ERROR:", e)
+        STAGE_ERRORS.inc(1, "classify", tenant)
+        if answer is not None:
+            return answer  # réponse locale, même peu sûre
         # Fallback regex basique multilingue
         t = visitor_message.strip().lower()
         negative = re.compile(r'\b(non|no|nope|nein|nee|nej|niet|nao|jamais|never|not)\b', re.IGNORECASE)
@@ -190,80 +301,16 @@ def contains_contact_info(message: str) -> bool:
     return len(digits) >= 6  # numéro de téléphone minimum
 
 
-# ── Gestion de l'état en base ─────────────────────────────────────────────────
-def get_state(conv_id: str, db: Session) -> str:
-    try:
-        row = db.execute(
-            text("SELECT state FROM conversations WHERE id = :id"),
-            {"id": conv_id}
-        ).fetchone()
-        return row[0] if row and row[0] else STATE_NORMAL
-    except Exception:
-        return STATE_NORMAL
-
-
-def set_state(conv_id: str, state: str, db: Session):
-    try:
-        db.execute(
-            text("UPDATE conversations SET state = :s WHERE id = :id"),
-            {"s": state, "id": conv_id}
-        )
-        db.commit()
-    except Exception as e:
-        print("SET_STATE ERROR:", e)
-
-
-def save_message(conv_id: str, role: str, content: str, db: Session):
-    db.add(MessageModel(
-        id=str(uuid.uuid4()),
-        conversation_id=conv_id,
-        role=role,
-        content=content
-    ))
-    db.commit()
-
-
 def bot_reply(text_content: str, conv_id: str, needs_human: bool = False):
     return {"reply": text_content, "conversation_id": conv_id, "needs_human": needs_human}
 
 
-# ── Email ─────────────────────────────────────────────────────────────────────
-def send_human_email(conv_id: str, contact_info: str, client_obj: Client):
-    print("EMAIL START")
-    if not client_obj.client_email:
-        print("EMAIL SKIP: pas d email configure")
-        return
-    try:
-        params = {
-            "from": "Replai <noreply@gianluca-ai.fr>",
-            "to": [client_obj.client_email],
-            "subject": "Nouveau client a rappeler - " + client_obj.business_name,
-            "html": (
-                "<div style='font-family:Arial,sans-serif;max-width:600px'>"
-                "<h2 style='color:#6366f1'>Nouveau client a rappeler</h2>"
-                "<p><strong>Business :</strong> " + client_obj.business_name + "</p>"
-                "<p><strong>Conversation :</strong> " + conv_id[:8] + "</p>"
-                "<p><strong>Coordonnees :</strong> "
-                "<span style='color:#4f8eff;font-weight:bold;font-size:16px'>"
-                + contact_info +
-                "</span></p>"
-                "<p>Recontactez ce client rapidement !</p>"
-                "<hr style='border:none;border-top:1px solid #eee'>"
-                "<p style='color:#888;font-size:12px'>Replai — AI Widget pour TPEs</p>"
-                "</div>"
-            )
-        }
-        email = resend.Emails.send(params)
-        print("EMAIL SENT:", email['id'])
-    except Exception as e:
-        print("EMAIL ERROR:", str(e))
-
-
 # ── Pydantic models ───────────────────────────────────────────────────────────
 class ChatRequest(BaseModel):
     message: str
     conversation_id: Optional[str] = None
     page_content: Optional[str] = None
+    page_hash: Optional[str] = None  # SHA-256 de page_content, qui peut alors être omis
     client_token: Optional[str] = None
 
 class ContactHumanRequest(BaseModel):
@@ -274,6 +321,7 @@ class CreateClientRequest(BaseModel):
     business_name: str
     admin_password: str
     client_email: Optional[str] = None
+    retention_days: Optional[int] = None  # None = RETENTION_DAYS, 0 = jamais archiver
     superadmin_password: str
 
 class UpdateClientRequest(BaseModel):
@@ -283,6 +331,7 @@ class UpdateClientRequest(BaseModel):
     business_name: Optional[str] = None
     admin_password: Optional[str] = None
     client_email: Optional[str] = None
+    retention_days: Optional[int] = None
 
 
 # ── Super-admin ───────────────────────────────────────────────────────────────
@@ -295,10 +344,13 @@ def create_client(req: CreateClientRequest, db: Session = Depends(get_db)):
         token=token,
         business_name=req.business_name,
         admin_password=req.admin_password,
-        client_email=req.client_email
+        client_email=req.client_email,
+        retention_days=req.retention_days
     )
     db.add(new_client)
+    bump_tenants_version(db)
     db.commit()
+    tenant_cache.invalidate(token)  # un token inconnu a pu être mis en cache
     return {
         "token": token,
         "business_name": req.business_name,
@@ -322,10 +374,70 @@ def update_client(req: UpdateClientRequest, db: Session = Depends(get_db)):
         c.admin_password = req.admin_password
     if req.client_email is not None:
         c.client_email = req.client_email
+    if req.retention_days is not None:
+        c.retention_days = req.retention_days
+    bump_tenants_version(db)
     db.commit()
+    tenant_cache.invalidate(c.token)
+    answer_cache.invalidate(c.token)
     return {"ok": True, "token": c.token}
 
 
+@app.get("/superadmin/stats")
+def superadmin_stats(superadmin_password: str):
+    if superadmin_password != SUPERADMIN_PASSWORD:
+        raise HTTPException(status_code=401)
+    return {"yes_no": yesno_stats, "tenant_cache": tenant_cache.stats(), "pages": page_store.stats(),
+            "outbox": outbox_worker.stats(), "answers": answer_cache.stats(), "llm": llm_scheduler.stats(),
+            "openai": openai_breaker.stats(), "routing": routing_stats()}
+
+
+# Compteurs existants, lus seulement au scrape de /metrics
+registry.callback("replai_yesno_total", "Classifications oui/non par chemin", ("path",),
+                  lambda: {(path,): n for path, n in yesno_stats.items()}, "counter")
+registry.callback("replai_cache_entries", "Entrées en mémoire par cache", ("cache",), lambda: {
+    ("tenants",): tenant_cache.stats()["size"], ("pages",): page_store.stats()["size"],
+    ("translations",): len(translation_cache),
+})
+registry.callback("replai_cache_lookups_total", "Lectures des caches par résultat", ("cache", "result"), lambda: {
+    ("tenants", "hit"): tenant_cache.hits, ("tenants", "miss"): tenant_cache.misses,
+    ("pages", "hit"): page_store.hits, ("pages", "miss"): page_store.misses,
+}, "counter")
+registry.callback("replai_answer_cache_lookups_total", "Premières questions servies depuis le cache",
+                  ("tenant", "result"), lambda: {
+    key: n for token, (hits, misses) in list(answer_cache.lookups.items())
+    for key, n in (((token, "hit"), hits), ((token, "miss"), misses))
+}, "counter")
+registry.callback("replai_outbox_deliveries_total", "Envois de l'outbox par résultat", ("result",), lambda: {
+    ("sent",): outbox_worker.sent, ("retried",): outbox_worker.retried, ("failed",): outbox_worker.failed,
+}, "counter")
+registry.callback("replai_summary_tasks", "Résumés de conversation en cours de calcul", (),
+                  lambda: {(): len(summary_tasks)})
+registry.callback("replai_admin_event_streams", "Flux /admin/events ouverts dans ce worker", (),
+                  lambda: {(): event_hub.streams()})
+registry.callback("replai_llm_slots", "Appels OpenAI en cours / en file dans ce worker", ("status",), lambda: {
+    ("active",): llm_scheduler.active, ("queued",): llm_scheduler.waiting,
+})
+registry.callback("replai_openai_calls_total", "Appels OpenAI par résultat (resilience.py)", ("call", "result"),
+                  lambda: dict(openai_outcomes), "counter")
+registry.callback("replai_openai_breaker_state", "État du disjoncteur OpenAI (1 = état courant)", ("state",),
+                  lambda: {(s,): int(openai_breaker.state == s) for s in ("closed", "open", "half_open")})
+registry.callback("replai_hedged_calls_total", "Réponses principales doublées (routing.py)", ("kind", "result"),
+                  lambda: {key: n for kind, t in latency_trackers.items()
+                           for key, n in (((kind, "hedged"), t.hedges), ((kind, "hedge_won"), t.hedge_wins))},
+                  "counter")
+registry.callback("replai_llm_rejected_total", "Appels OpenAI refusés par le scheduler (429)", ("tenant", "call"),
+                  lambda: dict(llm_scheduler.rejected), "counter")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(request: Request):
+    """Format texte Prometheus. Protégé par METRICS_TOKEN s'il est défini."""
+    if METRICS_TOKEN and request.headers.get("authorization") != "Bearer " + METRICS_TOKEN:
+        raise HTTPException(status_code=401)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/superadmin/clients")
 def list_clients(superadmin_password: str, db: Session = Depends(get_db)):
     if superadmin_password != SUPERADMIN_PASSWORD:
@@ -380,10 +492,14 @@ ADMIN_HTML = """<!DOCTYPE html>
     .ci:hover { background: #0f1117; border-color: #2d3148; }
     .ci.active { background: #1e2035; border-color: #6366f1; }
     .ci.urgent { border-left: 3px solid #f87171; }
+    .ci.flash { animation: flash 2.5s ease-out; }
+    @keyframes flash { from { background: #7f1d1d; } to { background: transparent; } }
     .ci-top { display: flex; align-items: center; justify-content: space-between; margin-bottom: 4px; }
     .ci-id { font-size: 13px; font-weight: 500; color: #e2e8f0; font-family: monospace; }
     .badge { background: #7f1d1d; color: #fca5a5; font-size: 10px; font-weight: 600; padding: 2px 8px; border-radius: 20px; }
     .ci-meta { font-size: 11px; color: #475569; }
+    .ci-snip { font-size: 12px; color: #94a3b8; margin-top: 4px; line-height: 1.4; }
+    .ci-snip mark { background: #3730a3; color: #e0e7ff; border-radius: 3px; padding: 0 2px; }
     .contact-info { background: rgba(79,142,255,0.1); border: 1px solid rgba(79,142,255,0.3); border-radius: 8px; padding: 6px 10px; margin-top: 6px; font-size: 12px; color: #4f8eff; }
     .sb-bot { padding: 12px 16px; border-top: 1px solid #2d3148; }
     .btn-logout { width: 100%; padding: 8px; background: transparent; border: 1px solid #2d3148; border-radius: 8px; color: #64748b; font-size: 12px; font-family: 'Inter', sans-serif; cursor: pointer; }
@@ -464,6 +580,14 @@ var token = localStorage.getItem("wt") || "";
 var clientToken = new URLSearchParams(window.location.search).get("token") || "";
 var activeId = null;
 var allConvs = [];
+var nextCursor = null;
+var loadingPage = false;
+var totals = {total: 0, urgent: 0};
+var lastEventId = null;
+var seenEvents = {}, seenOrder = [];  // ids d'événements déjà appliqués
+var eventsCtrl = null;
+var searchTimer = null;
+var search = {q: "", nextOffset: null, loading: false};
 if (!clientToken) {
   document.body.innerHTML = "<div style='display:flex;align-items:center;justify-content:center;height:100vh;color:#f87171;font-family:Inter,sans-serif'>Token manquant dans l URL</div>";
 }
@@ -476,7 +600,15 @@ document.getElementById("loginBtn").onclick = doLogin;
 document.getElementById("pwd").onkeydown = function(e) { if (e.key==="Enter") doLogin(); };
 document.getElementById("refreshBtn").onclick = loadConvs;
 document.getElementById("logoutBtn").onclick = doLogout;
-document.getElementById("searchInput").oninput = function() { renderConvList(filterConvs(this.value)); };
+document.getElementById("searchInput").oninput = function() {
+  clearTimeout(searchTimer);
+  var q=this.value.trim();
+  if (!q) { search.q=""; renderConvList(allConvs); return; }
+  searchTimer=setTimeout(function(){runSearch(q);},250);
+};
+document.getElementById("convList").onscroll = function() {
+  if (this.scrollTop + this.clientHeight >= this.scrollHeight - 80) { if (search.q) loadMoreHits(); else loadMoreConvs(); }
+};
 function doVerify() {
   fetch("/admin/login",{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({password:token,client_token:clientToken})})
   .then(function(r){if(r.ok)r.json().then(function(d){showDash(d.business_name);}); else{token="";localStorage.removeItem("wt");}});
@@ -499,36 +631,182 @@ function showDash(name) {
 }
 function doLogout() {
   localStorage.removeItem("wt"); token="";
+  if(eventsCtrl){eventsCtrl.abort();eventsCtrl=null;}
   document.getElementById("dashboard").style.display="none";
   document.getElementById("login").style.display="flex";
   document.getElementById("pwd").value="";
 }
+function fetchConvPage(cursor) {
+  var url="/admin/conversations?client_token="+encodeURIComponent(clientToken)+(cursor?"&cursor="+encodeURIComponent(cursor):"");
+  loadingPage=true;
+  return fetch(url,{headers:{"X-Admin-Password":token}})
+  .then(function(r){return r.json();}).then(function(data){
+    loadingPage=false;
+    nextCursor=data.next_cursor;
+    if(data.total!==undefined) totals={total:data.total,urgent:data.urgent};
+    if(data.last_event_id!==undefined) lastEventId=data.last_event_id;
+    return data.items;
+  },function(){loadingPage=false;return [];});
+}
 function loadConvs() {
-  fetch("/admin/conversations?client_token="+clientToken,{headers:{"X-Admin-Password":token}})
-  .then(function(r){return r.json();}).then(function(data){allConvs=data;renderConvList(data);});
+  allConvs=[];nextCursor=null;
+  fetchConvPage(null).then(function(items){
+    allConvs=items;
+    if(search.q) renderTotals(); else {renderConvList(allConvs);fillConvList();}
+    openEvents();
+  });
+}
+function loadMoreConvs() {
+  if(!nextCursor||loadingPage) return;
+  fetchConvPage(nextCursor).then(function(items){
+    allConvs=allConvs.concat(items);
+    if(search.q) return;
+    renderConvList(allConvs);
+    fillConvList();
+  });
+}
+function fillConvList() {
+  // Charge la page suivante tant que la liste ne remplit pas la colonne
+  var list=document.getElementById("convList");
+  if(nextCursor&&list.scrollHeight<=list.clientHeight) loadMoreConvs();
 }
 function filterConvs(q) {
   if(!q) return allConvs;
   q=q.toLowerCase();
   return allConvs.filter(function(c){return c.id.toLowerCase().includes(q);});
 }
+// Recherche serveur (/admin/search) dans le contenu des messages ;
+// les conversations chargées dont l'id correspond restent en tête.
+function fetchHits(q,offset) {
+  search.loading=true;
+  var url="/admin/search?client_token="+encodeURIComponent(clientToken)+"&q="+encodeURIComponent(q)+"&offset="+offset;
+  return fetch(url,{headers:{"X-Admin-Password":token}})
+  .then(function(r){return r.json();}).then(function(data){
+    search.loading=false;
+    if(q!==search.q) return null;
+    search.nextOffset=data.next_offset;
+    return data.items;
+  },function(){search.loading=false;return null;});
+}
+function runSearch(q) {
+  search.q=q; search.nextOffset=null;
+  fetchHits(q,0).then(function(items){
+    if(items===null) return;
+    var list=document.getElementById("convList");
+    list.innerHTML="";
+    list.scrollTop=0;
+    var byId=filterConvs(q);
+    if(!byId.length&&!items.length){list.innerHTML="<p style='color:#475569;font-size:13px;text-align:center;padding:20px'>Aucun resultat</p>";return;}
+    byId.forEach(function(conv){list.appendChild(convItem(conv));});
+    items.forEach(function(hit){list.appendChild(hitItem(hit));});
+  });
+}
+function loadMoreHits() {
+  if(search.nextOffset===null||search.loading) return;
+  fetchHits(search.q,search.nextOffset).then(function(items){
+    if(items===null) return;
+    var list=document.getElementById("convList");
+    items.forEach(function(hit){list.appendChild(hitItem(hit));});
+  });
+}
+function hitItem(hit) {
+  var div=document.createElement("div");
+  div.className="ci"+(hit.conversation_id===activeId?" active":"");
+  var who=hit.role==="user"?"Visiteur":"Assistant IA";
+  div.innerHTML="<div class='ci-top'><span class='ci-id'>#"+hit.conversation_id.slice(0,8)+"</span></div>"
+    +"<div class='ci-meta'>"+hit.created_at+" &middot; "+who+"</div><div class='ci-snip'>"+hit.snippet+"</div>";
+  div.onclick=function(){loadConv(hit.conversation_id,div);};
+  return div;
+}
+function renderTotals() {
+  document.getElementById("totalN").innerText=totals.total;
+  document.getElementById("urgentN").innerText=totals.urgent;
+}
 function renderConvList(data) {
   var list=document.getElementById("convList");
   list.innerHTML="";
-  var urgent=allConvs.filter(function(c){return c.needs_human;}).length;
-  document.getElementById("totalN").innerText=allConvs.length;
-  document.getElementById("urgentN").innerText=urgent;
+  renderTotals();
   if(!data.length){list.innerHTML="<p style='color:#475569;font-size:13px;text-align:center;padding:20px'>Aucune conversation</p>";return;}
-  data.forEach(function(conv){
-    var div=document.createElement("div");
-    var cls="ci"+(conv.needs_human?" urgent":"")+(conv.id===activeId?" active":"");
-    div.className=cls;
-    var contact=conv.contact_info?"<div class='contact-info'>&#128222; "+conv.contact_info+"</div>":"";
-    div.innerHTML="<div class='ci-top'><span class='ci-id'>#"+conv.id.slice(0,8)+"</span>"+(conv.needs_human?"<span class='badge'>RAPPELER</span>":"")+"</div>"
-      +"<div class='ci-meta'>"+conv.created_at+" &middot; "+conv.message_count+" msg</div>"+contact;
-    div.onclick=function(){loadConv(conv.id,div);};
-    list.appendChild(div);
+  data.forEach(function(conv){list.appendChild(convItem(conv));});
+}
+function convItem(conv) {
+  var div=document.createElement("div");
+  var cls="ci"+(conv.needs_human?" urgent":"")+(conv.id===activeId?" active":"");
+  div.className=cls;
+  div.dataset.id=conv.id;
+  var contact=conv.contact_info?"<div class='contact-info'>&#128222; "+conv.contact_info+"</div>":"";
+  div.innerHTML="<div class='ci-top'><span class='ci-id'>#"+conv.id.slice(0,8)+"</span>"+(conv.needs_human?"<span class='badge'>RAPPELER</span>":"")+"</div>"
+    +"<div class='ci-meta'>"+conv.created_at+" &middot; "+conv.message_count+" msg</div>"+contact;
+  div.onclick=function(){loadConv(conv.id,div);};
+  return div;
+}
+// Flux /admin/events : deltas appliqués sur place, sans recharger la liste.
+// fetch plutôt qu'EventSource, qui ne peut pas envoyer X-Admin-Password.
+function openEvents() {
+  if(eventsCtrl) eventsCtrl.abort();
+  var ctrl=eventsCtrl=new AbortController();
+  var headers={"X-Admin-Password":token};
+  if(lastEventId!==null) headers["Last-Event-ID"]=String(lastEventId);
+  fetch("/admin/events?client_token="+encodeURIComponent(clientToken),{headers:headers,signal:ctrl.signal})
+  .then(function(r){
+    if(!r.ok) throw new Error("HTTP "+r.status);
+    var reader=r.body.getReader(), decoder=new TextDecoder(), buf="";
+    function pump() {
+      return reader.read().then(function(res){
+        if(res.done) throw new Error("flux ferme");
+        buf+=decoder.decode(res.value,{stream:true});
+        var blocks=buf.split("\\n\\n");
+        buf=blocks.pop();
+        blocks.forEach(handleEvent);
+        return pump();
+      });
+    }
+    return pump();
+  }).catch(function(){
+    // Reconnexion après le dernier événement reçu
+    if(ctrl.signal.aborted||!token) return;
+    setTimeout(function(){if(eventsCtrl===ctrl) openEvents();},3000);
+  });
+}
+function handleEvent(block) {
+  var id=null, kind="message", data="";
+  block.split("\\n").forEach(function(line){
+    if(line.indexOf("id: ")===0) id=line.slice(4);
+    else if(line.indexOf("event: ")===0) kind=line.slice(7);
+    else if(line.indexOf("data: ")===0) data+=line.slice(6);
   });
+  if(id!==null){
+    // Le serveur renvoie les événements récents à chaque reconnexion (commits tardifs)
+    id=parseInt(id,10);
+    if(seenEvents[id]) return;
+    seenEvents[id]=true; seenOrder.push(id);
+    if(seenOrder.length>1000) delete seenEvents[seenOrder.shift()];
+    if(lastEventId===null||id>lastEventId) lastEventId=id;
+  }
+  if(kind==="reset"){lastEventId=null;loadConvs();return;}
+  if(data) applyDelta(kind,JSON.parse(data));
+}
+function applyDelta(kind,d) {
+  var conv=d.conversation, old=null, index=-1;
+  allConvs.forEach(function(c,i){if(c.id===conv.id){old=c;index=i;}});
+  // Un événement peut déjà être compris dans la liste chargée : compteurs relatifs à l'état connu
+  var wasUrgent=old?old.needs_human:d.previous_state==="done";
+  if(!old&&d.created) totals.total++;
+  if(conv.needs_human&&!wasUrgent) totals.urgent++;
+  if(!conv.needs_human&&wasUrgent) totals.urgent--;
+  renderTotals();
+  if(conv.id===activeId) appendMessages(d.messages);
+  if(old) allConvs[index]=conv;
+  else if(d.created) allConvs.unshift(conv);
+  else return;  // conversation plus ancienne que les pages chargées
+  if(search.q) return;  // résultats de recherche affichés : liste inchangée
+  var list=document.getElementById("convList");
+  var div=convItem(conv);
+  var current=list.querySelector(".ci[data-id='"+conv.id+"']");
+  if(current) list.replaceChild(div,current);
+  else if(list.querySelector(".ci")) list.insertBefore(div,list.firstChild);
+  else {list.innerHTML="";list.appendChild(div);}
+  if(kind==="handoff") div.classList.add("flash");
 }
 function loadConv(id,el) {
   activeId=id;
@@ -540,16 +818,21 @@ function loadConv(id,el) {
   .then(function(r){return r.json();}).then(function(data){
     var area=document.getElementById("msgsArea");
     area.innerHTML="<div class='msgs-wrap' id='msgsWrap'></div>";
-    var wrap=document.getElementById("msgsWrap");
-    data.forEach(function(msg){
-      var div=document.createElement("div");
-      div.className="msg "+msg.role;
-      var who=msg.role==="user"?"Visiteur":"Assistant IA";
-      div.innerHTML="<div class='msg-who'>"+who+"</div><div class='msg-text'>"+msg.content.split("\\n").join("<br>")+"</div>";
-      wrap.appendChild(div);
-    });
-    area.scrollTop=area.scrollHeight;
+    appendMessages(data);
+  });
+}
+function appendMessages(msgs) {
+  var area=document.getElementById("msgsArea");
+  var wrap=document.getElementById("msgsWrap");
+  if(!wrap) return;
+  msgs.forEach(function(msg){
+    var div=document.createElement("div");
+    div.className="msg "+msg.role;
+    var who=msg.role==="user"?"Visiteur":"Assistant IA";
+    div.innerHTML="<div class='msg-who'>"+who+"</div><div class='msg-text'>"+msg.content.split("\\n").join("<br>")+"</div>";
+    wrap.appendChild(div);
   });
+  area.scrollTop=area.scrollHeight;
 }
 </script>
 </body>
@@ -563,48 +846,88 @@ def admin_page():
 
 @app.post("/admin/login")
 def admin_login(data: dict, db: Session = Depends(get_db)):
-    c = db.query(Client).filter(Client.token == data.get("client_token","")).first()
+    c = get_tenant(data.get("client_token",""), db)
     if not c or c.admin_password != data.get("password",""):
         raise HTTPException(status_code=401)
     return {"ok": True, "business_name": c.business_name}
 
 
+ADMIN_PAGE_SIZE = 50
+ADMIN_PAGE_SIZE_MAX = 200
+
+
+def encode_cursor(conv_created_at, conv_id: str) -> str:
+    return conv_created_at.isoformat() + "|" + conv_id
+
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, conv_id = cursor.split("|", 1)
+        return datetime.fromisoformat(created_at), conv_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+
+
 @app.get("/admin/conversations")
-def admin_conversations(client_token: str, request: Request, db: Session = Depends(get_db)):
+def admin_conversations(client_token: str, request: Request, cursor: Optional[str] = None,
+                        limit: int = ADMIN_PAGE_SIZE, db: Session = Depends(get_db)):
+    """
+    Liste paginée (keyset sur created_at, id), lue uniquement dans la table
+    conversations grâce aux colonnes de résumé.
+    "cursor" = next_cursor de la page précédente.
+    """
     password = request.headers.get("X-Admin-Password","")
-    c = db.query(Client).filter(Client.token == client_token).first()
+    c = get_tenant(client_token, db)
     if not c or c.admin_password != password:
         raise HTTPException(status_code=401)
-    convs = db.query(Conversation).filter(
-        Conversation.client_token == client_token
-    ).order_by(Conversation.created_at.desc()).all()
-    result = []
-    for conv in convs:
-        msgs = db.query(MessageModel).filter(MessageModel.conversation_id == conv.id).order_by(MessageModel.created_at).all()
-        state = get_state(conv.id, db)
-        needs_human = state == STATE_DONE
-        # Le contact = le message user qui contient 6+ chiffres apres une demande de coordonnees
-        contact_info = None
-        for m in msgs:
-            if m.role == "user":
-                digits = re.sub(r'\D', '', m.content)
-                if len(digits) >= 6:
-                    contact_info = m.content
-        result.append({
-            "id": conv.id,
-            "created_at": str(conv.created_at)[:16] if conv.created_at else "--",
-            "message_count": len(msgs),
-            "needs_human": needs_human,
-            "contact_info": contact_info if needs_human else None,
-            "state": state
-        })
+    limit = max(1, min(limit, ADMIN_PAGE_SIZE_MAX))
+    # Lu avant la liste : le flux /admin/events reprend à partir d'ici sans trou
+    last_event_id = None if cursor else (db.execute(select(func.max(AdminEvent.id))).scalar() or 0)
+
+    query = select(
+        Conversation.id, Conversation.created_at, Conversation.state,
+        Conversation.message_count, Conversation.contact_info, Conversation.archived_at
+    ).where(Conversation.client_token == client_token)
+    if cursor:
+        after_created_at, after_id = decode_cursor(cursor)
+        query = query.where(or_(
+            Conversation.created_at < after_created_at,
+            and_(Conversation.created_at == after_created_at, Conversation.id < after_id)
+        ))
+    rows = db.execute(
+        query.order_by(Conversation.created_at.desc(), Conversation.id.desc()).limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    result = {
+        "items": [{
+            "id": r.id,
+            "created_at": str(r.created_at)[:16] if r.created_at else "--",
+            "message_count": r.message_count or 0,
+            "needs_human": r.state == STATE_DONE,
+            "contact_info": r.contact_info if r.state == STATE_DONE else None,
+            "state": r.state or STATE_NORMAL,
+            "archived": r.archived_at is not None
+        } for r in rows],
+        "next_cursor": encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+    }
+    if not cursor:
+        # Compteurs du tableau de bord, seulement avec la première page
+        total, urgent = db.execute(
+            select(func.count(), func.coalesce(func.sum(case((Conversation.state == STATE_DONE, 1), else_=0)), 0))
+            .where(Conversation.client_token == client_token)
+        ).one()
+        result["total"] = total
+        result["urgent"] = urgent
+        result["last_event_id"] = last_event_id
     return result
 
 
 @app.get("/admin/conversations/{conv_id}")
 def admin_conversation_detail(conv_id: str, client_token: str, request: Request, db: Session = Depends(get_db)):
     password = request.headers.get("X-Admin-Password","")
-    c = db.query(Client).filter(Client.token == client_token).first()
+    c = get_tenant(client_token, db)
     if not c or c.admin_password != password:
         raise HTTPException(status_code=401)
     conv = db.query(Conversation).filter(
@@ -612,122 +935,515 @@ def admin_conversation_detail(conv_id: str, client_token: str, request: Request,
     ).first()
     if not conv:
         raise HTTPException(status_code=404)
+    if conv.archived_at is not None:
+        # Restaurée à l'ouverture (retention.py)
+        restore_conversation(db, conv_id)
+        db.commit()
     msgs = db.query(MessageModel).filter(
         MessageModel.conversation_id == conv_id
     ).order_by(MessageModel.created_at).all()
     return [{"role": m.role, "content": m.content} for m in msgs]
 
 
+@app.get("/admin/export")
+def admin_export(client_token: str, request: Request, format: str = "ndjson", since: Optional[str] = None,
+                 until: Optional[str] = None, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    Toutes les conversations du client et leurs messages, en flux (export.py).
+    format : ndjson ou csv. since / until : dates ISO sur la création de la
+    conversation (until exclu). cursor : reprise après la dernière
+    conversation reçue (champ "cursor" de chaque ligne).
+    """
+    password = request.headers.get("X-Admin-Password","")
+    c = get_tenant(client_token, db)
+    if not c or c.admin_password != password:
+        raise HTTPException(status_code=401)
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Format invalide (ndjson ou csv)")
+    try:
+        since_at = parse_date(since) if since else None
+        until_at = parse_date(until) if until else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Date invalide")
+    after = decode_cursor(cursor) if cursor else None
+    # La session de la requête rend sa connexion : le flux ouvre les siennes, tranche par tranche
+    db.commit()
+    items = export_conversations(client_token, since_at, until_at, after)
+    if format == "csv":
+        body, media_type = to_csv(items), "text/csv; charset=utf-8"
+    else:
+        body, media_type = to_ndjson(items), "application/x-ndjson"
+    filename = "conversations-" + client_token + "." + format
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": 'attachment; filename="' + filename + '"'})
+
+
+@app.get("/admin/search")
+def admin_search(client_token: str, q: str, request: Request, limit: int = SEARCH_PAGE_SIZE,
+                 offset: int = 0, db: Session = Depends(get_db)):
+    """
+    Recherche plein texte dans les messages du client (search.py), par
+    pertinence. "offset" = next_offset de la page précédente.
+    """
+    password = request.headers.get("X-Admin-Password","")
+    c = get_tenant(client_token, db)
+    if not c or c.admin_password != password:
+        raise HTTPException(status_code=401)
+    q = q.strip()
+    limit = max(1, min(limit, SEARCH_PAGE_SIZE_MAX))
+    offset = max(0, offset)
+    if not q:
+        return {"items": [], "next_offset": None}
+    with stage("search", client_token):
+        rows = search_messages(db, client_token, q, limit + 1, offset)
+    return {
+        "items": [{
+            "message_id": r[0],
+            "conversation_id": r[1],
+            "role": r[2],
+            "created_at": str(r[3])[:16] if r[3] else "--",
+            "snippet": render_snippet(r[4] or "")
+        } for r in rows[:limit]],
+        "next_offset": offset + limit if len(rows) > limit else None
+    }
+
+
+@app.get("/admin/events")
+async def admin_events(client_token: str, request: Request, last_event_id: Optional[int] = None,
+                       db: AsyncSession = Depends(get_async_db)):
+    """
+    Flux SSE des changements de conversations du client (admin_events.py).
+    Reprise après l'en-tête Last-Event-ID ou le paramètre last_event_id
+    (valeur renvoyée par la première page de /admin/conversations) ; sans
+    l'un ni l'autre, seuls les événements à venir sont envoyés.
+    event: reset → des événements ont été purgés depuis, recharger la liste.
+    """
+    password = request.headers.get("X-Admin-Password","")
+    c = await get_tenant_async(client_token, db)
+    if not c or c.admin_password != password:
+        raise HTTPException(status_code=401)
+    header = request.headers.get("last-event-id", "")
+    if header.isdigit():
+        last_event_id = int(header)
+    reset = False
+    if last_event_id is None:
+        last_event_id = await latest_event_id(db)
+    else:
+        oldest = await oldest_event_id(db)
+        reset = oldest is not None and last_event_id < oldest - 1
+    await db.commit()
+
+    async def event_stream():
+        after = last_event_id
+        sent = SentEvents()
+        wakeup = event_hub.listen(client_token)
+        try:
+            if reset:
+                yield "event: reset\ndata: {}\n\n"
+            last_sent = time.monotonic()
+            while not await request.is_disconnected():
+                wakeup.clear()
+                sent.prune()
+                # Session courte à chaque lecture : aucune connexion tenue entre deux événements
+                async with AsyncSessionLocal() as read_db:
+                    tenant = await get_tenant_async(client_token, read_db)
+                    rows = await events_after(read_db, client_token, after, sent.ids)
+                if not tenant or tenant.admin_password != password:
+                    return  # mot de passe changé entre-temps
+                for r in rows:
+                    after = max(after, r.id)  # un événement commité en retard a un id plus petit
+                    sent.add(r.id, r.created_at)
+                    yield "id: " + str(r.id) + "\nevent: " + r.kind + "\ndata: " + r.payload + "\n\n"
+                if len(rows) == ADMIN_EVENTS_BATCH_SIZE:
+                    continue
+                if rows:
+                    last_sent = time.monotonic()
+                elif time.monotonic() - last_sent >= ADMIN_EVENTS_HEARTBEAT_SECONDS:
+                    # Garde la connexion ouverte à travers les proxies
+                    yield ": ping\n\n"
+                    last_sent = time.monotonic()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), ADMIN_EVENTS_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            event_hub.unlisten(client_token, wakeup)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @app.post("/contact-human")
-def contact_human(req: ContactHumanRequest, db: Session = Depends(get_db)):
+async def contact_human(req: ContactHumanRequest, db: AsyncSession = Depends(get_async_db)):
     """Bouton 'Parler à un humain' → passe directement à l'état ASKING"""
     conv_id = req.conversation_id or str(uuid.uuid4())
-    client_token = req.client_token or ""
-    conv = db.query(Conversation).filter(Conversation.id == conv_id).first()
-    if not conv:
-        conv = Conversation(id=conv_id, title="Conversation client", client_token=client_token)
-        db.add(conv)
-        db.commit()
+    started = time.perf_counter()
+    ctx = await load_turn(conv_id, req.client_token or "", db)
+    reply = await contact_human_turn(ctx, db)
+    TURN_SECONDS.observe(time.perf_counter() - started, "contact-human", ctx.tenant_label, "")
+    return bot_reply(reply, conv_id, False)
+
 
+async def contact_human_turn(ctx: TurnContext, db: AsyncSession) -> str:
     # Traduit dans la langue du dernier message visiteur (si existe)
-    visitor_msgs = get_visitor_messages(conv_id, db)
-    reply = translate_to_visitor_language(MSG_ASKING, visitor_msgs) if visitor_msgs else MSG_ASKING
+    visitor_msgs = ctx.visitor_messages()
+    update_language(ctx)
+    reply = await translate_to_visitor_language(MSG_ASKING, visitor_msgs, ctx) if visitor_msgs else MSG_ASKING
 
-    set_state(conv_id, STATE_ASKING, db)
-    save_message(conv_id, "assistant", reply, db)
-    return bot_reply(reply, conv_id, False)
+    ctx.state = STATE_ASKING
+    await save_turn(ctx, db, reply)
+    return reply
 
 
-@app.post("/chat")
-def chat(msg: ChatRequest, db: Session = Depends(get_db)):
-    conv_id = msg.conversation_id or str(uuid.uuid4())
+async def resolve_page_content(msg: ChatRequest, db: AsyncSession) -> Optional[str]:
+    """
+    Texte (normalisé) de la page où se trouve le visiteur.
+    Le widget n'envoie que le hash d'une page déjà transmise ; si le serveur
+    ne la connaît pas (ou plus), réponse 409 avant tout traitement et le
+    widget renvoie le message avec le texte complet.
+    """
     client_token = msg.client_token or ""
-    c = db.query(Client).filter(Client.token == client_token).first()
+    if not msg.page_content and not (msg.page_hash and HASH_RE.match(msg.page_hash)):
+        return None
+    label = tenant_label(client_token, await get_tenant_async(client_token, db))
+    if msg.page_content:
+        with stage("page", label):
+            return await page_store.put(client_token, msg.page_content, db)
+    with stage("page", label):
+        content = await page_store.get(client_token, msg.page_hash, db)
+    if content is None:
+        raise HTTPException(status_code=409, detail="page_content_required")
+    return content
 
-    conv = db.query(Conversation).filter(Conversation.id == conv_id).first()
-    if not conv:
-        conv = Conversation(id=conv_id, title="Conversation client", client_token=client_token)
-        db.add(conv)
-        db.commit()
 
-    save_message(conv_id, "user", msg.message, db)
-    state = get_state(conv_id, db)
-    visitor_msgs = get_visitor_messages(conv_id, db)  # pour détecter la langue
+async def start_turn(msg: ChatRequest, db: AsyncSession):
+    """
+    Début d'un tour (commun à /chat et /chat/stream) : charge le contexte du
+    tour (turns.py) et applique la machine à états.
+    Retourne (contexte, réponse) — réponse est le bot_reply final quand l'état
+    de la conversation l'impose (tour déjà sauvegardé), None s'il faut appeler
+    GPT puis finish_gpt_turn.
+    """
+    conv_id = msg.conversation_id or str(uuid.uuid4())
+    ctx = await load_turn(conv_id, msg.client_token or "", db)
+    ctx.add_user_message(msg.message)
+    update_language(ctx)
+    visitor_msgs = ctx.visitor_messages()
+    c = ctx.tenant
+    contact_info = msg.message if contains_contact_info(msg.message) else None
 
     # ── ÉTAT ASKING : on attend les coordonnées ────────────────────────────────
-    if state == STATE_ASKING:
-        if contains_contact_info(msg.message):
+    if ctx.state == STATE_ASKING:
+        if contact_info:
             # Coordonnées valides (contient un numéro de téléphone)
-            if c:
-                send_human_email(conv_id, msg.message, c)
-            set_state(conv_id, STATE_DONE, db)
-            reply = translate_to_visitor_language(MSG_CONFIRMED, visitor_msgs)
-            save_message(conv_id, "assistant", reply, db)
-            return bot_reply(reply, conv_id, True)
+            ctx.state = STATE_DONE
+            reply = await translate_to_visitor_language(MSG_CONFIRMED, visitor_msgs, ctx)
+            # Email mis en file dans la même transaction que le tour (notifications.py)
+            queued = c is not None and enqueue_handoff_email(db, conv_id, msg.message, c)
+            await save_turn(ctx, db, reply, contact_info)
+            if queued:
+                outbox_worker.wake()
+            return ctx, bot_reply(reply, conv_id, True)
         else:
             # Pas de numéro → re-demander dans la langue du visiteur
-            reply = translate_to_visitor_language(MSG_ASKING, visitor_msgs)
-            save_message(conv_id, "assistant", reply, db)
-            return bot_reply(reply, conv_id, False)
+            reply = await translate_to_visitor_language(MSG_ASKING, visitor_msgs, ctx)
+            await save_turn(ctx, db, reply)
+            return ctx, bot_reply(reply, conv_id, False)
 
     # ── ÉTAT PROPOSED : visiteur répond oui/non ────────────────────────────────
-    if state == STATE_PROPOSED:
-        if classify_yes_no(msg.message):
-            set_state(conv_id, STATE_ASKING, db)
-            reply = translate_to_visitor_language(MSG_ASKING, visitor_msgs)
-            save_message(conv_id, "assistant", reply, db)
-            return bot_reply(reply, conv_id, False)
+    if ctx.state == STATE_PROPOSED:
+        if await classify_yes_no(msg.message, ctx.tenant_label):
+            ctx.state = STATE_ASKING
+            reply = await translate_to_visitor_language(MSG_ASKING, visitor_msgs, ctx)
         else:
-            set_state(conv_id, STATE_NORMAL, db)
-            reply = translate_to_visitor_language(MSG_DECLINED, visitor_msgs)
-            save_message(conv_id, "assistant", reply, db)
-            return bot_reply(reply, conv_id, False)
+            ctx.state = STATE_NORMAL
+            reply = await translate_to_visitor_language(MSG_DECLINED, visitor_msgs, ctx)
+        await save_turn(ctx, db, reply, contact_info)
+        return ctx, bot_reply(reply, conv_id, False)
 
     # ── ÉTAT NORMAL ────────────────────────────────────────────────────────────
     # Détection explicite : le visiteur demande un humain
     if HUMAN_REGEX.search(msg.message):
-        set_state(conv_id, STATE_PROPOSED, db)
-        reply = translate_to_visitor_language(MSG_PROPOSAL, visitor_msgs)
-        save_message(conv_id, "assistant", reply, db)
-        return bot_reply(reply, conv_id, False)
+        ctx.state = STATE_PROPOSED
+        reply = await translate_to_visitor_language(MSG_PROPOSAL, visitor_msgs, ctx)
+        await save_turn(ctx, db, reply, contact_info)
+        return ctx, bot_reply(reply, conv_id, False)
 
-    # Appel GPT normal
-    history = db.query(MessageModel).filter(
-        MessageModel.conversation_id == conv_id
-    ).order_by(MessageModel.created_at).all()
+    return ctx, None
 
-    if c and c.system_prompt:
-        base_prompt = c.system_prompt
-    else:
-        base_prompt = "Tu es un assistant virtuel professionnel."
 
-    if msg.page_content:
-        base_prompt += "\n\nCONTENU SUPPLEMENTAIRE DU SITE :\n" + msg.page_content
-
-    base_prompt += (
-        "\n\nREGLES :\n"
-        "- Reponds TOUJOURS dans la meme langue que le dernier message du visiteur\n"
-        "- Reponds uniquement aux questions liees a l activite du business\n"
-        "- Sois concis, professionnel et serviable\n"
-        "- Si tu ne connais pas la reponse, dis-le simplement"
-    )
+# Résumés en cours de calcul (une tâche à la fois par conversation)
+summary_tasks = {}
 
-    messages_for_openai = [{"role": "system", "content": base_prompt}]
-    for m in history:
-        messages_for_openai.append({"role": m.role, "content": m.content})
 
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=messages_for_openai
+async def refresh_summary(conv_id: str, tenant: str, previous_summary: Optional[str], messages: list):
+    """Replie des messages dans le résumé glissant de la conversation (en tâche de fond)."""
+    transcript = "\n".join(
+        ("Visiteur : " if m.role == "user" else "Assistant : ") + m.content for m in messages
     )
-    reply = response.choices[0].message.content
+    try:
+        async with llm_scheduler.slot(tenant, "summary"):
+            with stage("summary", tenant):
+                response = await call_openai(
+                    "summary", client.chat.completions.create,
+                    model=model_for("summary"),
+                    max_tokens=300,
+                    messages=[
+                        {"role": "system", "content": (
+                            "You maintain the running summary of a customer conversation on a business website. "
+                            "Update the summary with the new messages. Keep every fact needed to continue the "
+                            "conversation: what the visitor wants, details they gave (name, phone, address, dates), "
+                            "answers and prices already given. At most 150 words, in the visitor's language. "
+                            "Return ONLY the updated summary."
+                        )},
+                        {"role": "user", "content": "Current summary: " + (previous_summary or "(none)")
+                            + "\n\nNew messages:\n" + transcript}
+                    ]
+                )
+        record_usage("summary", tenant, response.usage)
+        summary = response.choices[0].message.content.strip()
+        if not summary:
+            return
+        upto = messages[-1].created_at
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Conversation).where(
+                    Conversation.id == conv_id,
+                    or_(Conversation.summary_upto.is_(None), Conversation.summary_upto < upto)
+                ).values(summary=summary, summary_upto=upto)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+    except Exception as e:
+        print("SUMMARY ERROR:", e)
+        STAGE_ERRORS.inc(1, "summary", tenant)
+    finally:
+        summary_tasks.pop(conv_id, None)
+
+
+def build_gpt_messages(ctx: TurnContext, page_content: Optional[str]) -> tuple:
+    """
+    Prompt du client + page + résumé des anciens messages + derniers messages
+    dans la limite du budget de tokens (history.py), dans l'ordre de prompts.py.
+    Retourne (messages, prompt_cache_key).
+    """
+    window, overflow = fit_history(ctx.history)
 
+    to_summarize = messages_to_summarize(ctx.history, overflow)
+    if to_summarize and ctx.conv_id not in summary_tasks:
+        summary_tasks[ctx.conv_id] = asyncio.create_task(
+            refresh_summary(ctx.conv_id, ctx.tenant_label, ctx.summary, to_summarize)
+        )
+
+    c = ctx.tenant
+    return build_messages(c.system_prompt if c else None, page_content, ctx.summary, window)
+
+
+def first_turn_cache_key(ctx: TurnContext, page_content: Optional[str]):
+    """Clé du cache de réponses (answers.py) : premier message d'une conversation seulement."""
+    if len(ctx.history) != 1 or ctx.summary or ctx.start_state != STATE_NORMAL:
+        return None
+    question = ctx.user_message.content
+    if contains_contact_info(question):
+        return None
+    c = ctx.tenant
+    return answer_cache.key(ctx.tenant_label, c.system_prompt if c else None,
+                            page_hash(page_content) if page_content else "", question)
+
+
+async def fallback_turn(ctx: TurnContext, db: AsyncSession):
+    """GPT indisponible (resilience.py) : proposer la mise en relation au lieu d'une erreur."""
+    openai_outcomes[("main", "fallback")] += 1
+    ctx.state = STATE_PROPOSED
+    reply = translation_cache.get(ctx.language, MSG_UNAVAILABLE) or MSG_UNAVAILABLE
+    return await finish_gpt_turn(ctx, reply, db)
+
+
+def busy_error(e: Busy) -> HTTPException:
+    """429 : trop d'appels OpenAI en attente (scheduler.py). Le tour n'est pas sauvegardé."""
+    return HTTPException(status_code=429, detail="busy", headers={"Retry-After": str(e.retry_after)})
+
+
+async def finish_gpt_turn(ctx: TurnContext, reply: Optional[str], db: AsyncSession):
+    """Sauvegarde du tour après l'appel GPT (reply None : flux interrompu, seul le message visiteur est gardé)."""
     # Si GPT propose spontanément un humain → passer à l'état PROPOSED
-    if GPT_PROPOSES_HUMAN.search(reply):
-        set_state(conv_id, STATE_PROPOSED, db)
+    if reply and GPT_PROPOSES_HUMAN.search(reply):
+        ctx.state = STATE_PROPOSED
 
-    save_message(conv_id, "assistant", reply, db)
-    return bot_reply(reply, conv_id, False)
+    contact_info = ctx.user_message.content if contains_contact_info(ctx.user_message.content) else None
+    await save_turn(ctx, db, reply, contact_info)
+    return bot_reply(reply, ctx.conv_id, False)
+
+
+@app.post("/chat")
+async def chat(msg: ChatRequest, db: AsyncSession = Depends(get_async_db)):
+    started = time.perf_counter()
+    page_content = await resolve_page_content(msg, db)
+    ctx, handled = await start_turn(msg, db)
+    if handled:
+        TURN_SECONDS.observe(time.perf_counter() - started, "chat", ctx.tenant_label, ctx.start_state)
+        return handled
+
+    # Question déjà posée au premier tour : pas d'appel GPT
+    cache_key = first_turn_cache_key(ctx, page_content)
+    cached = answer_cache.get(cache_key) if cache_key else None
+    if cached is not None:
+        result = await finish_gpt_turn(ctx, cached, db)
+        TURN_SECONDS.observe(time.perf_counter() - started, "chat", ctx.tenant_label, ctx.start_state)
+        return result
+
+    # Appel GPT normal
+    messages_for_openai, prompt_cache_key = build_gpt_messages(ctx, page_content)
+    try:
+        async with llm_scheduler.slot(ctx.tenant_label, "main"):
+            with stage("gpt_main", ctx.tenant_label, ctx.start_state):
+                response = await hedged_completion(
+                    ctx.tenant_label, client.chat.completions.create,
+                    messages=messages_for_openai,
+                    prompt_cache_key=prompt_cache_key
+                )
+    except Busy as e:
+        raise busy_error(e)
+    except Exception as e:
+        print("GPT ERROR:", e)
+        STAGE_ERRORS.inc(1, "gpt_main", ctx.tenant_label)
+        result = await fallback_turn(ctx, db)
+        TURN_SECONDS.observe(time.perf_counter() - started, "chat", ctx.tenant_label, ctx.start_state)
+        return result
+    record_usage("main", ctx.tenant_label, response.usage)
+    reply = response.choices[0].message.content
+    if cache_key and reply:
+        answer_cache.put(cache_key, reply)
+    result = await finish_gpt_turn(ctx, reply, db)
+    TURN_SECONDS.observe(time.perf_counter() - started, "chat", ctx.tenant_label, ctx.start_state)
+    return result
+
+
+# ── Streaming SSE ─────────────────────────────────────────────────────────────
+# event: token → {"token": "..."}      morceau de la réponse
+# event: done  → bot_reply(...)         réponse complète, une fois sauvegardée
+# event: error → {"error": "..."}       échec de l'appel GPT en cours de route
+# Pas de cache ni de buffering proxy (nginx / Render) sur les flux SSE
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse_event(event: str, data: dict) -> str:
+    return "event: " + event + "\ndata: " + json.dumps(data, ensure_ascii=False) + "\n\n"
+
+
+class TurnStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse dont on_close() s'exécute toujours à la fin de la
+    réponse, y compris quand le visiteur se déconnecte avant ou pendant le
+    flux (le générateur est alors annulé ou jamais démarré).
+    """
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await asyncio.shield(self.on_close())
+
+
+async def write_stream_turn(ctx: TurnContext, reply: Optional[str], fallback: bool) -> dict:
+    # La session de la requête est déjà fermée quand le flux se termine :
+    # la sauvegarde finale utilise sa propre session.
+    async with AsyncSessionLocal() as write_db:
+        if fallback:
+            return await fallback_turn(ctx, write_db)
+        return await finish_gpt_turn(ctx, reply, write_db)
+
+
+@app.post("/chat/stream")
+async def chat_stream(msg: ChatRequest, db: AsyncSession = Depends(get_async_db)):
+    """Même tour que /chat, mais les tokens GPT sont envoyés au fil de l'eau (SSE)."""
+    started = time.perf_counter()
+    page_content = await resolve_page_content(msg, db)
+    ctx, handled = await start_turn(msg, db)
+
+    cache_key = first_turn_cache_key(ctx, page_content) if not handled else None
+    cached = answer_cache.get(cache_key) if cache_key else None
+    if cached is not None:
+        handled = await finish_gpt_turn(ctx, cached, db)
+
+    if handled:
+        TURN_SECONDS.observe(time.perf_counter() - started, "chat/stream", ctx.tenant_label, ctx.start_state)
+
+        async def single_event():
+            yield sse_event("token", {"token": handled["reply"]})
+            yield sse_event("done", handled)
+        return StreamingResponse(single_event(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    messages_for_openai, prompt_cache_key = build_gpt_messages(ctx, page_content)
+    # Admission avant d'ouvrir le flux : un refus reste un vrai 429
+    try:
+        slot = await llm_scheduler.acquire(ctx.tenant_label, "main")
+    except Busy as e:
+        raise busy_error(e)
+
+    save_task = None
+
+    def save_once(reply: Optional[str], fallback: bool) -> asyncio.Task:
+        """Sauvegarde du tour, une seule fois, dans une tâche qu'une déconnexion n'annule pas."""
+        nonlocal save_task
+        if save_task is None:
+            save_task = asyncio.ensure_future(write_stream_turn(ctx, reply, fallback))
+        return save_task
+
+    async def close_turn():
+        """Fin de la réponse : créneau rendu ; flux interrompu → seul le message visiteur est gardé."""
+        slot.release()
+        await save_once(None, False)
+
+    async def token_events():
+        parts = []
+        fallback = False
+        gpt_started = time.perf_counter()
+        try:
+            async for chunk in hedged_stream(
+                ctx.tenant_label, client.chat.completions.create,
+                messages=messages_for_openai,
+                prompt_cache_key=prompt_cache_key,
+                stream=True,
+                stream_options={"include_usage": True}
+            ):
+                record_usage("main", ctx.tenant_label, chunk.usage)  # dernier morceau seulement
+                if not chunk.choices:
+                    continue
+                token = chunk.choices[0].delta.content
+                if token:
+                    if not parts:
+                        STAGE_SECONDS.observe(time.perf_counter() - gpt_started, "gpt_first_token",
+                                              ctx.tenant_label, ctx.start_state)
+                    parts.append(token)
+                    yield sse_event("token", {"token": token})
+            STAGE_SECONDS.observe(time.perf_counter() - gpt_started, "gpt_main", ctx.tenant_label, ctx.start_state)
+        except Exception as e:
+            slot.release()
+            print("STREAM ERROR:", e)
+            STAGE_ERRORS.inc(1, "gpt_main", ctx.tenant_label)
+            reply = None
+            # Rien d'envoyé au visiteur : réponse de repli plutôt qu'une erreur
+            fallback = not parts
+            if not fallback:
+                yield sse_event("error", {"error": "generation interrompue"})
+        else:
+            reply = "".join(parts)
+            if cache_key and reply:
+                answer_cache.put(cache_key, reply)
+        finally:
+            slot.release()
+        result = await asyncio.shield(save_once(reply, fallback))
+        TURN_SECONDS.observe(time.perf_counter() - started, "chat/stream", ctx.tenant_label, ctx.start_state)
+        if fallback:
+            yield sse_event("token", {"token": result["reply"]})
+        if reply is not None or fallback:
+            yield sse_event("done", result)
+
+    return TurnStreamingResponse(token_events(), close_turn, media_type="text/event-stream", headers=SSE_HEADERS)
 
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
\ No newline at end of file
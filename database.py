@@ -1,5 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 import os
 
@@ -9,10 +10,103 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./chatbot.db")
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-if DATABASE_URL.startswith("sqlite"):
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+
+# ── Réglages (variables d'environnement) ──────────────────────────────────────
+# SQLite : WAL = les lectures ne bloquent plus l'écriture en cours ;
+# synchronous=NORMAL = un fsync par checkpoint plutôt que par commit (sûr en
+# WAL) ; busy_timeout = attendre le verrou d'écriture au lieu de lever
+# "database is locked".
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Postgres : pool par worker uvicorn (à multiplier par le nombre de workers
+# pour rester sous max_connections de l'offre hébergée)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") not in ("0", "false", "no")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+
+
+def sqlite_pragmas() -> list:
+    """Réglage vide ou à 0 → valeur par défaut de SQLite / du driver."""
+    pragmas = []
+    if SQLITE_JOURNAL_MODE:
+        pragmas.append("PRAGMA journal_mode=" + SQLITE_JOURNAL_MODE)
+    if SQLITE_SYNCHRONOUS:
+        pragmas.append("PRAGMA synchronous=" + SQLITE_SYNCHRONOUS)
+    if SQLITE_BUSY_TIMEOUT_MS:
+        pragmas.append("PRAGMA busy_timeout=%d" % SQLITE_BUSY_TIMEOUT_MS)
+    if SQLITE_MMAP_SIZE:
+        pragmas.append("PRAGMA mmap_size=%d" % SQLITE_MMAP_SIZE)
+    return pragmas
+
+
+def tune_sqlite(engine):
+    """Applique les PRAGMA à chaque nouvelle connexion du pool (sync ou async)."""
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def pool_options() -> dict:
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+if IS_SQLITE:
     engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    tune_sqlite(engine)
 else:
-    engine = create_engine(DATABASE_URL)
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"options": "-c statement_timeout=%d" % DB_STATEMENT_TIMEOUT_MS},
+        **pool_options()
+    )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+
+# ── Moteur async (chemin /chat) ───────────────────────────────────────────────
+def async_database_url(url: str) -> str:
+    """Même base que DATABASE_URL, avec le driver async correspondant."""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql://"):
+        url = url.replace("postgresql://", "postgresql+asyncpg://", 1)
+        # asyncpg ne comprend pas "sslmode", il attend "ssl"
+        return url.replace("sslmode=", "ssl=")
+    return url
+
+
+if IS_SQLITE:
+    async_engine = create_async_engine(async_database_url(DATABASE_URL))
+    tune_sqlite(async_engine.sync_engine)
+else:
+    async_engine = create_async_engine(
+        async_database_url(DATABASE_URL),
+        connect_args={"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}},
+        **pool_options()
+    )
+
+# expire_on_commit=False : les objets restent lisibles après commit sans
+# relancer de requête (impossible en lazy-load dans une session async)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
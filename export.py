@@ -0,0 +1,136 @@
+"""
+Export en flux des conversations d'un client (GET /admin/export).
+
+Les conversations sont lues par tranches de EXPORT_CHUNK_SIZE, en keyset
+sur (created_at, id) du plus ancien au plus récent. Chaque tranche et ses
+messages sont lus dans une session courte, fermée avant d'envoyer quoi que
+ce soit : un client lent ne tient ni connexion ni transaction du pool. Le
+worker ne garde en mémoire qu'une tranche, quel que soit le volume exporté.
+
+Chaque conversation exportée porte un "cursor" : relancer l'export avec
+ce cursor reprend juste après elle (export interrompu). Les conversations
+archivées (retention.py) sont exportées depuis l'archive, sans les
+restaurer.
+
+Formats :
+  ndjson  une ligne JSON par conversation, messages inclus
+  csv     une ligne par message (une ligne sans message pour une
+          conversation vide), colonnes de la conversation répétées
+"""
+import csv
+import io
+import json
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import select, or_, and_
+
+from database import SessionLocal
+from models import Conversation, ConversationArchive, Message
+from retention import decode_messages
+
+EXPORT_CHUNK_SIZE = 50
+
+CSV_COLUMNS = [
+    "conversation_id", "conversation_created_at", "state", "language", "contact_info",
+    "message_role", "message_created_at", "message_content", "cursor",
+]
+
+
+def resume_cursor(conv) -> str:
+    """Même format que le cursor de /admin/conversations."""
+    return conv.created_at.isoformat() + "|" + conv.id
+
+
+def parse_date(value: str) -> datetime:
+    """Date ISO (2024-01-31 ou avec heure) en UTC naïf, comme les colonnes. ValueError sinon."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def read_chunk(client_token: str, since: Optional[datetime], until: Optional[datetime],
+               after: Optional[tuple]) -> tuple:
+    """(conversations, messages par conversation) d'une tranche ; la session est fermée au retour."""
+    with SessionLocal() as db:
+        query = select(
+            Conversation.id, Conversation.created_at, Conversation.state, Conversation.language,
+            Conversation.contact_info, Conversation.archived_at
+        ).where(Conversation.client_token == client_token, Conversation.created_at.is_not(None))
+        if since:
+            query = query.where(Conversation.created_at >= since)
+        if until:
+            query = query.where(Conversation.created_at < until)
+        if after:
+            query = query.where(or_(
+                Conversation.created_at > after[0],
+                and_(Conversation.created_at == after[0], Conversation.id > after[1])
+            ))
+        convs = db.execute(
+            query.order_by(Conversation.created_at, Conversation.id).limit(EXPORT_CHUNK_SIZE)
+        ).all()
+        messages = defaultdict(list)
+        live = [c.id for c in convs if c.archived_at is None]
+        if live:
+            for r in db.execute(
+                select(Message.conversation_id, Message.role, Message.content, Message.created_at)
+                .where(Message.conversation_id.in_(live))
+                .order_by(Message.conversation_id, Message.created_at)
+            ):
+                messages[r.conversation_id].append({"role": r.role, "content": r.content,
+                                                    "created_at": iso(r.created_at)})
+        archived = [c.id for c in convs if c.archived_at is not None]
+        if archived:
+            for conv_id, data in db.execute(
+                select(ConversationArchive.conversation_id, ConversationArchive.data)
+                .where(ConversationArchive.conversation_id.in_(archived))
+            ):
+                if data:
+                    messages[conv_id] = [{"role": m["role"], "content": m["content"],
+                                          "created_at": iso(m["created_at"])} for m in decode_messages(data)]
+    return convs, messages
+
+
+def export_conversations(client_token: str, since: Optional[datetime], until: Optional[datetime],
+                         after: Optional[tuple]):
+    """Génère (conversation, [messages]) dans l'ordre de l'export."""
+    while True:
+        convs, messages = read_chunk(client_token, since, until, after)
+        for conv in convs:
+            yield conv, messages.get(conv.id, [])
+        if len(convs) < EXPORT_CHUNK_SIZE:
+            return
+        after = (convs[-1].created_at, convs[-1].id)
+
+
+def to_ndjson(items):
+    for conv, messages in items:
+        yield json.dumps({
+            "id": conv.id,
+            "created_at": iso(conv.created_at),
+            "state": conv.state or "normal",
+            "language": conv.language,
+            "contact_info": conv.contact_info,
+            "messages": messages,
+            "cursor": resume_cursor(conv),
+        }, ensure_ascii=False) + "\n"
+
+
+def to_csv(items):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for conv, messages in items:
+        head = [conv.id, iso(conv.created_at), conv.state or "normal", conv.language or "", conv.contact_info or ""]
+        cursor = resume_cursor(conv)
+        for m in messages or [{"role": "", "created_at": "", "content": ""}]:
+            writer.writerow(head + [m["role"], m["created_at"] or "", m["content"] or "", cursor])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
@@ -0,0 +1,69 @@
+"""
+Fenêtre d'historique envoyée à GPT, bornée en tokens.
+
+Seuls les derniers messages sont envoyés tels quels ; les plus anciens sont
+repliés dans un résumé glissant stocké sur la conversation
+(conversations.summary, à jour jusqu'à summary_upto). La taille du prompt
+reste donc bornée quelle que soit la longueur de la conversation.
+
+Le comptage des tokens est une estimation locale (pas de tokenizer à
+télécharger) : ~1 token par mot court, plus pour les mots longs, 1 par
+signe de ponctuation ou idéogramme, + le surcoût fixe de chaque message.
+"""
+import os
+import re
+
+# Budget de l'historique (hors prompt système)
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+# Au-delà, les plus anciens messages partent dans le résumé…
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "16"))
+# …et il en reste alors ce nombre en clair (résumé mis à jour par lots)
+HISTORY_KEEP_MESSAGES = int(os.getenv("HISTORY_KEEP_MESSAGES", "8"))
+# Messages lus en base au maximum si le résumé a pris du retard
+HISTORY_FETCH_LIMIT = 200
+
+MESSAGE_OVERHEAD_TOKENS = 4
+TOKEN_RE = re.compile(r"[^\W\d_]+|\d{1,3}|[^\w\s]", re.UNICODE)
+CJK_RE = re.compile(r"[\u3040-\u30ff\u4e00-\u9fff\uac00-\ud7af]")
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    n = len(CJK_RE.findall(text))
+    for piece in TOKEN_RE.findall(CJK_RE.sub(" ", text)):
+        n += 1 + len(piece) // 6
+    return n
+
+
+def message_tokens(content: str) -> int:
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def fit_history(messages: list, budget: int = HISTORY_TOKEN_BUDGET,
+                max_messages: int = HISTORY_MAX_MESSAGES):
+    """
+    Sépare les messages (ordre chronologique, non encore résumés) en
+    (fenêtre envoyée à GPT, messages qui n'y tiennent plus).
+    Le dernier message est toujours gardé, même s'il dépasse le budget.
+    """
+    window = []
+    used = 0
+    for m in reversed(messages):
+        tokens = message_tokens(m.content)
+        if window and (len(window) >= max_messages or used + tokens > budget):
+            break
+        window.append(m)
+        used += tokens
+    window.reverse()
+    return window, messages[:len(messages) - len(window)]
+
+
+def messages_to_summarize(messages: list, overflow: list) -> list:
+    """
+    Messages à replier dans le résumé : au moins ceux qui débordent, et assez
+    pour redescendre à HISTORY_KEEP_MESSAGES en clair (le résumé n'est donc
+    pas recalculé à chaque tour).
+    """
+    count = max(len(overflow), len(messages) - HISTORY_KEEP_MESSAGES)
+    return messages[:count] if overflow else []
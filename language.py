@@ -0,0 +1,246 @@
+"""
+Détection locale (hors ligne) de la langue du visiteur.
+
+Deux signaux, calculés en une passe sur les derniers messages visiteur :
+- l'écriture (japonais, arabe, cyrillique…) tranche directement ;
+- pour l'alphabet latin, un modèle de trigrammes de caractères entraîné au
+  chargement du module sur les corpus ci-dessous, plus un lexique de mots
+  courts très fréquents (indispensable pour "oui", "yes", "danke"…).
+
+Les noms propres, numéros, e-mails et URLs sont retirés avant l'analyse :
+ce sont eux qui trompent le plus la détection quand le visiteur donne ses
+coordonnées. Si aucune langue ne se détache nettement, detect_language()
+retourne None et l'appelant garde la détection par GPT.
+"""
+import math
+import re
+from typing import Optional
+
+# Marge minimale (en log-vraisemblance) entre la 1re et la 2e langue
+MIN_MARGIN = 3.0
+# Poids d'un mot du lexique face au score des trigrammes
+WORD_WEIGHT = 4.0
+# Au-delà, le contexte n'apporte plus rien et coûte du temps
+MAX_CHARS = 300
+
+
+# ── Corpus d'entraînement (langage de chat avec un commerce) ──────────────────
+CORPUS = {
+    "fr": (
+        "bonjour je voudrais savoir quels sont vos horaires d ouverture cette semaine. "
+        "est-ce que vous etes ouverts le samedi et le dimanche ? combien coute une coupe pour homme. "
+        "je cherche un plombier pour une fuite dans la salle de bain, vous pouvez passer demain ? "
+        "merci beaucoup pour votre reponse, c est tres gentil. quel est le prix de la livraison a domicile. "
+        "nous aimerions reserver une table pour quatre personnes ce soir vers vingt heures. "
+        "pouvez-vous m envoyer un devis pour la renovation de ma cuisine ? je n ai pas recu ma commande. "
+        "ou se trouve votre magasin exactement, il y a un parking a cote ? oui avec plaisir, non merci. "
+        "est-ce qu il faut prendre rendez-vous ou on peut venir directement. d accord, parfait, a bientot. "
+        "vous acceptez la carte bancaire et les cheques ? je suis interesse par votre offre. "
+        "mon chauffage ne marche plus depuis hier soir, c est urgent. votre equipe est vraiment tres reactive. "
+        "quelles sont les conditions de retour et de remboursement ? il me faudrait une facture s il vous plait."
+    ),
+    "en": (
+        "hello i would like to know your opening hours this week. "
+        "are you open on saturday and sunday? how much does a haircut cost for men. "
+        "i am looking for a plumber for a leak in the bathroom, can you come tomorrow? "
+        "thank you very much for your answer, that is very kind. what is the price of home delivery. "
+        "we would like to book a table for four people tonight around eight o clock. "
+        "could you send me a quote for the renovation of my kitchen? i have not received my order. "
+        "where is your shop exactly, is there a parking lot nearby? yes please, no thanks. "
+        "do i need to make an appointment or can we just walk in. okay, perfect, see you soon. "
+        "do you accept credit cards and checks? i am interested in your offer. "
+        "my heating has not been working since last night, it is urgent. your team is really responsive. "
+        "what are the conditions for returns and refunds? i would need an invoice please."
+    ),
+    "es": (
+        "hola me gustaria saber cuales son sus horarios de apertura esta semana. "
+        "estan abiertos el sabado y el domingo? cuanto cuesta un corte de pelo para hombre. "
+        "busco un fontanero para una fuga en el baño, pueden venir mañana? "
+        "muchas gracias por su respuesta, es muy amable. cual es el precio de la entrega a domicilio. "
+        "queremos reservar una mesa para cuatro personas esta noche hacia las ocho. "
+        "me pueden enviar un presupuesto para la reforma de mi cocina? no he recibido mi pedido. "
+        "donde esta su tienda exactamente, hay un aparcamiento cerca? si por favor, no gracias. "
+        "hay que pedir cita o podemos ir directamente. vale, perfecto, hasta pronto. "
+        "aceptan tarjeta de credito y cheques? estoy interesado en su oferta. "
+        "mi calefaccion no funciona desde anoche, es urgente. su equipo es muy rapido. "
+        "cuales son las condiciones de devolucion y reembolso? necesitaria una factura por favor."
+    ),
+    "it": (
+        "buongiorno vorrei sapere quali sono i vostri orari di apertura questa settimana. "
+        "siete aperti il sabato e la domenica? quanto costa un taglio di capelli da uomo. "
+        "cerco un idraulico per una perdita nel bagno, potete venire domani? "
+        "grazie mille per la risposta, molto gentile. qual e il prezzo della consegna a domicilio. "
+        "vorremmo prenotare un tavolo per quattro persone stasera verso le otto. "
+        "potete mandarmi un preventivo per la ristrutturazione della mia cucina? non ho ricevuto il mio ordine. "
+        "dove si trova esattamente il vostro negozio, c e un parcheggio vicino? si grazie, no grazie. "
+        "bisogna prendere un appuntamento o possiamo venire direttamente. va bene, perfetto, a presto. "
+        "accettate la carta di credito e gli assegni? sono interessato alla vostra offerta. "
+        "il mio riscaldamento non funziona da ieri sera, e urgente. il vostro team e davvero veloce. "
+        "quali sono le condizioni di reso e di rimborso? mi servirebbe una fattura per favore."
+    ),
+    "de": (
+        "hallo ich mochte gerne wissen, wie ihre offnungszeiten diese woche sind. "
+        "haben sie am samstag und sonntag geoffnet? was kostet ein haarschnitt fur herren. "
+        "ich suche einen klempner fur ein leck im badezimmer, konnen sie morgen kommen? "
+        "vielen dank fur ihre antwort, das ist sehr nett. was kostet die lieferung nach hause. "
+        "wir mochten heute abend gegen acht uhr einen tisch fur vier personen reservieren. "
+        "konnen sie mir ein angebot fur die renovierung meiner kuche schicken? ich habe meine bestellung nicht erhalten. "
+        "wo genau ist ihr geschaft, gibt es einen parkplatz in der nahe? ja bitte, nein danke. "
+        "muss man einen termin machen oder konnen wir einfach vorbeikommen. alles klar, perfekt, bis bald. "
+        "akzeptieren sie kreditkarten und schecks? ich interessiere mich fur ihr angebot. "
+        "meine heizung funktioniert seit gestern abend nicht mehr, es ist dringend. ihr team ist wirklich schnell. "
+        "was sind die bedingungen fur ruckgabe und erstattung? ich brauche bitte eine rechnung."
+    ),
+    "pt": (
+        "ola gostaria de saber quais sao os vossos horarios de funcionamento esta semana. "
+        "voces estao abertos no sabado e no domingo? quanto custa um corte de cabelo masculino. "
+        "procuro um canalizador para uma fuga na casa de banho, podem vir amanha? "
+        "muito obrigado pela resposta, e muito simpatico. qual e o preco da entrega ao domicilio. "
+        "gostariamos de reservar uma mesa para quatro pessoas hoje a noite por volta das oito. "
+        "podem enviar me um orcamento para a renovacao da minha cozinha? nao recebi a minha encomenda. "
+        "onde fica exatamente a vossa loja, tem estacionamento perto? sim por favor, nao obrigado. "
+        "e preciso marcar uma consulta ou podemos ir diretamente. esta bem, perfeito, ate breve. "
+        "aceitam cartao de credito e cheques? estou interessado na vossa oferta. "
+        "o meu aquecimento nao funciona desde ontem a noite, e urgente. a vossa equipa e muito rapida. "
+        "quais sao as condicoes de devolucao e reembolso? precisava de uma fatura por favor."
+    ),
+    "nl": (
+        "hallo ik wil graag weten wat jullie openingstijden deze week zijn. "
+        "zijn jullie open op zaterdag en zondag? hoeveel kost een knipbeurt voor heren. "
+        "ik zoek een loodgieter voor een lek in de badkamer, kunnen jullie morgen komen? "
+        "hartelijk bedankt voor uw antwoord, dat is erg vriendelijk. wat is de prijs van thuisbezorging. "
+        "we willen graag een tafel reserveren voor vier personen vanavond rond acht uur. "
+        "kunt u mij een offerte sturen voor de renovatie van mijn keuken? ik heb mijn bestelling niet ontvangen. "
+        "waar is uw winkel precies, is er een parkeerplaats in de buurt? ja graag, nee dank je. "
+        "moet ik een afspraak maken of kunnen we gewoon langskomen. oke, perfect, tot snel. "
+        "accepteren jullie creditcards en cheques? ik ben geinteresseerd in uw aanbod. "
+        "mijn verwarming werkt sinds gisteravond niet meer, het is dringend. jullie team is echt snel. "
+        "wat zijn de voorwaarden voor retour en terugbetaling? ik heb graag een factuur alstublieft."
+    ),
+}
+
+# Mots courts très fréquents : décisifs sur les messages d'un ou deux mots
+LEXICON = {
+    "fr": "oui non merci bonjour bonsoir salut je vous nous est les des une pour avec dans sur pas que qui quel quels quelle "
+          "votre vos mon ma mes c'est d'accord svp s'il plait combien horaires prix rappeler volontiers bien sur",
+    "en": "yes no thanks thank hello hi hey the and is are you we for with not what which your my please "
+          "how much hours price call sure okay yeah yep nope would could want talk speak someone",
+    "es": "si sí no gracias hola buenos buenas el los las una para con que por favor cuanto cuánto precio "
+          "horario usted ustedes claro vale quiero llamar",
+    "it": "si sì no grazie ciao buongiorno buonasera il gli una per con che non quanto prezzo orari "
+          "vorrei certo va bene perfetto chiamare",
+    "de": "ja nein danke hallo guten tag der die das und ist ich sie wir für fur mit nicht was wie viel "
+          "preis bitte gerne natürlich naturlich klar möchte mochte anrufen",
+    "pt": "sim não nao obrigado obrigada olá ola bom dia boa o os as uma para com que por favor quanto preço preco "
+          "horário horario você voce claro quero ligar",
+    "nl": "ja nee dank bedankt hallo goedemorgen de het een en is ik u we voor met niet wat hoeveel prijs "
+          "alstublieft graag natuurlijk prima wil bellen",
+}
+
+
+# ── Écritures non latines ─────────────────────────────────────────────────────
+SCRIPTS = [
+    ("ja", re.compile(r"[\u3040-\u30ff]")),                # hiragana / katakana
+    ("ko", re.compile(r"[\uac00-\ud7af\u1100-\u11ff]")),   # hangul
+    ("zh", re.compile(r"[\u4e00-\u9fff]")),                # idéogrammes CJK
+    ("ar", re.compile(r"[\u0600-\u06ff]")),
+    ("he", re.compile(r"[\u0590-\u05ff]")),
+    ("ru", re.compile(r"[\u0400-\u04ff]")),                # cyrillique
+    ("el", re.compile(r"[\u0370-\u03ff]")),
+    ("th", re.compile(r"[\u0e00-\u0e7f]")),
+    ("hi", re.compile(r"[\u0900-\u097f]")),                # devanagari
+]
+
+# Bruit à retirer avant l'analyse : e-mails, URLs, numéros, noms propres
+NOISE_RE = re.compile(r"\S+@\S+|https?://\S+|www\.\S+|[+\d][\d\s().-]{3,}\d|\d+")
+# Mot capitalisé qui ne commence pas une phrase → probablement un nom
+PROPER_NAME_RE = re.compile(r"(?<=[^\s.!?¿¡|])(\s+)[A-ZÀ-ÖØ-Þ][\w'-]*")
+WORD_RE = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+
+
+def _trigrams(text: str):
+    text = " " + text + " "
+    return [text[i:i + 3] for i in range(len(text) - 2)]
+
+
+def _clean(text: str) -> str:
+    text = NOISE_RE.sub(" ", text)
+    text = PROPER_NAME_RE.sub(" ", text)
+    return " ".join(WORD_RE.findall(text.lower()))
+
+
+def _train():
+    """Log-probabilités lissées de chaque trigramme, en vecteur par langue."""
+    langs = list(CORPUS)
+    counts = {}
+    for lang in langs:
+        c = {}
+        for t in _trigrams(" ".join(WORD_RE.findall(CORPUS[lang]))):
+            c[t] = c.get(t, 0) + 1
+        counts[lang] = c
+    vocab = set().union(*counts.values())
+    unseen = []
+    table = {}
+    for lang in langs:
+        total = sum(counts[lang].values()) + len(vocab) + 1
+        unseen.append(math.log(1 / total))
+    for t in vocab:
+        table[t] = tuple(
+            math.log((counts[lang].get(t, 0) + 1) / (sum(counts[lang].values()) + len(vocab) + 1))
+            for lang in langs
+        )
+    lexicon = {}
+    for lang in langs:
+        for w in LEXICON[lang].split():
+            lexicon.setdefault(w, []).append(lang)
+    # Un mot partagé par plusieurs langues compte moins
+    words = {w: {l: 1.0 / len(ls) for l in ls} for w, ls in lexicon.items()}
+    return langs, table, tuple(unseen), words
+
+
+LANGS, TRIGRAM_TABLE, UNSEEN, WORDS = _train()
+
+
+def detect_script(text: str) -> Optional[str]:
+    """Langue déduite de l'écriture si les lettres non latines dominent."""
+    letters = sum(1 for ch in text if ch.isalpha())
+    if not letters:
+        return None
+    counts = {lang: len(pattern.findall(text)) for lang, pattern in SCRIPTS}
+    # Le japonais mêle kana et kanji : des kana suffisent à trancher
+    if counts["ja"]:
+        counts["ja"] += counts.pop("zh")
+    lang = max(counts, key=counts.get)
+    return lang if counts[lang] * 2 >= letters else None
+
+
+def detect_language(messages: list) -> Optional[str]:
+    """
+    Code ISO 639-1 de la langue des messages visiteur, ou None si incertain.
+    Prend les derniers messages (les plus récents à la fin de la liste).
+    """
+    raw = " | ".join(m for m in messages[-3:] if m)[-MAX_CHARS:]
+    script_lang = detect_script(raw)
+    if script_lang:
+        return script_lang
+
+    text = _clean(raw)
+    if not text:
+        return None
+
+    n = len(LANGS)
+    scores = [0.0] * n
+    for t in _trigrams(text):
+        row = TRIGRAM_TABLE.get(t, UNSEEN)
+        for i in range(n):
+            scores[i] += row[i]
+    for w in text.split():
+        hits = WORDS.get(w)
+        if hits:
+            for i, lang in enumerate(LANGS):
+                scores[i] += WORD_WEIGHT * hits.get(lang, 0.0)
+
+    ranked = sorted(range(n), key=scores.__getitem__, reverse=True)
+    if scores[ranked[0]] - scores[ranked[1]] < MIN_MARGIN:
+        return None
+    return LANGS[ranked[0]]
@@ -0,0 +1,178 @@
+"""
+Métriques en mémoire du worker, exposées au format texte Prometheus (/metrics).
+
+Enregistrer une mesure ne coûte qu'une recherche dans un dict et quelques
+additions ; le texte n'est construit qu'au moment d'un scrape. Les
+compteurs existants (yesno_stats, caches, outbox) sont lus à ce moment-là
+via des métriques calculées (registry.callback).
+
+Avec plusieurs workers uvicorn, chacun expose ses propres séries : ajouter
+un label d'instance côté Prometheus.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [
+        n + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for n, v in zip(names, values)
+    ]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> list:
+        lines = ["# HELP " + self.name + " " + self.help, "# TYPE " + self.name + " counter"]
+        for labelvalues, value in sorted(self._values.items()):
+            lines.append(self.name + _format_labels(self.labelnames, labelvalues) + " " + _format_value(value))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels → [compte par bucket (non cumulé)…, compte +Inf, somme, total]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 3)
+            series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *labelvalues):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def render(self) -> list:
+        lines = ["# HELP " + self.name + " " + self.help, "# TYPE " + self.name + " histogram"]
+        for labelvalues, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                le = 'le="' + (bound if bound == "+Inf" else repr(float(bound))) + '"'
+                lines.append(self.name + "_bucket" + _format_labels(self.labelnames, labelvalues, le) + " " + str(cumulative))
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(self.name + "_sum" + labels + " " + repr(float(series[-2])))
+            lines.append(self.name + "_count" + labels + " " + str(series[-1]))
+        return lines
+
+
+class CallbackMetric:
+    """
+    Valeurs lues au moment du scrape : fn() → {valeurs des labels: valeur}.
+    kind="counter" pour les compteurs déjà tenus ailleurs (ex. yesno_stats).
+    """
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple, fn, kind: str = "gauge"):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.fn = fn
+        self.kind = kind
+
+    def render(self) -> list:
+        lines = ["# HELP " + self.name + " " + self.help, "# TYPE " + self.name + " " + self.kind]
+        for labelvalues, value in sorted(self.fn().items()):
+            lines.append(self.name + _format_labels(self.labelnames, labelvalues) + " " + _format_value(value))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def callback(self, name: str, help_text: str, labelnames: tuple, fn, kind: str = "gauge") -> CallbackMetric:
+        metric = CallbackMetric(name, help_text, labelnames, fn, kind)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                print("METRICS ERROR:", metric.name, e)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ── Métriques du pipeline de chat ─────────────────────────────────────────────
+# stage : db_read, db_write, page, gpt_main, gpt_first_token, classify,
+#         translate, summary, email, search, queue (attente d'admission, scheduler.py)
+STAGE_SECONDS = registry.histogram(
+    "replai_stage_seconds", "Durée de chaque étape d'un tour de chat", ("stage", "tenant", "state")
+)
+STAGE_ERRORS = registry.counter(
+    "replai_stage_errors_total", "Étapes terminées en erreur", ("stage", "tenant")
+)
+TURN_SECONDS = registry.histogram(
+    "replai_turn_seconds", "Durée totale d'un tour (/chat, /chat/stream, /contact-human)",
+    ("endpoint", "tenant", "state")
+)
+OPENAI_TOKENS = registry.counter(
+    "replai_openai_tokens_total", "Tokens facturés par OpenAI", ("call", "tenant", "kind")
+)
+
+
+def stage(name: str, tenant: str = "", state: str = ""):
+    """with stage("gpt_main", token, state): … — mesure la durée de l'étape."""
+    return STAGE_SECONDS.time(name, tenant, state)
+
+
+def record_usage(call: str, tenant: str, usage):
+    """Tokens d'une réponse OpenAI (usage peut être None, ex. flux sans include_usage)."""
+    if usage is None:
+        return
+    OPENAI_TOKENS.inc(usage.prompt_tokens or 0, call, tenant, "prompt")
+    OPENAI_TOKENS.inc(usage.completion_tokens or 0, call, tenant, "completion")
+    # Part des tokens d'entrée servie par le cache de prompt d'OpenAI (voir prompts.py)
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is not None and details.cached_tokens is not None:
+        OPENAI_TOKENS.inc(details.cached_tokens, call, tenant, "cached")
@@ -0,0 +1,157 @@
+"""
+Migrations versionnées du schéma.
+
+La table schema_version garde le numéro de la dernière étape appliquée.
+migrate() est appelé une fois au démarrage de l'application (lifespan) :
+si la base est à jour, il ne coûte qu'une lecture. Sinon les étapes
+manquantes sont appliquées dans l'ordre, chacune dans sa transaction avec
+la mise à jour du numéro de version.
+
+Chaque étape est idempotente (colonne ajoutée seulement si absente, index
+en IF NOT EXISTS) : une base créée avant ce système, dont une partie des
+colonnes existe déjà, passe par les mêmes étapes sans erreur. Sur une base
+neuve, l'étape 1 crée directement le schéma complet de models.py et les
+suivantes n'ont rien à faire.
+
+Pour faire évoluer le schéma : modifier models.py ET ajouter une étape à la
+fin de STEPS (ne jamais modifier ni réordonner une étape existante).
+"""
+import re
+
+from sqlalchemy import inspect, text
+
+from database import Base, engine
+import models  # noqa: F401 (enregistre les tables dans Base.metadata)
+import search
+
+# Verrou Postgres pris pendant les migrations : plusieurs workers uvicorn
+# démarrent en même temps, un seul applique les étapes.
+MIGRATION_LOCK_ID = 734215
+
+
+def add_column(conn, table: str, column: str, ddl: str) -> bool:
+    """ALTER TABLE … ADD COLUMN si la colonne n'existe pas. True si ajoutée."""
+    if column in {c["name"] for c in inspect(conn).get_columns(table)}:
+        return False
+    conn.execute(text("ALTER TABLE " + table + " ADD COLUMN " + column + " " + ddl))
+    print("Migration OK:", table + "." + column)
+    return True
+
+
+def create_tables(conn):
+    Base.metadata.create_all(bind=conn)
+
+
+def conversation_state_columns(conn):
+    add_column(conn, "conversations", "state", "VARCHAR DEFAULT 'normal'")
+    add_column(conn, "conversations", "language", "VARCHAR")
+
+
+def conversation_summary_columns(conn):
+    added = add_column(conn, "conversations", "message_count", "INTEGER DEFAULT 0")
+    add_column(conn, "conversations", "last_message_at", "TIMESTAMP")
+    add_column(conn, "conversations", "last_user_message_at", "TIMESTAMP")
+    add_column(conn, "conversations", "contact_info", "TEXT")
+    if added:
+        backfill_conversation_summaries(conn)
+
+
+def backfill_conversation_summaries(conn):
+    """Calcule une fois les colonnes de résumé des conversations existantes."""
+    conn.execute(text(
+        "UPDATE conversations SET "
+        "message_count = (SELECT COUNT(*) FROM messages m WHERE m.conversation_id = conversations.id), "
+        "last_message_at = (SELECT MAX(m.created_at) FROM messages m WHERE m.conversation_id = conversations.id), "
+        "last_user_message_at = (SELECT MAX(m.created_at) FROM messages m "
+        "WHERE m.conversation_id = conversations.id AND m.role = 'user')"
+    ))
+    # Le contact = le dernier message user qui contient 6+ chiffres
+    contacts = {}
+    for conv_id, content in conn.execute(text(
+        "SELECT conversation_id, content FROM messages WHERE role = 'user' ORDER BY created_at"
+    )):
+        if len(re.sub(r'\D', '', content or "")) >= 6:
+            contacts[conv_id] = content
+    for conv_id, content in contacts.items():
+        conn.execute(text("UPDATE conversations SET contact_info = :c WHERE id = :id"), {"c": content, "id": conv_id})
+
+
+def conversation_rolling_summary(conn):
+    add_column(conn, "conversations", "summary", "TEXT")
+    add_column(conn, "conversations", "summary_upto", "TIMESTAMP")
+
+
+def history_and_listing_indexes(conn):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_messages_conversation_created ON messages (conversation_id, created_at)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_conversations_client_created ON conversations (client_token, created_at)"
+    ))
+
+
+def admin_events_table(conn):
+    models.AdminEvent.__table__.create(bind=conn, checkfirst=True)
+
+
+def message_search_index(conn):
+    search.create_index(conn)
+
+
+def conversation_archives(conn):
+    add_column(conn, "clients", "retention_days", "INTEGER")
+    add_column(conn, "conversations", "archived_at", "TIMESTAMP")
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_conversations_client_last_message "
+        "ON conversations (client_token, last_message_at)"
+    ))
+    models.ConversationArchive.__table__.create(bind=conn, checkfirst=True)
+    # Réindexation : chaque ligne FTS prend le rowid de son message (voir search.py)
+    if conn.dialect.name == "sqlite":
+        search.create_index(conn)
+
+
+# (version, étape) — ordre définitif
+STEPS = [
+    (1, create_tables),
+    (2, conversation_state_columns),
+    (3, conversation_summary_columns),
+    (4, conversation_rolling_summary),
+    (5, history_and_listing_indexes),
+    (6, admin_events_table),
+    (7, message_search_index),
+    (8, conversation_archives),
+]
+LATEST_VERSION = STEPS[-1][0]
+
+
+def current_version(conn) -> int:
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    if version is None:
+        conn.execute(text("INSERT INTO schema_version (version) VALUES (0)"))
+        return 0
+    return version
+
+
+def migrate():
+    with engine.begin() as conn:
+        if current_version(conn) >= LATEST_VERSION:
+            return
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            conn.commit()
+        try:
+            for version, step in STEPS:
+                with conn.begin():
+                    # Relu sous verrou : un autre worker a pu avancer entre-temps
+                    if current_version(conn) >= version:
+                        continue
+                    step(conn)
+                    conn.execute(text("UPDATE schema_version SET version = :v"), {"v": version})
+                print("Schema version:", version, step.__name__)
+        finally:
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+                conn.commit()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -12,6 +12,8 @@ class Client(Base):
     admin_password = Column(String, nullable=False)
     client_email = Column(String, nullable=True)
     system_prompt = Column(Text, nullable=True)
+    # Jours d'inactivité avant archivage (retention.py) ; NULL = RETENTION_DAYS, 0 = jamais
+    retention_days = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
  
     conversations = relationship(
@@ -23,11 +25,29 @@ class Client(Base):
  
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        # Liste admin : conversations d'un client, les plus récentes d'abord
+        Index("ix_conversations_client_created", "client_token", "created_at"),
+        # Conversations inactives d'un client (archivage, retention.py)
+        Index("ix_conversations_client_last_message", "client_token", "last_message_at"),
+    )
  
     id = Column(String, primary_key=True, index=True)
     client_token = Column(String, ForeignKey("clients.token"), nullable=True)
     title = Column(String, default="Nouvelle conversation")
+    state = Column(String, default="normal")
+    language = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Résumé dénormalisé, tenu à jour par turns.save_turn()
+    message_count = Column(Integer, default=0)
+    last_message_at = Column(DateTime, nullable=True)
+    last_user_message_at = Column(DateTime, nullable=True)
+    contact_info = Column(Text, nullable=True)
+    # Résumé glissant des messages les plus anciens (voir history.py)
+    summary = Column(Text, nullable=True)
+    summary_upto = Column(DateTime, nullable=True)
+    # Messages déplacés dans conversation_archives (retention.py), NULL sinon
+    archived_at = Column(DateTime, nullable=True)
  
     client = relationship("Client", back_populates="conversations")
     messages = relationship(
@@ -39,6 +59,10 @@ class Conversation(Base):
  
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Historique d'une conversation, trié par date
+        Index("ix_messages_conversation_created", "conversation_id", "created_at"),
+    )
  
     id = Column(String, primary_key=True, index=True)
     conversation_id = Column(String, ForeignKey("conversations.id"))
@@ -47,3 +71,75 @@ class Message(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
  
     conversation = relationship("Conversation", back_populates="messages")
+ 
+ 
+class Translation(Base):
+    __tablename__ = "translations"
+ 
+    lang = Column(String, primary_key=True)
+    canonical = Column(Text, primary_key=True)
+    text = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+ 
+ 
+class CacheVersion(Base):
+    """Numéro de version par cache applicatif, partagé entre workers."""
+    __tablename__ = "cache_versions"
+ 
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+ 
+ 
+class PageSnapshot(Base):
+    """Texte normalisé d'une page du site client, adressé par son SHA-256."""
+    __tablename__ = "page_snapshots"
+ 
+    client_token = Column(String, primary_key=True)
+    hash = Column(String, primary_key=True)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow)
+
+
+class OutboxItem(Base):
+    """Notification à envoyer (email de handoff), traitée par notifications.OutboxWorker."""
+    __tablename__ = "outbox"
+
+    id = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    status = Column(String, nullable=False, default="pending", index=True)  # pending / sent / failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+
+class AdminEvent(Base):
+    """Changement d'une conversation, diffusé au dashboard admin (voir admin_events.py)."""
+    __tablename__ = "admin_events"
+    __table_args__ = (
+        # Flux d'un client : événements après le dernier reçu
+        Index("ix_admin_events_client_id", "client_token", "id"),
+        # Identifiants jamais réutilisés sous SQLite, même après la purge
+        {"sqlite_autoincrement": True},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    client_token = Column(String, nullable=False)
+    conversation_id = Column(String, nullable=False)
+    kind = Column(String, nullable=False)  # conversation / message / handoff
+    payload = Column(Text, nullable=False)  # JSON
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class ConversationArchive(Base):
+    """Messages d'une conversation archivée : NDJSON compressé en gzip (voir retention.py)."""
+    __tablename__ = "conversation_archives"
+
+    conversation_id = Column(String, primary_key=True)
+    client_token = Column(String, nullable=True)
+    message_count = Column(Integer, nullable=False, default=0)
+    data = Column(LargeBinary, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
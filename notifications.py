@@ -0,0 +1,187 @@
+"""
+Outbox des notifications (emails de handoff).
+
+/chat n'envoie rien lui-même : enqueue_handoff_email() ajoute une ligne à
+la table outbox dans la transaction du tour, et OutboxWorker (tâche
+asyncio lancée au démarrage) la traite par lots, avec retries et backoff
+exponentiel. Une notification n'est donc ni perdue si le fournisseur
+échoue, ni payée en latence par le visiteur.
+
+Avec plusieurs workers uvicorn, chaque ligne est réservée par un UPDATE
+conditionnel avant l'envoi : un seul worker l'envoie.
+
+EMAIL_BACKEND=fake remplace Resend par un envoi local (gardé en mémoire,
+voir fake_sent_emails) pour tester hors ligne.
+"""
+import asyncio
+import json
+import os
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Optional
+
+import resend
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import OutboxItem
+from metrics import stage, STAGE_ERRORS
+from tenants import TenantConfig
+
+EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "resend")
+EMAIL_FROM = os.getenv("EMAIL_FROM", "Replai <noreply@gianluca-ai.fr>")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "10"))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "3600"))
+# Durée de réservation d'une ligne pendant son envoi (au-delà, un autre worker la reprend)
+OUTBOX_LEASE_SECONDS = 60
+
+resend.api_key = os.getenv("RESEND_API_KEY")
+# Autre serveur compatible Resend (ex. bench/openai_stub.py pour les tests de charge)
+resend.api_url = os.getenv("RESEND_API_URL", resend.api_url)
+
+KIND_HANDOFF_EMAIL = "handoff_email"
+
+# Derniers emails "envoyés" par EMAIL_BACKEND=fake
+fake_sent_emails = deque(maxlen=100)
+
+
+def handoff_email(conv_id: str, contact_info: str, tenant: TenantConfig) -> dict:
+    return {
+        "from": EMAIL_FROM,
+        "to": [tenant.client_email],
+        "subject": "Nouveau client a rappeler - " + tenant.business_name,
+        "html": (
+            "<div style='font-family:Arial,sans-serif;max-width:600px'>"
+            "<h2 style='color:#6366f1'>Nouveau client a rappeler</h2>"
+            "<p><strong>Business :</strong> " + tenant.business_name + "</p>"
+            "<p><strong>Conversation :</strong> " + conv_id[:8] + "</p>"
+            "<p><strong>Coordonnees :</strong> "
+            "<span style='color:#4f8eff;font-weight:bold;font-size:16px'>"
+            + contact_info +
+            "</span></p>"
+            "<p>Recontactez ce client rapidement !</p>"
+            "<hr style='border:none;border-top:1px solid #eee'>"
+            "<p style='color:#888;font-size:12px'>Replai — AI Widget pour TPEs</p>"
+            "</div>"
+        )
+    }
+
+
+def enqueue_handoff_email(db: AsyncSession, conv_id: str, contact_info: str, tenant: TenantConfig) -> bool:
+    """Ajoute l'email à l'outbox ; enregistré par le commit de l'appelant."""
+    if not tenant.client_email:
+        print("EMAIL SKIP: pas d email configure")
+        return False
+    db.add(OutboxItem(
+        id=str(uuid.uuid4()),
+        kind=KIND_HANDOFF_EMAIL,
+        payload=json.dumps(handoff_email(conv_id, contact_info, tenant), ensure_ascii=False),
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+        created_at=datetime.utcnow(),
+    ))
+    return True
+
+
+def send_email(params: dict) -> str:
+    """Envoi bloquant (appelé dans un thread). Retourne l'id du fournisseur."""
+    if EMAIL_BACKEND == "fake":
+        fake_sent_emails.append(params)
+        return "fake-" + str(len(fake_sent_emails))
+    return resend.Emails.send(params)["id"]
+
+
+def retry_delay(attempts: int) -> float:
+    return min(OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), OUTBOX_RETRY_MAX_SECONDS)
+
+
+class OutboxWorker:
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    def wake(self):
+        """À appeler après le commit d'un enqueue : traitement immédiat."""
+        self._wakeup.set()
+
+    async def run(self):
+        while True:
+            try:
+                while await self.drain_batch() == OUTBOX_BATCH_SIZE:
+                    pass
+            except Exception as e:
+                print("OUTBOX ERROR:", e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def drain_batch(self) -> int:
+        """Traite un lot de notifications dues. Retourne la taille du lot lu."""
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            items = (await db.execute(
+                select(OutboxItem).where(OutboxItem.status == "pending", OutboxItem.next_attempt_at <= now)
+                .order_by(OutboxItem.next_attempt_at).limit(OUTBOX_BATCH_SIZE)
+            )).scalars().all()
+            claimed = []
+            for item in items:
+                lease = now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+                result = await db.execute(
+                    update(OutboxItem).where(
+                        OutboxItem.id == item.id, OutboxItem.status == "pending",
+                        OutboxItem.next_attempt_at == item.next_attempt_at
+                    ).values(next_attempt_at=lease).execution_options(synchronize_session=False)
+                )
+                if result.rowcount:
+                    claimed.append(item)
+            await db.commit()
+
+        for item in claimed:
+            await self.deliver(item)
+        return len(items)
+
+    async def deliver(self, item: OutboxItem):
+        error: Optional[str] = None
+        try:
+            with stage("email"):
+                provider_id = await asyncio.to_thread(send_email, json.loads(item.payload))
+            print("EMAIL SENT:", provider_id)
+        except Exception as e:
+            error = str(e)
+            print("EMAIL ERROR:", error)
+            STAGE_ERRORS.inc(1, "email", "")
+
+        attempts = item.attempts + 1
+        values = {"attempts": attempts}
+        if error is None:
+            values.update(status="sent", sent_at=datetime.utcnow(), last_error=None)
+            self.sent += 1
+        elif attempts >= OUTBOX_MAX_ATTEMPTS:
+            values.update(status="failed", last_error=error)
+            self.failed += 1
+        else:
+            values.update(next_attempt_at=datetime.utcnow() + timedelta(seconds=retry_delay(attempts)),
+                          last_error=error)
+            self.retried += 1
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(OutboxItem).where(OutboxItem.id == item.id).values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    def stats(self) -> dict:
+        return {"backend": EMAIL_BACKEND, "sent": self.sent, "retried": self.retried, "failed": self.failed}
+
+
+outbox_worker = OutboxWorker()
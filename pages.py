@@ -0,0 +1,128 @@
+"""
+Stockage du contenu des pages du site client, adressé par hash.
+
+Le widget envoie le SHA-256 du texte de la page et ne joint le texte
+lui-même que si le serveur ne le connaît pas encore (réponse 409 sinon).
+Le texte est normalisé une fois à l'arrivée (espaces, lignes dupliquées,
+bandeaux cookies / copyright…) puis gardé par client : en mémoire (LRU)
+et dans la table page_snapshots, avec un nombre maximal de pages par
+client au-delà duquel les moins récemment utilisées sont supprimées.
+"""
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import PageSnapshot
+
+PAGE_MAX_CHARS = 6000
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "500"))
+PAGE_SNAPSHOTS_PER_TENANT = int(os.getenv("PAGE_SNAPSHOTS_PER_TENANT", "50"))
+
+# Lignes courtes typiques des bandeaux / pieds de page, inutiles pour GPT
+BOILERPLATE_RE = re.compile(
+    r"(cookie|tous droits|droits reserves|all rights reserved|copyright|©|mentions l[eé]gales|"
+    r"politique de confidentialit|privacy policy|terms of (use|service)|conditions g[eé]n[eé]rales|"
+    r"newsletter|suivez.nous|follow us|retour en haut|back to top|skip to content)",
+    re.IGNORECASE
+)
+HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def page_hash(raw_text: str) -> str:
+    """Même calcul que le widget : SHA-256 hex du texte UTF-8."""
+    return hashlib.sha256(raw_text.encode("utf-8")).hexdigest()
+
+
+def normalize_page(raw_text: str) -> str:
+    seen = set()
+    lines = []
+    for line in raw_text.splitlines():
+        line = " ".join(line.split())
+        key = line.lower()
+        if not line or key in seen:
+            continue
+        if len(line) < 100 and BOILERPLATE_RE.search(line):
+            continue
+        seen.add(key)
+        lines.append(line)
+    return "\n".join(lines)[:PAGE_MAX_CHARS]
+
+
+class PageStore:
+    def __init__(self, max_size: int = PAGE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.uploads = 0
+
+    def _remember(self, key, content: str):
+        self._entries[key] = content
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, client_token: str, digest: str, db: AsyncSession) -> Optional[str]:
+        key = (client_token, digest)
+        content = self._entries.get(key)
+        if content is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return content
+        snapshot = await db.get(PageSnapshot, key)
+        if snapshot is None:
+            self.misses += 1
+            return None
+        snapshot.last_used_at = datetime.utcnow()
+        await db.commit()
+        self.hits += 1
+        self._remember(key, snapshot.content)
+        return snapshot.content
+
+    async def put(self, client_token: str, raw_text: str, db: AsyncSession) -> str:
+        """Enregistre la page (si nouvelle) et retourne son texte normalisé."""
+        digest = page_hash(raw_text)
+        content = await self.get(client_token, digest, db)
+        if content is not None:
+            return content
+        content = normalize_page(raw_text)
+        self.uploads += 1
+        self._remember((client_token, digest), content)
+        now = datetime.utcnow()
+        try:
+            db.add(PageSnapshot(client_token=client_token, hash=digest, content=content,
+                                created_at=now, last_used_at=now))
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()  # même page envoyée en parallèle par un autre visiteur
+            return content
+        await self.evict(client_token, db)
+        return content
+
+    async def evict(self, client_token: str, db: AsyncSession):
+        """Garde les PAGE_SNAPSHOTS_PER_TENANT pages les plus récemment utilisées."""
+        stale = (await db.execute(
+            select(PageSnapshot.hash).where(PageSnapshot.client_token == client_token)
+            .order_by(PageSnapshot.last_used_at.desc()).offset(PAGE_SNAPSHOTS_PER_TENANT)
+        )).scalars().all()
+        if not stale:
+            return
+        await db.execute(delete(PageSnapshot).where(
+            PageSnapshot.client_token == client_token, PageSnapshot.hash.in_(stale)
+        ))
+        await db.commit()
+        for digest in stale:
+            self._entries.pop((client_token, digest), None)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "uploads": self.uploads}
+
+
+page_store = PageStore()
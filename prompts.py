@@ -0,0 +1,57 @@
+"""
+Assemblage du prompt GPT, ordonné pour le cache de prompt d'OpenAI.
+
+OpenAI réutilise le calcul d'un préfixe déjà vu (à partir de 1024 tokens,
+par tranches de 128) : moins de latence au premier token, tokens d'entrée
+facturés moins cher. Le prompt est donc construit du plus stable au moins
+stable :
+
+  1. partie fixe du client : son prompt + REGLES (compilée une fois par prompt)
+  2. contenu de la page visitée (stable tant que le visiteur reste sur la page)
+  3. résumé des anciens messages (change rarement, voir history.py)
+  4. historique récent (ne fait que s'allonger d'un tour à l'autre)
+
+Le prompt d'un tour est ainsi le plus souvent un préfixe du tour suivant.
+prompt_cache_key regroupe chez OpenAI les requêtes qui partagent la partie 1.
+Les tokens servis depuis le cache sont comptés dans /metrics
+(replai_openai_tokens_total{kind="cached"}).
+"""
+import hashlib
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+DEFAULT_SYSTEM_PROMPT = "Tu es un assistant virtuel professionnel."
+
+RULES = (
+    "REGLES :\n"
+    "- Reponds TOUJOURS dans la meme langue que le dernier message du visiteur\n"
+    "- Reponds uniquement aux questions liees a l activite du business\n"
+    "- Sois concis, professionnel et serviable\n"
+    "- Si tu ne connais pas la reponse, dis-le simplement"
+)
+
+
+class StaticPrefix(NamedTuple):
+    content: str
+    cache_key: str
+
+
+@lru_cache(maxsize=1024)
+def static_prefix(system_prompt: Optional[str]) -> StaticPrefix:
+    """Partie fixe d'un client, compilée une fois par texte de prompt."""
+    content = (system_prompt or DEFAULT_SYSTEM_PROMPT) + "\n\n" + RULES
+    return StaticPrefix(content, "replai-" + hashlib.sha256(content.encode("utf-8")).hexdigest()[:24])
+
+
+def build_messages(system_prompt: Optional[str], page_content: Optional[str],
+                   summary: Optional[str], history: list) -> tuple:
+    """Retourne (messages pour chat.completions, prompt_cache_key)."""
+    prefix = static_prefix(system_prompt)
+    messages = [{"role": "system", "content": prefix.content}]
+    if page_content:
+        messages.append({"role": "system", "content": "CONTENU SUPPLEMENTAIRE DU SITE :\n" + page_content})
+    if summary:
+        messages.append({"role": "system", "content": "RESUME DU DEBUT DE LA CONVERSATION :\n" + summary})
+    for m in history:
+        messages.append({"role": m.role, "content": m.content})
+    return messages, prefix.cache_key
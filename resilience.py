@@ -0,0 +1,155 @@
+"""
+Résilience des appels OpenAI : échéance, retries, disjoncteur.
+
+Chaque appel passe par call_openai(type d'appel, create, **paramètres) :
+- échéance par type d'appel (OPENAI_DEADLINES), retries compris : un
+  fournisseur qui ne répond plus ne bloque pas la requête du visiteur ;
+- retries bornés (OPENAI_MAX_RETRIES) sur timeout, erreur réseau, 429 et
+  5xx, après une attente aléatoire (full jitter) entre 0 et
+  OPENAI_RETRY_BASE_SECONDS * 2^n, seulement si l'échéance le permet ;
+- disjoncteur partagé : après OPENAI_BREAKER_FAILURES échecs consécutifs
+  il s'ouvre et les appels échouent tout de suite (CircuitOpen) pendant
+  OPENAI_BREAKER_COOLDOWN_SECONDS ; ensuite un seul appel d'essai passe,
+  qui le referme s'il réussit et le rouvre sinon.
+Les erreurs de requête (400, 401…) ne sont ni retentées ni comptées
+comme une panne. Les retries du SDK sont désactivés (max_retries=0 sur
+le client) : cette couche est la seule à retenter.
+
+En cas d'échec, /chat et /chat/stream répondent par MSG_UNAVAILABLE
+(mise en relation avec l'équipe) au lieu d'une erreur.
+État propre à chaque worker uvicorn.
+"""
+import asyncio
+import os
+import random
+import time
+from collections import defaultdict
+
+from openai import APIConnectionError, InternalServerError, RateLimitError
+
+OPENAI_DEADLINES = {
+    "main": float(os.getenv("OPENAI_DEADLINE_MAIN", "20")),
+    "translate": float(os.getenv("OPENAI_DEADLINE_TRANSLATE", "8")),
+    "classify": float(os.getenv("OPENAI_DEADLINE_CLASSIFY", "4")),
+    "summary": float(os.getenv("OPENAI_DEADLINE_SUMMARY", "30")),
+}
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_RETRY_BASE_SECONDS = float(os.getenv("OPENAI_RETRY_BASE_SECONDS", "0.3"))
+# Silence maximal entre deux morceaux d'une réponse en streaming
+OPENAI_STREAM_IDLE_SECONDS = float(os.getenv("OPENAI_STREAM_IDLE_SECONDS", "10"))
+OPENAI_BREAKER_FAILURES = int(os.getenv("OPENAI_BREAKER_FAILURES", "5"))
+OPENAI_BREAKER_COOLDOWN_SECONDS = float(os.getenv("OPENAI_BREAKER_COOLDOWN_SECONDS", "30"))
+
+# APITimeoutError hérite de APIConnectionError
+RETRYABLE_ERRORS = (TimeoutError, APIConnectionError, RateLimitError, InternalServerError)
+
+# (type d'appel, résultat) → nombre ; résultats : ok, retry, failed, breaker_open, fallback
+openai_outcomes = defaultdict(int)
+
+
+class CircuitOpen(Exception):
+    """Disjoncteur ouvert : appel refusé sans contacter OpenAI."""
+
+    def __init__(self):
+        super().__init__("disjoncteur ouvert")
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = OPENAI_BREAKER_FAILURES, cooldown: float = OPENAI_BREAKER_COOLDOWN_SECONDS):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() >= self.opened_at + self.cooldown else "open"
+
+    def allow(self) -> bool:
+        """Lève CircuitOpen si l'appel ne doit pas partir ; True si c'est l'appel d'essai."""
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        raise CircuitOpen()
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self, probe: bool = False):
+        """probe : l'appel d'essai a échoué. L'échec d'un appel parti avant l'ouverture ne rouvre rien."""
+        self.failures += 1
+        if probe or (self.opened_at is None and self.failures >= self.threshold):
+            self.opens += 1
+            self.opened_at = time.monotonic()
+        if probe:
+            self.probing = False
+
+    def abandon(self):
+        """Appel d'essai terminé sans verdict (annulé, erreur de requête) : un autre peut partir."""
+        self.probing = False
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures, "opens": self.opens}
+
+
+openai_breaker = CircuitBreaker()
+
+
+async def call_openai(call: str, create, **kwargs):
+    """
+    await create(**kwargs) (client.chat.completions.create) sous échéance,
+    retries et disjoncteur. Lève CircuitOpen, TimeoutError ou l'erreur OpenAI.
+    """
+    deadline = time.monotonic() + OPENAI_DEADLINES.get(call, OPENAI_DEADLINES["main"])
+    attempt = 0
+    while True:
+        try:
+            probe = openai_breaker.allow()
+        except CircuitOpen:
+            openai_outcomes[(call, "breaker_open")] += 1
+            raise
+        try:
+            response = await asyncio.wait_for(create(**kwargs), max(0.0, deadline - time.monotonic()))
+        except RETRYABLE_ERRORS:
+            openai_breaker.failure(probe)
+            delay = random.uniform(0, OPENAI_RETRY_BASE_SECONDS * 2 ** attempt)
+            attempt += 1
+            if attempt > OPENAI_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                openai_outcomes[(call, "failed")] += 1
+                raise
+            openai_outcomes[(call, "retry")] += 1
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # Seul l'appel d'essai libère sa place ; un appel ordinaire annulé
+            # (perdant d'un hedging, visiteur parti) ne touche pas au disjoncteur
+            if probe:
+                openai_breaker.abandon()
+            raise
+        openai_breaker.success()
+        openai_outcomes[(call, "ok")] += 1
+        return response
+
+
+async def stream_chunks(stream, idle: float = OPENAI_STREAM_IDLE_SECONDS):
+    """Morceaux d'une réponse en streaming ; TimeoutError si OpenAI se tait plus de idle secondes."""
+    chunks = stream.__aiter__()
+    while True:
+        try:
+            chunk = await asyncio.wait_for(chunks.__anext__(), idle)
+        except StopAsyncIteration:
+            return
+        except RETRYABLE_ERRORS:
+            openai_breaker.failure()
+            await stream.close()
+            raise
+        yield chunk
@@ -0,0 +1,135 @@
+"""
+Rétention : archivage à froid des conversations inactives.
+
+Une conversation sans message depuis retention_days jours (réglage du
+client, RETENTION_DAYS par défaut, 0 = jamais) est archivée par
+archive_loop() : ses messages sont écrits en NDJSON compressé (gzip) dans
+conversation_archives, puis supprimés de messages et de l'index de
+recherche. La ligne de conversations reste (état, contact, compteurs) :
+la liste admin et ses totaux ne changent pas, seules les tables chaudes
+maigrissent.
+
+Une conversation archivée est restaurée à la demande, dans la transaction
+qui la lit : quand l'admin l'ouvre, ou quand le visiteur revient
+(turns.load_turn).
+
+Plusieurs workers : l'archivage réserve chaque conversation par un UPDATE
+conditionnel sur archived_at, la restauration en supprimant la ligne
+d'archive ; un seul worker fait le travail.
+"""
+import asyncio
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, delete, insert, or_, and_
+from sqlalchemy.orm import Session
+
+from database import AsyncSessionLocal
+from models import Client, Conversation, ConversationArchive, Message
+from search import index_conversation, unindex_conversation
+
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "180"))
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "100"))
+
+
+def encode_messages(messages: list) -> bytes:
+    lines = [json.dumps({
+        "id": m.id, "role": m.role, "content": m.content,
+        "created_at": m.created_at.isoformat() if m.created_at else None,
+    }, ensure_ascii=False) for m in messages]
+    return gzip.compress(("\n".join(lines) + "\n").encode("utf-8"))
+
+
+def decode_messages(data: bytes) -> list:
+    rows = []
+    for line in gzip.decompress(data).decode("utf-8").splitlines():
+        if line:
+            m = json.loads(line)
+            m["created_at"] = datetime.fromisoformat(m["created_at"]) if m["created_at"] else None
+            rows.append(m)
+    return rows
+
+
+def archive_conversation(db: Session, conv_id: str, now: datetime) -> bool:
+    """Déplace les messages dans conversation_archives. Commit par l'appelant."""
+    claimed = db.execute(
+        update(Conversation).where(Conversation.id == conv_id, Conversation.archived_at.is_(None))
+        .values(archived_at=now).execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        return False
+    client_token = db.execute(select(Conversation.client_token).where(Conversation.id == conv_id)).scalar()
+    messages = db.execute(
+        select(Message.id, Message.role, Message.content, Message.created_at)
+        .where(Message.conversation_id == conv_id).order_by(Message.created_at)
+    ).all()
+    db.add(ConversationArchive(conversation_id=conv_id, client_token=client_token,
+                               message_count=len(messages), data=encode_messages(messages), archived_at=now))
+    unindex_conversation(db, conv_id)
+    db.execute(delete(Message).where(Message.conversation_id == conv_id))
+    return True
+
+
+def restore_conversation(db: Session, conv_id: str) -> bool:
+    """Remet les messages archivés dans messages. Commit par l'appelant."""
+    archive = db.execute(
+        select(ConversationArchive.client_token, ConversationArchive.data)
+        .where(ConversationArchive.conversation_id == conv_id)
+    ).first()
+    # La suppression réserve la restauration (un autre worker a pu la faire)
+    if archive is None or not db.execute(
+        delete(ConversationArchive).where(ConversationArchive.conversation_id == conv_id)
+    ).rowcount:
+        return False
+    messages = decode_messages(archive.data)
+    if messages:
+        db.execute(insert(Message), [dict(m, conversation_id=conv_id) for m in messages])
+        index_conversation(db, archive.client_token or "", conv_id)
+    db.execute(
+        update(Conversation).where(Conversation.id == conv_id).values(archived_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    return True
+
+
+async def archive_due() -> int:
+    """Archive les conversations inactives de tous les clients. Retourne leur nombre."""
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        tenants = (await db.execute(select(Client.token, Client.retention_days))).all()
+    archived = 0
+    for token, days in tenants:
+        days = RETENTION_DAYS if days is None else days
+        if days <= 0:
+            continue
+        cutoff = now - timedelta(days=days)
+        while True:
+            async with AsyncSessionLocal() as db:
+                ids = (await db.execute(
+                    select(Conversation.id).where(
+                        Conversation.client_token == token, Conversation.archived_at.is_(None),
+                        or_(Conversation.last_message_at < cutoff,
+                            and_(Conversation.last_message_at.is_(None), Conversation.created_at < cutoff))
+                    ).limit(ARCHIVE_BATCH_SIZE)
+                )).scalars().all()
+                for conv_id in ids:
+                    if await db.run_sync(archive_conversation, conv_id, now):
+                        archived += 1
+                await db.commit()
+            if len(ids) < ARCHIVE_BATCH_SIZE:
+                break
+    return archived
+
+
+async def archive_loop():
+    while True:
+        try:
+            archived = await archive_due()
+            if archived:
+                print("ARCHIVE:", archived, "conversations archivees")
+        except Exception as e:
+            print("ARCHIVE ERROR:", e)
+        await asyncio.sleep(RETENTION_INTERVAL_SECONDS)
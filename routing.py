@@ -0,0 +1,174 @@
+"""
+Choix du modèle par type d'appel et requêtes doublées (hedging) pour la
+réponse principale.
+
+Modèles : MODEL_MAIN pour la réponse au visiteur, MODEL_TRANSLATE et
+MODEL_CLASSIFY (plus légers) pour le handoff, MODEL_SUMMARY pour le
+résumé glissant.
+
+Hedging : la latence de la réponse principale a une longue traîne. Si le
+premier appel n'a pas répondu (premier token en streaming, réponse
+complète sinon) au bout du p95 des latences récentes, un second appel
+identique part (MODEL_HEDGE, MODEL_MAIN par défaut) ; le premier des deux
+qui répond gagne, l'autre est annulé. Par construction environ 5 % des
+appels sont doublés ; HEDGE_MAX_RATIO plafonne cette part si la latence
+change de régime, et le second appel ne part que si le scheduler a une
+place libre tout de suite. Le p99 baisse sans doubler le coût moyen.
+Un appel perdant annulé compte pour le temps écoulé : la traîne reste
+dans les mesures et le délai ne s'effondre pas.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Optional
+
+from resilience import call_openai, stream_chunks
+from scheduler import llm_scheduler
+
+MODELS = {
+    "main": os.getenv("MODEL_MAIN", "gpt-4.1-mini"),
+    "translate": os.getenv("MODEL_TRANSLATE", "gpt-4.1-nano"),
+    "classify": os.getenv("MODEL_CLASSIFY", "gpt-4.1-nano"),
+    "summary": os.getenv("MODEL_SUMMARY", "gpt-4.1-mini"),
+}
+MODEL_HEDGE = os.getenv("MODEL_HEDGE") or MODELS["main"]
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "1") == "1"
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.3"))
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", "0.1"))
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 500
+
+
+def model_for(call: str) -> str:
+    return MODELS.get(call, MODELS["main"])
+
+
+class LatencyTracker:
+    """Latences récentes d'un type d'appel et compteurs de hedging."""
+
+    def __init__(self, size: int = HEDGE_WINDOW):
+        self.samples = deque(maxlen=size)
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+
+    def hedge_delay(self) -> Optional[float]:
+        """Délai avant le second appel ; None tant que les mesures manquent."""
+        if not HEDGE_ENABLED or len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        values = sorted(self.samples)
+        return max(HEDGE_MIN_DELAY_SECONDS, values[min(len(values) - 1, int(HEDGE_QUANTILE * len(values)))])
+
+    def may_hedge(self) -> bool:
+        return self.hedges < HEDGE_MAX_RATIO * self.calls
+
+    def stats(self) -> dict:
+        delay = self.hedge_delay()
+        return {"calls": self.calls, "hedges": self.hedges, "hedge_wins": self.hedge_wins,
+                "delay_ms": round(delay * 1000) if delay is not None else None}
+
+
+# complete : réponse entière (/chat) ; first_token : premier token (/chat/stream)
+latency_trackers = {"complete": LatencyTracker(), "first_token": LatencyTracker()}
+
+
+async def race(tracker: LatencyTracker, tenant: str, leg, discard=None, hold_slot: bool = False):
+    """
+    Lance leg(MODELS["main"]), puis leg(MODEL_HEDGE) s'il tarde. Retourne le
+    résultat du premier qui réussit ; discard(résultat) ferme un perdant
+    qui a réussi aussi. Si tous échouent, lève l'erreur du premier appel.
+    hold_slot : retourne (résultat, créneau) ; si le second appel gagne, son
+    créneau reste pris jusqu'à ce que l'appelant le rende (fin du flux).
+    """
+    tracker.calls += 1
+    primary = asyncio.ensure_future(leg(MODELS["main"]))
+    started = {primary: time.monotonic()}
+    hedge_slot = None
+    winner = None
+    try:
+        delay = tracker.hedge_delay()
+        if delay is not None:
+            await asyncio.wait({primary}, timeout=delay)
+            if not primary.done() and tracker.may_hedge():
+                hedge_slot = llm_scheduler.try_acquire(tenant, "main")
+                if hedge_slot is not None:
+                    tracker.hedges += 1
+                    started[asyncio.ensure_future(leg(MODEL_HEDGE))] = time.monotonic()
+
+        pending = set(started)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if winner is None and task.exception() is None:
+                    winner = task
+        now = time.monotonic()
+        for task in pending:
+            tracker.observe(now - started[task])
+        if winner is None:
+            raise primary.exception()
+        tracker.observe(now - started[winner])
+        if winner is not primary:
+            tracker.hedge_wins += 1
+            if hold_slot:
+                slot, hedge_slot = hedge_slot, None
+                return winner.result(), slot
+        return (winner.result(), None) if hold_slot else winner.result()
+    finally:
+        for task in started:
+            task.cancel()
+        # Un perdant a pu réussir lui aussi, éventuellement après le gagnant
+        if discard is not None:
+            for task in started:
+                if task is not winner and task.done() and not task.cancelled() and task.exception() is None:
+                    await discard(task.result())
+        if hedge_slot is not None:
+            hedge_slot.release()
+
+
+async def hedged_completion(tenant: str, create, **kwargs):
+    """Réponse principale (/chat) : comme call_openai("main", …), doublée si elle tarde."""
+    return await race(latency_trackers["complete"], tenant,
+                      lambda model: call_openai("main", create, **dict(kwargs, model=model)))
+
+
+async def hedged_stream(tenant: str, create, **kwargs):
+    """Réponse principale en streaming : morceaux du premier appel qui produit un token."""
+    async def leg(model):
+        stream = await call_openai("main", create, **dict(kwargs, model=model))
+        chunks = stream_chunks(stream)
+        buffered = []
+        try:
+            async for chunk in chunks:
+                buffered.append(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    break
+        except BaseException:
+            await stream.close()
+            raise
+        return stream, chunks, buffered
+
+    async def discard(result):
+        await result[0].close()
+
+    (stream, chunks, buffered), slot = await race(latency_trackers["first_token"], tenant, leg, discard,
+                                                  hold_slot=True)
+    try:
+        for chunk in buffered:
+            yield chunk
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        await stream.close()
+        if slot is not None:
+            slot.release()
+
+
+def routing_stats() -> dict:
+    return {"models": dict(MODELS, hedge=MODEL_HEDGE),
+            "hedging": {kind: tracker.stats() for kind, tracker in latency_trackers.items()}}
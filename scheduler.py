@@ -0,0 +1,202 @@
+"""
+Admission des appels OpenAI : équité entre clients.
+
+Tous les clients partagent le même quota OpenAI. Chaque appel (réponse
+principale, traduction, oui/non, résumé) passe par llm_scheduler :
+
+- seau à jetons par client : LLM_TENANT_RATE appels/s en régime établi,
+  rafales jusqu'à LLM_TENANT_BURST. Un client qui dépasse attend son
+  jeton, ou est refusé tout de suite si l'attente dépasse l'échéance ;
+- plafond global LLM_MAX_CONCURRENCY d'appels en cours dans le worker ;
+- au-delà, file d'attente équitable pondérée (WFQ) : chaque demande reçoit
+  une étiquette de fin virtuelle, coût / poids du client, à la suite des
+  demandes du même client. La plus petite étiquette passe en premier :
+  un petit client n'attend pas derrière les 200 demandes d'un gros ;
+- une demande qui attendrait plus de LLM_QUEUE_DEADLINE_SECONDS est
+  refusée (Busy, avec un Retry-After) au lieu de dégrader tout le monde.
+
+Coût par type d'appel : voir CALL_COSTS. Poids par client :
+LLM_TENANT_WEIGHTS="token_a:2,token_b:0.5" (1 par défaut).
+Le client est TurnContext.tenant_label : les tokens qui ne correspondent à
+aucun client partagent un seul seau ("unknown"). Les seaux redevenus
+pleins sont oubliés (un seau plein vaut un seau neuf), les étiquettes
+de fin quand la file se vide.
+Limites par worker uvicorn : les diviser par le nombre de workers.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from metrics import STAGE_SECONDS
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+LLM_TENANT_RATE = float(os.getenv("LLM_TENANT_RATE", "5"))
+LLM_TENANT_BURST = float(os.getenv("LLM_TENANT_BURST", "20"))
+LLM_QUEUE_DEADLINE_SECONDS = float(os.getenv("LLM_QUEUE_DEADLINE_SECONDS", "5"))
+# Nombre de seaux au-delà duquel les seaux pleins sont supprimés
+LLM_BUCKETS_PRUNE_SIZE = 1000
+
+# Jetons consommés / coût dans la file, par type d'appel
+CALL_COSTS = {"main": 1.0, "translate": 0.5, "classify": 0.25, "summary": 1.0}
+
+
+def parse_weights(value: str) -> dict:
+    weights = {}
+    for part in value.split(","):
+        token, _, weight = part.strip().rpartition(":")
+        if token:
+            weights[token] = float(weight)
+    return weights
+
+
+LLM_TENANT_WEIGHTS = parse_weights(os.getenv("LLM_TENANT_WEIGHTS", ""))
+
+
+class Busy(Exception):
+    """Demande refusée ; retry_after en secondes (en-tête Retry-After)."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("busy")
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class Slot:
+    """Créneau obtenu ; release() peut être appelé plusieurs fois."""
+
+    def __init__(self, scheduler: "LLMScheduler"):
+        self._scheduler = scheduler
+        self.held = True
+
+    def release(self):
+        if self.held:
+            self.held = False
+            self._scheduler.release()
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self, cost: float) -> float:
+        """Prend cost jetons (à crédit si besoin). Retourne l'attente avant de pouvoir les utiliser."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= cost
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def refund(self, cost: float):
+        self.tokens = min(self.burst, self.tokens + cost)
+
+    def full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, rate: float = LLM_TENANT_RATE,
+                 burst: float = LLM_TENANT_BURST, deadline: float = LLM_QUEUE_DEADLINE_SECONDS):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.deadline = deadline
+        self.active = 0
+        self.waiting = 0
+        self._buckets = {}
+        self._queue = []  # (étiquette de fin, n°, future)
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish = {}
+        self.rejected = {}  # (client, appel) → refus
+
+    def _reject(self, tenant: str, call: str, retry_after: float) -> Busy:
+        key = (tenant, call)
+        self.rejected[key] = self.rejected.get(key, 0) + 1
+        return Busy(retry_after)
+
+    async def acquire(self, tenant: str, call: str) -> Slot:
+        """Attend un créneau (jeton du client puis place dans le plafond global). Lève Busy."""
+        cost = CALL_COSTS.get(call, 1.0)
+        started = time.monotonic()
+        bucket = self._buckets.get(tenant)
+        if bucket is None:
+            if len(self._buckets) >= LLM_BUCKETS_PRUNE_SIZE:
+                self._prune_buckets()
+            bucket = self._buckets[tenant] = TokenBucket(self.rate, self.burst)
+        wait = bucket.reserve(cost)
+        if wait > self.deadline:
+            bucket.refund(cost)
+            raise self._reject(tenant, call, wait)
+        if wait:
+            await asyncio.sleep(wait)
+
+        if self.active < self.max_concurrency and not self.waiting:
+            self.active += 1
+        else:
+            weight = LLM_TENANT_WEIGHTS.get(tenant, 1.0)
+            finish = max(self._virtual_time, self._last_finish.get(tenant, 0.0)) + cost / weight
+            self._last_finish[tenant] = finish
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._queue, (finish, next(self._seq), future))
+            self.waiting += 1
+            try:
+                # Le créneau est transmis par release() (self.active déjà compté)
+                await asyncio.wait_for(asyncio.shield(future), self.deadline - (time.monotonic() - started))
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if future.done() and not future.cancelled():
+                    self.release()  # créneau reçu au moment de l'abandon
+                else:
+                    future.cancel()
+                    self.waiting -= 1
+                bucket.refund(cost)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                raise self._reject(tenant, call, self.deadline)
+        STAGE_SECONDS.observe(time.monotonic() - started, "queue", tenant, "")
+        return Slot(self)
+
+    def _prune_buckets(self):
+        now = time.monotonic()
+        for tenant in [t for t, b in self._buckets.items() if b.full(now)]:
+            del self._buckets[tenant]
+
+    def try_acquire(self, tenant: str, call: str) -> Optional[Slot]:
+        """Créneau immédiat ou None, sans file ni jeton (second appel d'un hedging, routing.py)."""
+        if self.active < self.max_concurrency and not self.waiting:
+            self.active += 1
+            return Slot(self)
+        return None
+
+    def release(self):
+        while self._queue:
+            finish, _, future = heapq.heappop(self._queue)
+            if future.cancelled():
+                continue
+            self._virtual_time = finish
+            self.waiting -= 1
+            future.set_result(None)
+            return
+        self.active -= 1
+        self._last_finish.clear()  # file vide : plus aucune étiquette en attente
+
+    @asynccontextmanager
+    async def slot(self, tenant: str, call: str):
+        """async with llm_scheduler.slot(token, "main"): … — lève Busy si refusé."""
+        slot = await self.acquire(tenant, call)
+        try:
+            yield
+        finally:
+            slot.release()
+
+    def stats(self) -> dict:
+        return {"active": self.active, "queued": self.waiting, "rejected": sum(self.rejected.values())}
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,177 @@
+"""
+Recherche plein texte dans les messages d'un client (GET /admin/search).
+
+Selon DATABASE_URL :
+- SQLite : table virtuelle FTS5 messages_fts, alimentée par
+  turns.save_turn() dans le même commit que les messages. La colonne
+  tenant contient le token client en hexadécimal (un seul mot pour le
+  tokenizer) : le filtre par client fait partie de la requête FTS, qui
+  reste rapide quel que soit le volume des autres clients. Chaque ligne
+  a le rowid de son message, pour la retirer de l'index en passant par
+  l'index de messages (archivage, retention.py).
+- Postgres : index GIN sur to_tsvector('simple', content), tenu à jour
+  par Postgres lui-même. Configuration 'simple' : les conversations sont
+  dans toutes les langues.
+Sans FTS5 (SQLite compilé sans), repli sur un LIKE.
+
+Résultats classés par pertinence (bm25 / ts_rank), paginés par offset,
+avec un extrait HTML où les termes trouvés sont entourés de <mark>.
+"""
+import html
+import re
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_PAGE_SIZE_MAX = 100
+SNIPPET_WORDS = 16
+
+# Délimiteurs des termes trouvés, remplacés par <mark> après échappement HTML
+MARK_START = "\x02"
+MARK_STOP = "\x03"
+
+WORD_RE = re.compile(r"\w+")
+LIKE_ESCAPE_RE = re.compile(r"[\\%_]")
+
+FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "content, tenant, message_id UNINDEXED, conversation_id UNINDEXED, "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+PG_INDEX_DDL = (
+    "CREATE INDEX IF NOT EXISTS ix_messages_content_fts ON messages "
+    "USING GIN (to_tsvector('simple', content))"
+)
+
+# fts5 / tsvector / like — fixé au démarrage par init_search()
+backend = "like"
+
+
+def tenant_key(client_token: str) -> str:
+    return client_token.encode("utf-8").hex()
+
+
+def create_index(conn):
+    """Étape de migration : index plein texte + indexation des messages existants."""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(PG_INDEX_DDL))
+        return
+    if conn.dialect.name != "sqlite":
+        return
+    try:
+        conn.execute(text(FTS_DDL))
+    except Exception as e:
+        print("SEARCH: FTS5 indisponible, recherche par LIKE:", e)
+        return
+    conn.execute(text("DELETE FROM messages_fts"))
+    conn.execute(text(
+        "INSERT INTO messages_fts (rowid, content, tenant, message_id, conversation_id) "
+        "SELECT m.rowid, m.content, lower(hex(c.client_token)), m.id, m.conversation_id "
+        "FROM messages m JOIN conversations c ON c.id = m.conversation_id "
+        "WHERE c.client_token IS NOT NULL"
+    ))
+
+
+def init_search(engine):
+    global backend
+    if engine.dialect.name == "postgresql":
+        backend = "tsvector"
+        return
+    with engine.connect() as conn:
+        found = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        )).first()
+    backend = "fts5" if found else "like"
+
+
+async def index_messages(db: AsyncSession, client_token: str, message_ids: list):
+    """Messages déjà ajoutés à la session ; même transaction que l'appelant."""
+    if backend != "fts5" or not message_ids:
+        return
+    key = tenant_key(client_token)
+    await db.execute(
+        text("INSERT INTO messages_fts (rowid, content, tenant, message_id, conversation_id) "
+             "SELECT rowid, content, :tenant, id, conversation_id FROM messages WHERE id = :message_id"),
+        [{"tenant": key, "message_id": message_id} for message_id in message_ids]
+    )
+
+
+def index_conversation(db: Session, client_token: str, conv_id: str):
+    """Indexe tous les messages d'une conversation (restauration d'une archive)."""
+    if backend != "fts5":
+        return
+    db.execute(text(
+        "INSERT INTO messages_fts (rowid, content, tenant, message_id, conversation_id) "
+        "SELECT rowid, content, :tenant, id, conversation_id FROM messages WHERE conversation_id = :conv_id"
+    ), {"tenant": tenant_key(client_token), "conv_id": conv_id})
+
+
+def unindex_conversation(db: Session, conv_id: str):
+    """Retire de l'index les messages d'une conversation, avant leur suppression."""
+    if backend != "fts5":
+        return
+    db.execute(text(
+        "DELETE FROM messages_fts WHERE rowid IN (SELECT rowid FROM messages WHERE conversation_id = :conv_id)"
+    ), {"conv_id": conv_id})
+
+
+def fts_query(client_token: str, q: str) -> Optional[str]:
+    """Requête FTS5 : tous les mots (préfixes), limitée au client. None si aucun mot."""
+    words = WORD_RE.findall(q)
+    if not words:
+        return None
+    return "tenant : " + tenant_key(client_token) + " AND content : (" + " ".join('"' + w + '"*' for w in words) + ")"
+
+
+def render_snippet(raw: str) -> str:
+    return html.escape(raw).replace(MARK_START, "<mark>").replace(MARK_STOP, "</mark>")
+
+
+def like_snippet(content: str, q: str) -> str:
+    i = content.lower().find(q.lower())
+    if i < 0:
+        return content[:120]
+    start = max(0, i - 60)
+    return (("…" if start else "") + content[start:i] + MARK_START + content[i:i + len(q)] + MARK_STOP
+            + content[i + len(q):i + len(q) + 60])
+
+
+def search_messages(db: Session, client_token: str, q: str, limit: int, offset: int) -> list:
+    """Au plus limit résultats : (message_id, conversation_id, role, created_at, extrait brut)."""
+    params = {"limit": limit, "offset": offset, "start": MARK_START, "stop": MARK_STOP}
+    if backend == "fts5":
+        match = fts_query(client_token, q)
+        if match is None:
+            return []
+        return db.execute(text(
+            "SELECT f.message_id, f.conversation_id, m.role, m.created_at, "
+            "snippet(messages_fts, 0, :start, :stop, '…', " + str(SNIPPET_WORDS) + ") AS snippet "
+            "FROM messages_fts f JOIN messages m ON m.id = f.message_id "
+            "WHERE messages_fts MATCH :match "
+            "ORDER BY bm25(messages_fts, 1.0, 0.0), m.created_at DESC LIMIT :limit OFFSET :offset"
+        ), dict(params, match=match)).all()
+    if backend == "tsvector":
+        # Extrait calculé seulement pour la page demandée
+        return db.execute(text(
+            "SELECT h.id, h.conversation_id, h.role, h.created_at, "
+            "ts_headline('simple', h.content, websearch_to_tsquery('simple', :q), "
+            "'StartSel=' || :start || ', StopSel=' || :stop || ', MaxWords=" + str(SNIPPET_WORDS) + ", MinWords=6') "
+            "AS snippet FROM ("
+            "  SELECT m.id, m.conversation_id, m.role, m.created_at, m.content, "
+            "  ts_rank(to_tsvector('simple', m.content), websearch_to_tsquery('simple', :q)) AS score "
+            "  FROM messages m JOIN conversations c ON c.id = m.conversation_id "
+            "  WHERE c.client_token = :tenant "
+            "  AND to_tsvector('simple', m.content) @@ websearch_to_tsquery('simple', :q) "
+            "  ORDER BY score DESC, m.created_at DESC LIMIT :limit OFFSET :offset"
+            ") h ORDER BY h.score DESC, h.created_at DESC"
+        ), dict(params, q=q, tenant=client_token)).all()
+    rows = db.execute(text(
+        "SELECT m.id, m.conversation_id, m.role, m.created_at, m.content "
+        "FROM messages m JOIN conversations c ON c.id = m.conversation_id "
+        "WHERE c.client_token = :tenant AND m.content LIKE :pattern ESCAPE '\\' "
+        "ORDER BY m.created_at DESC LIMIT :limit OFFSET :offset"
+    ), dict(params, tenant=client_token, pattern="%" + LIKE_ESCAPE_RE.sub(r"\\\g<0>", q) + "%")).all()
+    return [(r[0], r[1], r[2], r[3], like_snippet(r[4], q)) for r in rows]
@@ -9,6 +9,7 @@
 
   var BASE_URL = "https://ai-assistant-backend-clean-iz6y.onrender.com";
   var API_URL = BASE_URL + "/chat";
+  var STREAM_URL = BASE_URL + "/chat/stream";
   var CONTACT_URL = BASE_URL + "/contact-human";
 
   var style = document.createElement("style");
@@ -175,14 +176,40 @@
   var typing = document.getElementById("rpl-typing");
 
   function getPageContent() {
-    var text = "";
-    var els = document.querySelectorAll("main, section, article, body");
-    for (var i = 0; i < els.length; i++) {
-      if (els[i] && els[i].innerText) text += els[i].innerText + "\n";
+    var root = document.querySelector("main") || document.body;
+    var text = root.innerText || "";
+    // Menus, en-tetes et pieds de page n'aident pas l'assistant
+    var skip = root.querySelectorAll("nav, header, footer, aside, #rpl-box");
+    for (var i = 0; i < skip.length; i++) {
+      var t = skip[i].innerText;
+      if (t) text = text.split(t).join("\n");
     }
     return text.slice(0, 6000);
   }
 
+  // Pages deja transmises au serveur : on n'envoie plus que leur hash
+  var knownPages = {};
+  try { knownPages = JSON.parse(sessionStorage.getItem("rpl_pages") || "{}"); } catch (e) {}
+
+  function rememberPage(hash) {
+    knownPages[hash] = 1;
+    try { sessionStorage.setItem("rpl_pages", JSON.stringify(knownPages)); } catch (e) {}
+  }
+
+  function sha256(text) {
+    if (!window.crypto || !crypto.subtle || !window.TextEncoder) return Promise.resolve(null);
+    return crypto.subtle.digest("SHA-256", new TextEncoder().encode(text)).then(function(buf) {
+      return Array.prototype.map.call(new Uint8Array(buf), function(b) {
+        return ("0" + b.toString(16)).slice(-2);
+      }).join("");
+    }).catch(function() { return null; });
+  }
+
+  function getPage() {
+    var text = getPageContent();
+    return sha256(text).then(function(hash) { return { text: text, hash: hash }; });
+  }
+
   function addMsg(role, text) {
     var wrapper = document.createElement("div");
     wrapper.className = "rpl-msg " + role;
@@ -196,24 +223,70 @@
     wrapper.appendChild(bubble);
     msgs.insertBefore(wrapper, typing);
     msgs.scrollTop = msgs.scrollHeight;
+    return bubble;
   }
 
   function showTyping() { typing.style.display = "flex"; msgs.scrollTop = msgs.scrollHeight; }
   function hideTyping() { typing.style.display = "none"; }
 
-  function sendMessage(text) {
-    if (!text.trim()) return;
-    addMsg("user", text);
-    showTyping();
-    fetch(API_URL, {
+  // Envoie le message ; le texte de la page n'est joint que si le serveur ne le connait pas.
+  // Serveur occupe (429) : un seul nouvel essai apres Retry-After, s'il est court
+  function postChat(url, text, page, withContent, retried) {
+    var sendContent = withContent || !page.hash || !knownPages[page.hash];
+    return fetch(url, {
       method: "POST",
       headers: {"Content-Type": "application/json"},
       body: JSON.stringify({
         message: text,
         conversation_id: conversationId,
-        page_content: getPageContent(),
+        page_hash: page.hash,
+        page_content: sendContent ? page.text : null,
         client_token: CLIENT_TOKEN
       })
+    }).then(function(res) {
+      if (res.status === 409 && !sendContent) {
+        delete knownPages[page.hash];
+        return postChat(url, text, page, true, retried);
+      }
+      var wait = parseInt(res.headers.get("Retry-After"), 10);
+      if (res.status === 429 && !retried && wait > 0 && wait <= 10) {
+        return new Promise(function(resolve) { setTimeout(resolve, wait * 1000); }).then(function() {
+          return postChat(url, text, page, withContent, true);
+        });
+      }
+      if (res.ok && sendContent && page.hash) rememberPage(page.hash);
+      return res;
+    });
+  }
+
+  // Lit un flux SSE (event/data) et appelle onEvent(nom, donnees) pour chaque evenement
+  function readEvents(res, onEvent) {
+    var reader = res.body.getReader();
+    var decoder = new TextDecoder();
+    var buffer = "";
+    function pump() {
+      return reader.read().then(function(r) {
+        if (r.done) return;
+        buffer += decoder.decode(r.value, { stream: true });
+        var blocks = buffer.split("\n\n");
+        buffer = blocks.pop();
+        blocks.forEach(function(block) {
+          var name = "message", data = "";
+          block.split("\n").forEach(function(line) {
+            if (line.indexOf("event:") === 0) name = line.slice(6).trim();
+            else if (line.indexOf("data:") === 0) data += line.slice(5).trim();
+          });
+          if (data) onEvent(name, JSON.parse(data));
+        });
+        return pump();
+      });
+    }
+    return pump();
+  }
+
+  function sendMessageJson(text) {
+    getPage().then(function(page) {
+      return postChat(API_URL, text, page, false);
     }).then(function(res) {
       if (!res.ok) throw new Error("Erreur");
       return res.json();
@@ -227,6 +300,39 @@
     });
   }
 
+  function sendMessage(text) {
+    if (!text.trim()) return;
+    addMsg("user", text);
+    showTyping();
+    // Navigateurs sans fetch streaming → reponse complete en JSON
+    if (!window.ReadableStream || !window.TextDecoder) return sendMessageJson(text);
+    var bubble = null;
+    var failed = false;
+    getPage().then(function(page) {
+      return postChat(STREAM_URL, text, page, false);
+    }).then(function(res) {
+      if (!res.ok || !res.body) throw new Error("Erreur");
+      return readEvents(res, function(name, data) {
+        if (name === "token") {
+          if (!bubble) { hideTyping(); bubble = addMsg("bot", ""); }
+          bubble.textContent += data.token;
+          msgs.scrollTop = msgs.scrollHeight;
+        } else if (name === "done") {
+          conversationId = data.conversation_id;
+          if (!bubble) { hideTyping(); bubble = addMsg("bot", ""); }
+          bubble.textContent = data.reply;
+        } else if (name === "error") {
+          failed = true;
+        }
+      });
+    }).then(function() {
+      if (failed) throw new Error("Erreur");
+    }).catch(function() {
+      hideTyping();
+      addMsg("bot", "Une erreur est survenue. Reessayez.");
+    });
+  }
+
   button.onclick = function() {
     isOpen = !isOpen;
     box.style.display = isOpen ? "flex" : "none";
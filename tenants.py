@@ -0,0 +1,157 @@
+"""
+Cache en mémoire de la configuration des clients (tenants).
+
+Chaque tour de /chat et chaque appel admin a besoin du Client (prompt,
+email, mot de passe admin) alors que ces données ne changent presque
+jamais. Le cache est LRU avec TTL ; les écritures de /superadmin/*
+l'invalident localement et incrémentent un numéro de version en base
+(table cache_versions). Les autres workers uvicorn relisent ce numéro au
+plus toutes les TENANT_CACHE_SYNC_SECONDS et se vident s'il a changé.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import Client
+
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", "1000"))
+TENANT_CACHE_TTL = float(os.getenv("TENANT_CACHE_TTL", "300"))
+TENANT_CACHE_SYNC_SECONDS = float(os.getenv("TENANT_CACHE_SYNC_SECONDS", "5"))
+
+TENANTS_VERSION_KEY = "tenants"
+
+# Label des métriques pour un token qui ne correspond à aucun client : /chat
+# accepte n'importe quel token, un label par token créerait des séries sans fin
+UNKNOWN_TENANT = "unknown"
+
+
+@dataclass(frozen=True)
+class TenantConfig:
+    """Copie figée d'une ligne Client, utilisable hors de toute session."""
+    token: str
+    business_name: str
+    admin_password: str
+    client_email: Optional[str]
+    system_prompt: Optional[str]
+
+    @classmethod
+    def from_client(cls, c: Client) -> "TenantConfig":
+        return cls(
+            token=c.token,
+            business_name=c.business_name,
+            admin_password=c.admin_password,
+            client_email=c.client_email,
+            system_prompt=c.system_prompt,
+        )
+
+
+class TenantCache:
+    """LRU + TTL. Les tokens inconnus sont aussi mis en cache (valeur None)."""
+
+    def __init__(self, max_size: int = TENANT_CACHE_SIZE, ttl: float = TENANT_CACHE_TTL,
+                 sync_interval: float = TENANT_CACHE_SYNC_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self.version = None
+        self._next_sync = 0.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()  # les endpoints admin tournent dans le threadpool
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str):
+        """(True, config ou None) si en cache et frais, (False, None) sinon."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] < now:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return True, entry[1]
+
+    def put(self, token: str, config: Optional[TenantConfig]):
+        with self._lock:
+            self._entries[token] = (time.monotonic() + self.ttl, config)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: Optional[str] = None):
+        with self._lock:
+            if token is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(token, None)
+
+    def sync_due(self) -> bool:
+        return time.monotonic() >= self._next_sync
+
+    def apply_version(self, version: int):
+        """Vide le cache si un autre worker a modifié un client depuis la dernière lecture."""
+        with self._lock:
+            if self.version is not None and version != self.version:
+                self._entries.clear()
+            self.version = version
+            self._next_sync = time.monotonic() + self.sync_interval
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "version": self.version}
+
+
+tenant_cache = TenantCache()
+
+
+def tenant_label(token: str, config: Optional[TenantConfig]) -> str:
+    """Token du client s'il existe, UNKNOWN_TENANT sinon."""
+    return token if config is not None else UNKNOWN_TENANT
+
+
+VERSION_QUERY = text("SELECT version FROM cache_versions WHERE name = :name")
+
+
+def bump_tenants_version(db: Session):
+    """À appeler dans la transaction qui modifie un client, avant le commit."""
+    updated = db.execute(
+        text("UPDATE cache_versions SET version = version + 1 WHERE name = :name"),
+        {"name": TENANTS_VERSION_KEY}
+    ).rowcount
+    if not updated:
+        db.execute(
+            text("INSERT INTO cache_versions (name, version) VALUES (:name, 1)"),
+            {"name": TENANTS_VERSION_KEY}
+        )
+
+
+def get_tenant(token: str, db: Session) -> Optional[TenantConfig]:
+    if tenant_cache.sync_due():
+        tenant_cache.apply_version(db.execute(VERSION_QUERY, {"name": TENANTS_VERSION_KEY}).scalar() or 0)
+    found, config = tenant_cache.get(token)
+    if found:
+        return config
+    c = db.query(Client).filter(Client.token == token).first()
+    config = TenantConfig.from_client(c) if c else None
+    tenant_cache.put(token, config)
+    return config
+
+
+async def get_tenant_async(token: str, db: AsyncSession) -> Optional[TenantConfig]:
+    if tenant_cache.sync_due():
+        version = (await db.execute(VERSION_QUERY, {"name": TENANTS_VERSION_KEY})).scalar()
+        tenant_cache.apply_version(version or 0)
+    found, config = tenant_cache.get(token)
+    if found:
+        return config
+    c = (await db.execute(select(Client).where(Client.token == token))).scalars().first()
+    config = TenantConfig.from_client(c) if c else None
+    tenant_cache.put(token, config)
+    return config
@@ -0,0 +1,82 @@
+"""
+Fixtures communes : l'application sur une base SQLite temporaire, OpenAI
+simulé par bench/openai_stub.py (appelé en mémoire, sans réseau).
+
+Une seule boucle asyncio pour toute la session : les moteurs de
+database.py gardent des connexions liées à la boucle qui les a ouvertes.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP = tempfile.mkdtemp(prefix="replai-tests-")
+
+# Avant tout import de l'application
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(TMP, "tests.db")
+os.environ["OPENAI_API_KEY"] = "test"
+os.environ["TRANSLATION_WARMUP_LANGS"] = ""
+os.environ["EMAIL_BACKEND"] = "fake"
+os.environ["RETENTION_DAYS"] = "0"
+os.chdir(ROOT)  # /static est monté en chemin relatif
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+
+class Stack:
+    def __init__(self, loop, app, http, stub):
+        self.loop = loop
+        self.app = app
+        self.http = http
+        self.stub = stub
+        self.token = None  # client créé au démarrage
+
+    def run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def create_client(self, business_name: str, **fields) -> str:
+        """Nouveau client (mot de passe admin "pw") ; retourne son token."""
+        import chatbot
+
+        r = self.run(self.http.post("/superadmin/create-client", json=dict({
+            "business_name": business_name, "admin_password": "pw", "client_email": "owner@example.com",
+            "superadmin_password": chatbot.SUPERADMIN_PASSWORD,
+        }, **fields)))
+        r.raise_for_status()
+        return r.json()["token"]
+
+
+@pytest.fixture(scope="session")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    pending = asyncio.all_tasks(loop)
+    for task in pending:
+        task.cancel()
+    if pending:
+        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def stack(loop):
+    import httpx
+    from openai import AsyncOpenAI
+
+    import chatbot
+    from openai_stub import make_app
+
+    stub = make_app(0.01, token_delay=0.01)
+    chatbot.client = AsyncOpenAI(api_key="test", base_url="http://stub/v1", max_retries=0,
+                                 http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=stub)))
+    lifespan = chatbot.app.router.lifespan_context(chatbot.app)
+    loop.run_until_complete(lifespan.__aenter__())
+    http = httpx.AsyncClient(transport=httpx.ASGITransport(app=chatbot.app), base_url="http://test", timeout=30)
+    stack = Stack(loop, chatbot.app, http, stub)
+    stack.token = stack.create_client("Tests")
+    yield stack
+    loop.run_until_complete(http.aclose())
+    loop.run_until_complete(lifespan.__aexit__(None, None, None))
@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from database import AsyncSessionLocal
+from models import Conversation
+
+
+def list_page(stack, token: str, cursor=None, limit: int = 2) -> dict:
+    params = {"client_token": token, "limit": limit}
+    if cursor:
+        params["cursor"] = cursor
+    r = stack.run(stack.http.get("/admin/conversations", params=params, headers={"X-Admin-Password": "pw"}))
+    assert r.status_code == 200
+    return r.json()
+
+
+def test_cursor_pages_have_no_duplicates_or_gaps_on_ties(stack):
+    token = stack.create_client("Pagination")
+    tied = datetime(2024, 3, 1, 12, 0)
+    created = {"conv-%02d" % i: tied if i < 5 else datetime(2024, 3, 1, 11, i) for i in range(9)}
+
+    async def add():
+        async with AsyncSessionLocal() as db:
+            for conv_id, at in created.items():
+                db.add(Conversation(id=conv_id, client_token=token, title="x", created_at=at,
+                                    last_message_at=tied, message_count=0))
+            await db.commit()
+    stack.run(add())
+
+    page = list_page(stack, token)
+    assert page["total"] == 9
+    seen = [i["id"] for i in page["items"]]
+    while page["next_cursor"]:
+        page = list_page(stack, token, page["next_cursor"])
+        assert "total" not in page  # compteurs avec la première page seulement
+        seen += [i["id"] for i in page["items"]]
+    assert seen == sorted(created, key=lambda c: (created[c], c), reverse=True)
+
+
+def test_summary_columns_follow_the_turns(stack):
+    token = stack.create_client("Résumés")
+    conv_id = "resume-handoff"
+    stack.run(stack.http.post("/chat", json={
+        "message": "Vendez-vous des bâches ?", "client_token": token, "conversation_id": conv_id,
+    }))
+    stack.run(stack.http.post("/contact-human", json={"client_token": token, "conversation_id": conv_id}))
+    stack.run(stack.http.post("/chat", json={
+        "message": "Paul, 06 11 22 33 44", "client_token": token, "conversation_id": conv_id,
+    }))
+
+    page = list_page(stack, token, limit=10)
+    item = page["items"][0]
+    assert item["id"] == conv_id
+    # 2 messages, la réponse de /contact-human, puis 2 messages
+    assert item["message_count"] == 5
+    assert item["needs_human"] and item["contact_info"] == "Paul, 06 11 22 33 44"
+    assert (page["total"], page["urgent"]) == (1, 1)
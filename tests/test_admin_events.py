@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from admin_events import SentEvents, events_after
+from database import AsyncSessionLocal
+from models import AdminEvent
+
+
+def add_event(event_id: int, age_seconds: float = 0):
+    async def add():
+        async with AsyncSessionLocal() as db:
+            db.add(AdminEvent(id=event_id, client_token="evenements", conversation_id="c", kind="message",
+                              payload="{}", created_at=datetime.utcnow() - timedelta(seconds=age_seconds)))
+            await db.commit()
+    return add()
+
+
+def read_after(after_id: int, sent: SentEvents) -> list:
+    async def read():
+        async with AsyncSessionLocal() as db:
+            return await events_after(db, "evenements", after_id, sent.ids)
+    return read()
+
+
+def test_late_commit_with_smaller_id_is_not_skipped(stack):
+    sent = SentEvents()
+    stack.run(add_event(900100))
+    rows = stack.run(read_after(900000, sent))
+    assert [r.id for r in rows] == [900100]
+    sent.add(rows[0].id, rows[0].created_at)
+
+    # Transaction ouverte avant celle de 900100, commitée après
+    stack.run(add_event(900090))
+    stack.run(add_event(900080, age_seconds=3600))  # hors de la fenêtre de reprise
+    rows = stack.run(read_after(900100, sent))
+    assert [r.id for r in rows] == [900090]
+    sent.add(rows[0].id, rows[0].created_at)
+
+    assert stack.run(read_after(900100, sent)) == []
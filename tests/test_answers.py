@@ -0,0 +1,53 @@
+import chatbot
+from answers import AnswerCache, ANSWER_CACHE_MAX_QUESTION_CHARS, answer_cache, normalize_question
+
+
+def ask(stack, token: str, message: str) -> int:
+    """Envoie un premier message ; retourne le nombre d'appels au stub."""
+    calls = stack.stub.state.calls
+    r = stack.run(stack.http.post("/chat", json={"message": message, "client_token": token}))
+    assert r.status_code == 200
+    return stack.stub.state.calls - calls
+
+
+def test_normalize_question():
+    assert normalize_question("Vos  HORAIRES ?") == normalize_question("vos horaires") == "vos horaires"
+    assert normalize_question("Êtes-vous ouverts ?") == "etes vous ouverts"
+
+
+def test_key_skips_empty_and_long_questions():
+    cache = AnswerCache(max_size=10)
+    assert cache.key("t", None, "", "?!") is None
+    assert cache.key("t", None, "", "x" * (ANSWER_CACHE_MAX_QUESTION_CHARS + 1)) is None
+    assert AnswerCache(max_size=0).key("t", None, "", "horaires") is None
+
+
+def test_repeated_first_question_is_a_hit(stack):
+    token = stack.create_client("Reponses")
+    assert ask(stack, token, "Quels sont vos horaires ?") == 1
+    assert ask(stack, token, "quels sont VOS horaires") == 0
+    assert answer_cache.lookups[token] == [1, 1]
+    # Autre question : miss
+    assert ask(stack, token, "Où êtes-vous situés ?") == 1
+    assert answer_cache.lookups[token] == [1, 2]
+
+
+def test_update_client_invalidates_answers(stack):
+    token = stack.create_client("Reponses")
+    assert ask(stack, token, "Vendez-vous des graines de tomates ?") == 1
+    r = stack.run(stack.http.post("/superadmin/update-client", json={
+        "token": token, "system_prompt": "Tu es l'assistant d'un paysagiste.",
+        "superadmin_password": chatbot.SUPERADMIN_PASSWORD,
+    }))
+    assert r.status_code == 200
+    assert not [k for k in answer_cache._entries if k[0] == token]
+    assert ask(stack, token, "Vendez-vous des graines de tomates ?") == 1
+
+
+def test_unknown_tokens_share_cached_answers(stack):
+    hits = answer_cache.lookups["unknown"][0]
+    bodies = [{"message": "Acceptez-vous les chèques ?", "client_token": "autre-%d" % i} for i in range(2)]
+    first, second = [stack.run(stack.http.post("/chat", json=body)).json() for body in bodies]
+    assert first["reply"] == second["reply"]
+    assert answer_cache.lookups["unknown"][0] == hits + 1
+    assert not [t for t in answer_cache.lookups if t.startswith("autre-")]
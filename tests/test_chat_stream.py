@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+from sqlalchemy import select
+
+from database import AsyncSessionLocal
+from models import Conversation, Message
+
+
+async def post_and_disconnect(app, path: str, body: dict) -> list:
+    """Requête ASGI dont le client se déconnecte au premier token reçu."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": [(b"content-type", b"application/json"), (b"host", b"test")],
+        "client": ("127.0.0.1", 1), "server": ("test", 80),
+    }
+    payload = json.dumps(body).encode()
+    sent = []
+    gone = asyncio.Event()
+
+    async def receive():
+        if not sent:
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+        if b"event: token" in message.get("body", b""):
+            gone.set()
+            raise OSError("client parti")
+
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        pass  # ClientDisconnect remonte jusqu'au serveur
+    return sent
+
+
+def test_disconnect_mid_stream_keeps_visitor_message(stack):
+    conv_id = "stream-disconnect"
+    sent = stack.run(post_and_disconnect(stack.app, "/chat/stream", {
+        "message": "Quelle est la garantie sur vos produits ?", "conversation_id": conv_id,
+        "client_token": stack.token,
+    }))
+    assert any(b"event: token" in m.get("body", b"") for m in sent)
+
+    async def stored():
+        async with AsyncSessionLocal() as db:
+            conv = (await db.execute(select(Conversation).where(Conversation.id == conv_id))).scalar()
+            messages = (await db.execute(
+                select(Message.role, Message.content).where(Message.conversation_id == conv_id)
+            )).all()
+        return conv, messages
+
+    conv, messages = stack.run(stored())
+    assert conv is not None
+    assert conv.client_token == stack.token
+    assert [tuple(m) for m in messages] == [("user", "Quelle est la garantie sur vos produits ?")]
+
+
+def test_stream_completes_and_saves_reply(stack):
+    r = stack.run(stack.http.post("/chat/stream", json={
+        "message": "Faites-vous des devis gratuits pour les jardins ?", "conversation_id": "stream-ok",
+        "client_token": stack.token,
+    }))
+    assert r.status_code == 200
+    assert "event: done" in r.text
+    done = json.loads(r.text.split("event: done\ndata: ", 1)[1].split("\n", 1)[0])
+    assert done["conversation_id"] == "stream-ok"
@@ -0,0 +1,34 @@
+import json
+
+import export
+from database import engine
+
+
+def test_export_resumes_across_chunks_without_holding_a_connection(stack, monkeypatch):
+    token = stack.create_client("Export")
+    for i in range(5):
+        r = stack.run(stack.http.post("/chat", json={
+            "message": "Question export %d ?" % i, "client_token": token, "conversation_id": "export-%d" % i,
+        }))
+        assert r.status_code == 200
+
+    monkeypatch.setattr(export, "EXPORT_CHUNK_SIZE", 2)
+    items = export.export_conversations(token, None, None, None)
+    seen = []
+    for conv, messages in items:
+        # Entre deux conversations envoyées, aucune connexion du pool n'est prise
+        assert engine.pool.checkedout() == 0
+        seen.append((conv.id, [m["role"] for m in messages]))
+    assert seen == [("export-%d" % i, ["user", "assistant"]) for i in range(5)]
+
+    lines = list(export.to_ndjson(export.export_conversations(token, None, None, None)))
+    cursor = json.loads(lines[1])["cursor"]
+    after = tuple(cursor.split("|"))
+    after = (export.parse_date(after[0]), after[1])
+    assert [c.id for c, _ in export.export_conversations(token, None, None, after)] == \
+        ["export-2", "export-3", "export-4"]
+
+    r = stack.run(stack.http.get("/admin/export", params={"client_token": token, "format": "csv"},
+                                 headers={"X-Admin-Password": "pw"}))
+    assert r.status_code == 200
+    assert len(r.text.strip().splitlines()) == 1 + 5 * 2
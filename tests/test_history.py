@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from history import estimate_tokens, fit_history, message_tokens, messages_to_summarize
+from turns import HistoryMessage
+
+
+def messages(n: int, content: str = "Bonjour, une question sur vos tarifs") -> list:
+    return [HistoryMessage("user" if i % 2 == 0 else "assistant", content, datetime(2024, 1, 1, 0, i))
+            for i in range(n)]
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("bonjour") == 2
+    assert estimate_tokens("営業時間") == 4
+
+
+def test_window_stops_at_max_messages():
+    history = messages(10)
+    window, overflow = fit_history(history, budget=10000, max_messages=4)
+    assert window == history[-4:]
+    assert overflow == history[:-4]
+
+
+def test_window_stops_at_token_budget():
+    history = messages(10)
+    window, overflow = fit_history(history, budget=3 * message_tokens(history[0].content), max_messages=100)
+    assert window == history[-3:]
+    assert len(overflow) == 7
+
+
+def test_last_message_always_kept():
+    history = messages(3, "mot " * 500)
+    window, overflow = fit_history(history, budget=10, max_messages=100)
+    assert window == history[-1:]
+
+
+def test_summarize_down_to_keep_messages(monkeypatch):
+    import history as history_module
+    monkeypatch.setattr(history_module, "HISTORY_KEEP_MESSAGES", 4)
+    history = messages(10)
+    assert messages_to_summarize(history, history[:2]) == history[:6]
+    assert messages_to_summarize(history, []) == []
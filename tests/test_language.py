@@ -0,0 +1,23 @@
+import pytest
+
+from language import detect_language
+
+
+@pytest.mark.parametrize("message, lang", [
+    ("Bonjour, quels sont vos horaires ?", "fr"),
+    ("Hello, what are your opening hours?", "en"),
+    ("Hola, ¿cuáles son sus horarios?", "es"),
+    ("Guten Tag, wann haben Sie geöffnet?", "de"),
+    ("こんにちは、営業時間は？", "ja"),
+    ("Привет, когда вы открыты?", "ru"),
+])
+def test_detects_language(message, lang):
+    assert detect_language([message]) == lang
+
+
+def test_phone_number_alone_is_undecided():
+    assert detect_language(["06 12 34 56 78"]) is None
+
+
+def test_name_and_number_keep_the_conversation_language():
+    assert detect_language(["Je voudrais un devis", "Jean Dupont 0612345678"]) == "fr"
@@ -0,0 +1,23 @@
+from metrics import registry
+
+
+def test_unknown_tokens_share_one_label(stack):
+    for i in range(3):
+        r = stack.run(stack.http.post("/chat", json={
+            "message": "Vous livrez le dimanche %d ?" % i, "client_token": "inconnu-%d" % i,
+            "page_content": "Livraison du lundi au samedi.",
+        }))
+        assert r.status_code == 200
+
+    text = registry.render()
+    assert 'tenant="unknown"' in text
+    assert "inconnu-" not in text
+
+
+def test_known_tenant_keeps_its_label(stack):
+    r = stack.run(stack.http.post("/chat", json={
+        "message": "Quels sont vos tarifs de livraison ?", "client_token": stack.token,
+    }))
+    assert r.status_code == 200
+    assert 'tenant="%s"' % stack.token in registry.render()
+
@@ -0,0 +1,75 @@
+from sqlalchemy import create_engine, inspect, text
+
+import migrations
+from database import engine
+
+
+def counted_steps(monkeypatch) -> list:
+    """Remplace les étapes par des copies qui notent leur passage."""
+    ran = []
+
+    def counted(version, step):
+        def run(conn):
+            ran.append(version)
+            step(conn)
+        run.__name__ = step.__name__
+        return run
+
+    monkeypatch.setattr(migrations, "STEPS", [(v, counted(v, step)) for v, step in migrations.STEPS])
+    return ran
+
+
+def schema_version(bind) -> int:
+    with bind.connect() as conn:
+        return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+
+
+def test_up_to_date_database_runs_no_step(stack, monkeypatch):
+    ran = counted_steps(monkeypatch)
+    assert schema_version(engine) == migrations.LATEST_VERSION
+    migrations.migrate()
+    assert ran == []
+
+
+def test_worker_that_lost_the_race_applies_nothing(stack, monkeypatch):
+    # Lecture périmée avant le verrou : un autre worker a tout appliqué depuis
+    ran = counted_steps(monkeypatch)
+    real = migrations.current_version
+    reads = []
+
+    def current_version(conn):
+        reads.append(1)
+        return 0 if len(reads) == 1 else real(conn)
+
+    monkeypatch.setattr(migrations, "current_version", current_version)
+    migrations.migrate()
+    assert ran == []
+    assert len(reads) == 1 + len(migrations.STEPS)  # version relue avant chaque étape
+
+
+def test_legacy_database_is_upgraded_step_by_step(monkeypatch, tmp_path):
+    legacy = create_engine("sqlite:///" + str(tmp_path / "legacy.db"))
+    with legacy.begin() as conn:
+        # Schéma d'avant les migrations : ni état, ni colonnes de résumé
+        conn.execute(text("CREATE TABLE conversations (id VARCHAR PRIMARY KEY, title VARCHAR, "
+                          "client_token VARCHAR, created_at TIMESTAMP)"))
+        conn.execute(text("CREATE TABLE messages (id VARCHAR PRIMARY KEY, conversation_id VARCHAR, "
+                          "role VARCHAR, content TEXT, created_at TIMESTAMP)"))
+        conn.execute(text("INSERT INTO conversations VALUES ('c1', 'x', 'tok', '2024-01-01 10:00:00')"))
+        conn.execute(text("INSERT INTO messages VALUES ('m1', 'c1', 'user', 'Rappelez-moi au 0612345678', "
+                          "'2024-01-01 10:00:00'), ('m2', 'c1', 'assistant', 'Entendu', '2024-01-01 10:00:01')"))
+    monkeypatch.setattr(migrations, "engine", legacy)
+    ran = counted_steps(monkeypatch)
+
+    migrations.migrate()
+    assert ran == [v for v, _ in migrations.STEPS]
+    assert schema_version(legacy) == migrations.LATEST_VERSION
+    assert {"state", "message_count", "contact_info", "summary"} <= \
+        {c["name"] for c in inspect(legacy).get_columns("conversations")}
+    with legacy.connect() as conn:
+        row = conn.execute(text("SELECT message_count, contact_info FROM conversations")).one()
+    assert tuple(row) == (2, "Rappelez-moi au 0612345678")
+
+    migrations.migrate()
+    assert len(ran) == len(migrations.STEPS)
+    legacy.dispose()
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import notifications
+from database import AsyncSessionLocal
+from models import OutboxItem
+from notifications import OutboxWorker, fake_sent_emails, retry_delay
+
+
+def add_item(stack) -> str:
+    """Email en attente, pas encore dû : seul le test le traite."""
+    item_id = str(uuid.uuid4())
+
+    async def add():
+        async with AsyncSessionLocal() as db:
+            db.add(OutboxItem(id=item_id, kind=notifications.KIND_HANDOFF_EMAIL, status="pending", attempts=0,
+                              payload=json.dumps({"to": ["owner@example.com"], "subject": "Test", "html": "-"}),
+                              next_attempt_at=datetime.utcnow() + timedelta(days=1), created_at=datetime.utcnow()))
+            await db.commit()
+    stack.run(add())
+    return item_id
+
+
+def load(stack, item_id: str) -> OutboxItem:
+    async def get():
+        async with AsyncSessionLocal() as db:
+            return await db.get(OutboxItem, item_id)
+    return stack.run(get())
+
+
+@pytest.fixture
+def failing_send(monkeypatch):
+    """send_email qui échoue les `failures[0]` premières fois."""
+    failures = [0]
+
+    def send(params):
+        if failures[0]:
+            failures[0] -= 1
+            raise RuntimeError("fournisseur indisponible")
+        return "ok"
+
+    monkeypatch.setattr(notifications, "send_email", send)
+    return failures
+
+
+def test_retry_delay_is_exponential_and_capped(monkeypatch):
+    monkeypatch.setattr(notifications, "OUTBOX_RETRY_BASE_SECONDS", 10)
+    monkeypatch.setattr(notifications, "OUTBOX_RETRY_MAX_SECONDS", 60)
+    assert [retry_delay(n) for n in range(1, 6)] == [10, 20, 40, 60, 60]
+
+
+def test_failures_are_retried_with_backoff_then_given_up(stack, failing_send, monkeypatch):
+    monkeypatch.setattr(notifications, "OUTBOX_MAX_ATTEMPTS", 3)
+    failing_send[0] = 3
+    worker = OutboxWorker()
+    item_id = add_item(stack)
+    for attempt in (1, 2):
+        before = datetime.utcnow()
+        stack.run(worker.deliver(load(stack, item_id)))
+        item = load(stack, item_id)
+        assert (item.status, item.attempts, item.last_error) == ("pending", attempt, "fournisseur indisponible")
+        delay = (item.next_attempt_at - before).total_seconds()
+        assert retry_delay(attempt) <= delay < retry_delay(attempt) + 1
+
+    stack.run(worker.deliver(load(stack, item_id)))
+    item = load(stack, item_id)
+    assert (item.status, item.attempts) == ("failed", 3)
+    assert (worker.sent, worker.retried, worker.failed) == (0, 2, 1)
+
+
+def test_retry_succeeds(stack, failing_send):
+    failing_send[0] = 1
+    worker = OutboxWorker()
+    item_id = add_item(stack)
+    stack.run(worker.deliver(load(stack, item_id)))
+    stack.run(worker.deliver(load(stack, item_id)))
+    item = load(stack, item_id)
+    assert (item.status, item.attempts, item.last_error) == ("sent", 2, None)
+    assert item.sent_at is not None
+
+
+def test_handoff_email_is_queued_with_the_turn_and_sent(stack):
+    conv_id = "outbox-handoff"
+    stack.run(stack.http.post("/contact-human", json={"client_token": stack.token, "conversation_id": conv_id}))
+    r = stack.run(stack.http.post("/chat", json={
+        "message": "Marie, 06 12 34 56 78", "client_token": stack.token, "conversation_id": conv_id,
+    }))
+    assert r.json()["needs_human"] is True
+    stack.run(asyncio.sleep(0.2))  # le worker est réveillé après le commit du tour
+    assert any("06 12 34 56 78" in e["html"] and e["to"] == ["owner@example.com"] for e in fake_sent_emails)
+
+
+@pytest.fixture
+def resend_stub(monkeypatch):
+    """Resend simulé par bench/openai_stub.py, servi en HTTP (le SDK resend est synchrone)."""
+    import socket
+
+    import resend
+    from common import serve_in_thread
+    from openai_stub import make_app
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    stub = make_app(0.01, email_latency=0.0)
+    server = serve_in_thread(stub, port)
+    monkeypatch.setattr(notifications, "EMAIL_BACKEND", "resend")
+    monkeypatch.setattr(resend, "api_key", "stub")
+    monkeypatch.setattr(resend, "api_url", "http://127.0.0.1:%d" % port)
+    yield stub
+    server.should_exit = True
+
+
+def test_resend_failures_are_retried_then_sent(stack, resend_stub, monkeypatch):
+    monkeypatch.setattr(notifications, "OUTBOX_MAX_ATTEMPTS", 3)
+    worker = OutboxWorker()
+    resend_stub.state.email_fail_rate = 1.0
+    failed = add_item(stack)
+    for _ in range(3):
+        stack.run(worker.deliver(load(stack, failed)))
+    item = load(stack, failed)
+    assert (item.status, item.attempts) == ("failed", 3)
+    assert resend_stub.state.email_failures == 3
+
+    resend_stub.state.email_fail_rate = 0.0
+    sent = add_item(stack)
+    stack.run(worker.deliver(load(stack, sent)))
+    assert load(stack, sent).status == "sent"
+    assert resend_stub.state.emails == 1
+    assert (worker.sent, worker.retried, worker.failed) == (1, 2, 1)
@@ -0,0 +1,59 @@
+from sqlalchemy import func, select
+
+from database import AsyncSessionLocal
+from models import Message, PageSnapshot
+from pages import normalize_page, page_hash, page_store
+
+PAGE = "Jardins Dupont\n\nEntretien de jardins   et taille de haies.\nEntretien de jardins et taille de haies.\n" \
+       "© 2024 Tous droits réservés\n"
+
+
+def test_normalize_page_drops_duplicates_and_boilerplate():
+    assert normalize_page(PAGE) == "Jardins Dupont\nEntretien de jardins et taille de haies."
+
+
+def post(stack, conv_id: str, **page):
+    return stack.run(stack.http.post("/chat", json=dict({
+        "message": "Taillez-vous les haies ?", "client_token": stack.token, "conversation_id": conv_id,
+    }, **page)))
+
+
+def count_messages(stack, conv_id: str) -> int:
+    async def count():
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(
+                select(func.count()).select_from(Message).where(Message.conversation_id == conv_id)
+            )).scalar()
+    return stack.run(count())
+
+
+def test_unknown_hash_asks_for_the_content_then_hash_is_enough(stack):
+    digest = page_hash(PAGE)
+    r = post(stack, "page-1", page_hash=digest)
+    assert r.status_code == 409
+    assert r.json()["detail"] == "page_content_required"
+    assert count_messages(stack, "page-1") == 0  # rien n'est traité avant le renvoi
+
+    r = post(stack, "page-1", page_hash=digest, page_content=PAGE)
+    assert r.status_code == 200
+
+    async def snapshot():
+        async with AsyncSessionLocal() as db:
+            return await db.get(PageSnapshot, (stack.token, digest))
+    assert stack.run(snapshot()).content == normalize_page(PAGE)
+
+    # Mémoire du worker perdue (redémarrage) : relue en base, pas de 409
+    page_store._entries.clear()
+    hits = page_store.hits
+    assert post(stack, "page-2", page_hash=digest).status_code == 200
+    assert page_store.hits == hits + 1
+    assert count_messages(stack, "page-2") == 2
+
+
+def test_pages_are_scoped_per_client(stack):
+    digest = page_hash(PAGE)
+    post(stack, "page-3", page_content=PAGE)
+    r = stack.run(stack.http.post("/chat", json={
+        "message": "Taillez-vous les haies ?", "client_token": stack.create_client("Pages"), "page_hash": digest,
+    }))
+    assert r.status_code == 409
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import APIConnectionError
+
+import resilience
+from chatbot import MSG_UNAVAILABLE
+from resilience import CircuitBreaker, CircuitOpen, call_openai
+
+
+def open_breaker(threshold: int = 2, cooldown: float = 0.05) -> CircuitBreaker:
+    breaker = CircuitBreaker(threshold, cooldown)
+    for _ in range(threshold):
+        assert breaker.allow() is False
+        breaker.failure()
+    return breaker
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(threshold=3, cooldown=60)
+    breaker.failure()
+    breaker.failure()
+    assert breaker.state == "closed"
+    breaker.failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+
+def test_success_resets_consecutive_failures():
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_a_single_probe_through():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    assert breaker.allow() is True
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+
+def test_probe_success_closes_and_failure_reopens():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    assert breaker.allow() is True
+    breaker.success()
+    assert breaker.state == "closed"
+
+    breaker = open_breaker()
+    time.sleep(0.06)
+    assert breaker.allow() is True
+    breaker.failure(probe=True)
+    assert breaker.state == "open"
+    assert breaker.opens == 2
+
+
+def test_late_failure_of_ordinary_call_keeps_the_probe():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    assert breaker.allow() is True
+    breaker.failure()  # appel parti avant l'ouverture
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+
+def fresh_breaker(monkeypatch) -> CircuitBreaker:
+    breaker = open_breaker()
+    monkeypatch.setattr(resilience, "openai_breaker", breaker)
+    time.sleep(0.06)
+    return breaker
+
+
+def test_cancelled_probe_frees_the_probe_slot(monkeypatch):
+    breaker = fresh_breaker(monkeypatch)
+
+    async def scenario():
+        probe = asyncio.ensure_future(call_openai("main", asyncio.sleep, delay=10))
+        await asyncio.sleep(0)
+        assert breaker.probing
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert breaker.allow() is True
+
+
+def test_cancelled_ordinary_call_does_not_free_the_probe_slot(monkeypatch):
+    breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+    monkeypatch.setattr(resilience, "openai_breaker", breaker)
+
+    async def scenario():
+        # Appel parti disjoncteur fermé, annulé pendant l'appel d'essai
+        ordinary = asyncio.ensure_future(call_openai("main", asyncio.sleep, delay=10))
+        await asyncio.sleep(0)
+        breaker.failure()
+        breaker.failure()
+        await asyncio.sleep(0.06)
+        assert breaker.allow() is True
+        ordinary.cancel()
+        await asyncio.gather(ordinary, return_exceptions=True)
+
+    asyncio.run(scenario())
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+
+def test_failed_probe_reopens_without_retry(monkeypatch):
+    breaker = fresh_breaker(monkeypatch)
+    monkeypatch.setattr(resilience, "OPENAI_RETRY_BASE_SECONDS", 0.01)  # retry avant la fin du délai
+    calls = []
+
+    async def create():
+        calls.append(1)
+        raise APIConnectionError(request=httpx.Request("POST", "http://stub/v1/chat/completions"))
+
+    with pytest.raises(CircuitOpen):
+        asyncio.run(call_openai("main", create))
+    assert len(calls) == 1
+    assert breaker.state == "open"
+
+
+# ── /chat et /chat/stream contre le stub avec pannes injectées ───────────────
+
+@pytest.fixture
+def faulty(stack, monkeypatch):
+    """Disjoncteur neuf (3 échecs, 0.3 s), échéance courte, pas de hedging."""
+    import routing
+
+    breaker = CircuitBreaker(threshold=3, cooldown=0.3)
+    monkeypatch.setattr(resilience, "openai_breaker", breaker)
+    monkeypatch.setitem(resilience.OPENAI_DEADLINES, "main", 0.5)
+    monkeypatch.setattr(resilience, "OPENAI_RETRY_BASE_SECONDS", 0.01)
+    monkeypatch.setattr(routing, "HEDGE_ENABLED", False)
+    monkeypatch.setattr(stack.stub.state, "stall_seconds", 5.0)
+    for name in ("error_rate", "stall_rate"):
+        monkeypatch.setattr(stack.stub.state, name, 0.0)
+    return breaker
+
+
+def chat(stack, message: str) -> str:
+    r = stack.run(stack.http.post("/chat", json={"message": message, "client_token": stack.token}))
+    assert r.status_code == 200
+    return r.json()["reply"]
+
+
+def chat_stream(stack, message: str) -> str:
+    r = stack.run(stack.http.post("/chat/stream", json={"message": message, "client_token": stack.token}))
+    assert r.status_code == 200
+    done = r.text.split("event: done\ndata: ", 1)[1].split("\n", 1)[0]
+    return json.loads(done)["reply"]
+
+
+def test_isolated_error_is_retried(stack, faulty, monkeypatch):
+    import openai_stub
+
+    draws = iter([0.0])  # premier appel en erreur, les suivants sains
+    monkeypatch.setattr(openai_stub, "random", SimpleNamespace(random=lambda: next(draws, 1.0)))
+    stack.stub.state.error_rate = 0.5
+    calls = stack.stub.state.calls
+    assert chat(stack, "Faites-vous la pose de parquet ?") != MSG_UNAVAILABLE
+    assert stack.stub.state.calls - calls == 2
+    assert faulty.state == "closed"
+
+
+def test_errors_open_the_breaker_then_fallback_then_recover(stack, faulty):
+    stack.stub.state.error_rate = 1.0
+    calls = stack.stub.state.calls
+    assert chat(stack, "Quels sont vos délais de livraison ?") == MSG_UNAVAILABLE
+    assert stack.stub.state.calls - calls == 1 + resilience.OPENAI_MAX_RETRIES
+    assert faulty.state == "open"
+
+    # Disjoncteur ouvert : repli immédiat, le stub n'est plus appelé
+    calls = stack.stub.state.calls
+    assert chat(stack, "Livrez-vous en Belgique ?") == MSG_UNAVAILABLE
+    assert chat_stream(stack, "Livrez-vous en Suisse ?") == MSG_UNAVAILABLE
+    assert stack.stub.state.calls == calls
+
+    # Après le délai, l'appel d'essai réussit et referme le disjoncteur
+    stack.stub.state.error_rate = 0.0
+    time.sleep(0.35)
+    assert faulty.state == "half_open"
+    assert chat_stream(stack, "Livrez-vous en Italie ?") != MSG_UNAVAILABLE
+    assert faulty.state == "closed"
+    assert chat(stack, "Livrez-vous en Espagne ?") != MSG_UNAVAILABLE
+
+
+def test_stalls_hit_the_deadline_and_open_the_breaker(stack, faulty):
+    stack.stub.state.stall_rate = 1.0
+    for i in range(faulty.threshold):
+        started = time.monotonic()
+        assert chat(stack, "Question bloquée %d ?" % i) == MSG_UNAVAILABLE
+        assert time.monotonic() - started < 1.5  # échéance de 0.5 s, pas les 5 s du blocage
+    assert faulty.state == "open"
+    assert stack.stub.state.injected_stalls >= faulty.threshold
+
+    stack.stub.state.stall_rate = 0.0
+    time.sleep(0.35)
+    assert chat(stack, "Question débloquée ?") != MSG_UNAVAILABLE
+    assert faulty.state == "closed"
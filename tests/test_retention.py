@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+
+from database import AsyncSessionLocal
+from models import Conversation, ConversationArchive, Message
+from retention import archive_due, decode_messages, encode_messages
+
+
+def test_encode_decode_roundtrip():
+    class Row:
+        def __init__(self, i):
+            self.id, self.role, self.content = "m%d" % i, "user", "Message é %d" % i
+            self.created_at = datetime(2024, 1, 1, 0, i)
+
+    rows = [Row(i) for i in range(3)]
+    assert [(m["id"], m["content"], m["created_at"]) for m in decode_messages(encode_messages(rows))] == \
+        [(r.id, r.content, r.created_at) for r in rows]
+
+
+def counts(stack, conv_id: str) -> tuple:
+    """(messages chauds, lignes d'archive)"""
+    async def read():
+        async with AsyncSessionLocal() as db:
+            hot = (await db.execute(
+                select(func.count()).select_from(Message).where(Message.conversation_id == conv_id)
+            )).scalar()
+            cold = (await db.execute(
+                select(func.count()).select_from(ConversationArchive)
+                .where(ConversationArchive.conversation_id == conv_id)
+            )).scalar()
+        return hot, cold
+    return stack.run(read())
+
+
+def search(stack, token: str, q: str) -> list:
+    r = stack.run(stack.http.get("/admin/search", params={"client_token": token, "q": q},
+                                 headers={"X-Admin-Password": "pw"}))
+    return [i["conversation_id"] for i in r.json()["items"]]
+
+
+def make_inactive(stack, conv_id: str, days: int):
+    async def backdate():
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(Conversation).where(Conversation.id == conv_id).values(
+                last_message_at=datetime.utcnow() - timedelta(days=days)
+            ))
+            await db.commit()
+    stack.run(backdate())
+
+
+def test_archive_then_restore_when_the_visitor_returns(stack):
+    token = stack.create_client("Archives", retention_days=30)
+    conv_id = "archive-visiteur"
+    stack.run(stack.http.post("/chat", json={
+        "message": "Vendez-vous des pergolas ?", "client_token": token, "conversation_id": conv_id,
+    }))
+    stack.run(stack.http.post("/chat", json={
+        "message": "Et des pergolas en aluminium ?", "client_token": token, "conversation_id": "archive-active",
+    }))
+    make_inactive(stack, conv_id, 31)
+
+    assert stack.run(archive_due()) == 1
+    assert counts(stack, conv_id) == (0, 1)
+    assert search(stack, token, "pergolas") == ["archive-active"]  # retirée de l'index
+    r = stack.run(stack.http.get("/admin/conversations", params={"client_token": token},
+                                 headers={"X-Admin-Password": "pw"}))
+    listed = {i["id"]: i for i in r.json()["items"]}
+    assert listed[conv_id]["archived"] and listed[conv_id]["message_count"] == 2
+
+    # Le visiteur revient : la conversation est restaurée avant le tour
+    r = stack.run(stack.http.post("/chat", json={
+        "message": "Je reviens pour la pergola", "client_token": token, "conversation_id": conv_id,
+    }))
+    assert r.status_code == 200
+    assert counts(stack, conv_id) == (4, 0)
+    assert sorted(search(stack, token, "pergolas")) == ["archive-active", conv_id]
+
+
+def test_admin_opening_restores_an_archive(stack):
+    token = stack.create_client("Archives admin", retention_days=30)
+    conv_id = "archive-admin"
+    stack.run(stack.http.post("/chat", json={
+        "message": "Posez-vous des clôtures ?", "client_token": token, "conversation_id": conv_id,
+    }))
+    make_inactive(stack, conv_id, 31)
+    assert stack.run(archive_due()) == 1
+
+    r = stack.run(stack.http.get("/admin/conversations/" + conv_id, params={"client_token": token},
+                                 headers={"X-Admin-Password": "pw"}))
+    assert [m["role"] for m in r.json()] == ["user", "assistant"]
+    assert counts(stack, conv_id) == (2, 0)
+    assert search(stack, token, "clotures") == [conv_id]
@@ -0,0 +1,154 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import routing
+from routing import LatencyTracker, model_for, race
+from scheduler import llm_scheduler
+
+
+def test_model_for():
+    assert model_for("main") == routing.MODELS["main"]
+    assert model_for("classify") == routing.MODELS["classify"]
+    assert model_for("inconnu") == routing.MODELS["main"]
+
+
+def warm_tracker(seconds: float = 0.01) -> LatencyTracker:
+    tracker = LatencyTracker()
+    for _ in range(routing.HEDGE_MIN_SAMPLES):
+        tracker.observe(seconds)
+    return tracker
+
+
+class Legs:
+    """Appels simulés : (durée, erreur ou None) de chaque appel, dans l'ordre de départ."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = outcomes
+        self.started = 0
+        self.cancelled = []
+
+    async def __call__(self, model):
+        n = self.started
+        self.started += 1
+        delay, error = self.outcomes[n]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(n)
+            raise
+        if error is not None:
+            raise error
+        return n
+
+
+@pytest.fixture
+def short_delay(monkeypatch):
+    monkeypatch.setattr(routing, "HEDGE_MIN_DELAY_SECONDS", 0.02)
+
+
+def test_no_hedge_without_samples(short_delay):
+    legs = Legs((0.1, None))
+    assert asyncio.run(race(LatencyTracker(), "t", legs)) == 0
+    assert legs.started == 1
+
+
+def test_slow_primary_is_hedged_and_cancelled(short_delay):
+    tracker = warm_tracker()
+    legs = Legs((5.0, None), (0.01, None))
+    active = llm_scheduler.active
+    assert asyncio.run(race(tracker, "t", legs)) == 1
+    assert legs.cancelled == [0]
+    assert (tracker.calls, tracker.hedges, tracker.hedge_wins) == (1, 1, 1)
+    assert llm_scheduler.active == active  # créneau du second appel rendu
+
+
+def test_fast_primary_is_not_hedged(short_delay):
+    tracker = warm_tracker()
+    legs = Legs((0.001, None))
+    assert asyncio.run(race(tracker, "t", legs)) == 0
+    assert legs.started == 1
+    assert tracker.hedges == 0
+
+
+def test_failed_primary_falls_back_to_hedge(short_delay):
+    legs = Legs((0.05, ValueError("perdu")), (0.05, None))
+    assert asyncio.run(race(warm_tracker(), "t", legs)) == 1
+
+
+def test_all_legs_failing_raises_primary_error(short_delay):
+    legs = Legs((0.05, ValueError("appel 0")), (0.01, ValueError("appel 1")))
+    with pytest.raises(ValueError, match="appel 0"):
+        asyncio.run(race(warm_tracker(), "t", legs))
+    assert legs.started == 2
+
+
+def test_hedges_capped_by_ratio(short_delay, monkeypatch):
+    monkeypatch.setattr(routing, "HEDGE_MAX_RATIO", 0.0)
+    legs = Legs((0.1, None))
+    tracker = warm_tracker()
+    assert asyncio.run(race(tracker, "t", legs)) == 0
+    assert legs.started == 1
+    assert tracker.hedges == 0
+
+
+def test_hedging_disabled(short_delay, monkeypatch):
+    monkeypatch.setattr(routing, "HEDGE_ENABLED", False)
+    legs = Legs((0.1, None))
+    assert asyncio.run(race(warm_tracker(), "t", legs)) == 0
+    assert legs.started == 1
+
+
+def test_loser_that_succeeded_too_is_discarded(short_delay):
+    both_done = asyncio.Event()
+    order = []
+    discarded = []
+
+    async def leg(model):
+        n = len(order)
+        order.append(n)
+        if n == 0:
+            await both_done.wait()
+        else:
+            both_done.set()  # les deux appels réussissent dans la même itération
+            await asyncio.sleep(0)
+        return n
+
+    async def discard(result):
+        discarded.append(result)
+
+    winner = asyncio.run(race(warm_tracker(), "t", leg, discard))
+    assert discarded == [1 - winner]
+
+
+def test_hedged_stream_closes_the_losing_stream(short_delay, monkeypatch):
+    streams = []
+
+    class Stream:
+        def __init__(self, delay):
+            self.delay = delay
+            self.closed = False
+            streams.append(self)
+
+        async def __aiter__(self):
+            await asyncio.sleep(self.delay)
+            for word in ("bonjour", " !"):
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))])
+
+        async def close(self):
+            self.closed = True
+
+    async def create(**kwargs):
+        return Stream(5.0 if not streams else 0.01)
+
+    async def collect():
+        return [(c.choices[0].delta.content, llm_scheduler.active)
+                async for c in routing.hedged_stream("t", create, stream=True)]
+
+    monkeypatch.setitem(routing.latency_trackers, "first_token", warm_tracker())
+    active = llm_scheduler.active
+    # Le second appel gagne : son créneau reste pris jusqu'à la fin du flux
+    assert asyncio.run(collect()) == [("bonjour", active + 1), (" !", active + 1)]
+    assert [s.closed for s in streams] == [True, True]
+    assert llm_scheduler.active == active
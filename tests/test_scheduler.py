@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+import pytest
+
+import scheduler
+from scheduler import Busy, LLMScheduler, llm_scheduler
+from tenants import UNKNOWN_TENANT
+
+
+def test_unknown_tokens_share_one_bucket(stack):
+    for i in range(3):
+        r = stack.run(stack.http.post("/chat", json={
+            "message": "Avez-vous un parking %d ?" % i, "client_token": "sans-client-%d" % i,
+        }))
+        assert r.status_code == 200
+    assert UNKNOWN_TENANT in llm_scheduler._buckets
+    assert not [t for t in llm_scheduler._buckets if t.startswith("sans-client-")]
+
+
+def test_full_buckets_are_pruned(monkeypatch):
+    monkeypatch.setattr(scheduler, "LLM_BUCKETS_PRUNE_SIZE", 3)
+    s = LLMScheduler(rate=1000, burst=1)
+
+    async def calls():
+        for tenant in ("a", "b", "c"):
+            (await s.acquire(tenant, "main")).release()
+        await asyncio.sleep(0.01)  # seaux de nouveau pleins
+        (await s.acquire("d", "main")).release()
+
+    asyncio.run(calls())
+    assert list(s._buckets) == ["d"]
+    assert s._last_finish == {}
+
+
+def test_buckets_still_refilling_are_kept(monkeypatch):
+    monkeypatch.setattr(scheduler, "LLM_BUCKETS_PRUNE_SIZE", 2)
+    s = LLMScheduler(rate=0.001, burst=1)
+
+    async def calls():
+        for tenant in ("a", "b", "c"):
+            (await s.acquire(tenant, "main")).release()
+
+    started = time.monotonic()
+    asyncio.run(calls())
+    assert time.monotonic() - started < 1
+    assert sorted(s._buckets) == ["a", "b", "c"]
+
+
+def test_wfq_small_tenant_passes_before_big_backlog():
+    s = LLMScheduler(max_concurrency=1, rate=1000, burst=1000, deadline=5)
+    order = []
+
+    async def call(tenant, n):
+        slot = await s.acquire(tenant, "main")
+        order.append((tenant, n))
+        await asyncio.sleep(0)
+        slot.release()
+
+    async def scenario():
+        held = await s.acquire("gros", "main")
+        tasks = [asyncio.ensure_future(call("gros", n)) for n in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(call("petit", 0)))
+        await asyncio.sleep(0)
+        held.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order == [("gros", 0), ("petit", 0), ("gros", 1), ("gros", 2)]
+
+
+def test_wfq_weights(monkeypatch):
+    monkeypatch.setattr(scheduler, "LLM_TENANT_WEIGHTS", {"prioritaire": 4.0})
+    s = LLMScheduler(max_concurrency=1, rate=1000, burst=1000, deadline=5)
+    order = []
+
+    async def call(tenant):
+        slot = await s.acquire(tenant, "main")
+        order.append(tenant)
+        slot.release()
+
+    async def scenario():
+        held = await s.acquire("x", "main")
+        tasks = [asyncio.ensure_future(call("normal")) for _ in range(2)]
+        tasks += [asyncio.ensure_future(call("prioritaire")) for _ in range(4)]
+        await asyncio.sleep(0)
+        held.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    # Étiquettes : normal 1, 2 ; prioritaire 0.25, 0.5, 0.75, 1
+    assert order == ["prioritaire"] * 3 + ["normal", "prioritaire", "normal"]
+
+
+def test_bucket_exhausted_is_rejected_with_retry_after():
+    s = LLMScheduler(rate=0.1, burst=1, deadline=1)
+
+    async def scenario():
+        (await s.acquire("t", "main")).release()
+        await s.acquire("t", "main")
+
+    with pytest.raises(Busy) as e:
+        asyncio.run(scenario())
+    assert e.value.retry_after == 10
+    assert s.rejected == {("t", "main"): 1}
+
+
+def test_queue_deadline_is_rejected():
+    s = LLMScheduler(max_concurrency=1, rate=1000, burst=1000, deadline=0.05)
+
+    async def scenario():
+        await s.acquire("a", "main")
+        await s.acquire("b", "main")
+
+    with pytest.raises(Busy):
+        asyncio.run(scenario())
+    assert s.waiting == 0
+
+
+def test_try_acquire_never_queues():
+    s = LLMScheduler(max_concurrency=1)
+    slot = s.try_acquire("t", "main")
+    assert slot is not None
+    assert s.try_acquire("t", "main") is None
+    slot.release()
+    slot.release()  # sans effet la seconde fois
+    assert s.active == 0
@@ -0,0 +1,28 @@
+def search(stack, q: str, token: str = None):
+    r = stack.run(stack.http.get("/admin/search", params={"client_token": token or stack.token, "q": q},
+                                 headers={"X-Admin-Password": "pw"}))
+    assert r.status_code == 200
+    return r.json()["items"]
+
+
+def test_chat_turn_is_searchable(stack):
+    r = stack.run(stack.http.post("/chat", json={
+        "message": "Livrez-vous des hortensias bleus ?", "client_token": stack.token,
+        "conversation_id": "search-turn",
+    }))
+    assert r.status_code == 200
+
+    items = search(stack, "hortensias")
+    assert [(i["conversation_id"], i["role"]) for i in items] == [("search-turn", "user")]
+    assert "<mark>hortensias</mark>" in items[0]["snippet"]
+    assert search(stack, "hortens")  # préfixe
+
+
+def test_search_is_limited_to_the_tenant(stack):
+    other = stack.create_client("Recherche")
+    r = stack.run(stack.http.post("/chat", json={
+        "message": "Avez-vous des bégonias ?", "client_token": other, "conversation_id": "search-other",
+    }))
+    assert r.status_code == 200
+    assert search(stack, "begonias") == []
+    assert [i["conversation_id"] for i in search(stack, "begonias", other)] == ["search-other"]
@@ -0,0 +1,52 @@
+from sqlalchemy import update
+
+import chatbot
+from database import SessionLocal
+from models import Client
+from tenants import bump_tenants_version, get_tenant, tenant_cache
+
+
+def test_tenant_config_is_cached(stack):
+    tenant_cache.invalidate()
+    with SessionLocal() as db:
+        misses, hits = tenant_cache.misses, tenant_cache.hits
+        config = get_tenant(stack.token, db)
+        assert config.token == stack.token
+        assert get_tenant(stack.token, db) is config
+        assert (tenant_cache.misses - misses, tenant_cache.hits - hits) == (1, 1)
+
+
+def test_unknown_token_is_cached_until_created(stack):
+    with SessionLocal() as db:
+        assert get_tenant("pas-encore-client", db) is None
+        found, config = tenant_cache.get("pas-encore-client")
+        assert found and config is None
+    token = stack.create_client("Nouveau")
+    with SessionLocal() as db:
+        assert get_tenant(token, db).business_name == "Nouveau"
+
+
+def test_update_client_is_visible_at_once(stack):
+    token = stack.create_client("Avant")
+    with SessionLocal() as db:
+        get_tenant(token, db)
+    r = stack.run(stack.http.post("/superadmin/update-client", json={
+        "token": token, "business_name": "Après", "superadmin_password": chatbot.SUPERADMIN_PASSWORD,
+    }))
+    assert r.status_code == 200
+    with SessionLocal() as db:
+        assert get_tenant(token, db).business_name == "Après"
+
+
+def test_other_worker_update_clears_the_cache(stack):
+    token = stack.create_client("Autre worker")
+    with SessionLocal() as db:
+        get_tenant(token, db)
+        # Autre worker : modifie le client et incrémente cache_versions, sans toucher à ce cache
+        db.execute(update(Client).where(Client.token == token).values(client_email="autre@example.com"))
+        bump_tenants_version(db)
+        db.commit()
+        assert get_tenant(token, db).client_email == "owner@example.com"  # pas encore relu
+
+        tenant_cache._next_sync = 0  # TENANT_CACHE_SYNC_SECONDS écoulées
+        assert get_tenant(token, db).client_email == "autre@example.com"
@@ -0,0 +1,31 @@
+from chatbot import HANDOFF_MESSAGES, MSG_PROPOSAL, fetch_handoff_translations, translate_to_visitor_language
+from translations import TranslationCache, normalize_language, translation_cache
+from turns import TurnContext
+
+
+def test_normalize_language():
+    assert normalize_language("en-US") == "en"
+    assert normalize_language("PT_br") == "pt"
+    assert normalize_language("") is None
+    assert normalize_language("x1") is None
+
+
+def test_source_language_needs_no_translation():
+    assert translation_cache.get("fr", MSG_PROPOSAL) == MSG_PROPOSAL
+
+
+def test_handoff_is_translated_once_then_cached_and_persisted(stack):
+    calls = stack.stub.state.calls
+    assert stack.run(fetch_handoff_translations(lang="nl")) == "nl"
+    assert stack.stub.state.calls - calls == 1
+    assert translation_cache.has_all("nl", HANDOFF_MESSAGES)
+
+    # Langue en cache : aucun appel
+    ctx = TurnContext(conv_id="traduction", client_token=stack.token, tenant=None, language="nl")
+    assert stack.run(translate_to_visitor_language(MSG_PROPOSAL, ["Hallo"], ctx)) == "[en] " + MSG_PROPOSAL
+    assert stack.stub.state.calls - calls == 1
+
+    # Persistées : un nouveau worker les recharge au démarrage
+    reloaded = TranslationCache()
+    stack.run(reloaded.load())
+    assert reloaded.get("nl", MSG_PROPOSAL) == "[en] " + MSG_PROPOSAL
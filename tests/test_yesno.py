@@ -0,0 +1,24 @@
+import pytest
+
+from yesno import classify_yes_no_local
+
+
+@pytest.mark.parametrize("message", ["oui", "Oui merci !", "ok 👍", "yes please"])
+def test_plain_yes(message):
+    assert classify_yes_no_local(message) == (True, 0.95)
+
+
+@pytest.mark.parametrize("message", ["non merci", "no thanks", "nein danke"])
+def test_plain_no(message):
+    assert classify_yes_no_local(message) == (False, 0.95)
+
+
+def test_question_after_yes_is_not_confident():
+    answer, confidence = classify_yes_no_local("oui mais avant, quel est le prix ?")
+    assert answer is True
+    assert confidence < 0.5
+
+
+@pytest.mark.parametrize("message", ["oui non", "bonjour", ""])
+def test_undecided(message):
+    assert classify_yes_no_local(message) == (None, 0.0)
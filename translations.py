@@ -0,0 +1,68 @@
+"""
+Cache des traductions des messages canoniques du handoff humain.
+
+Les messages MSG_* de chatbot.py sont fixes : une fois traduits dans une
+langue, la traduction ne change plus. Le cache est indexé par
+(langue, message canonique), gardé en mémoire et persisté dans la table
+"translations" pour survivre aux redémarrages.
+"""
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from database import AsyncSessionLocal
+from models import Translation
+
+# Langue des messages canoniques : pas de traduction nécessaire
+SOURCE_LANGUAGE = "fr"
+
+
+def normalize_language(code: Optional[str]) -> Optional[str]:
+    """'en-US' / 'EN' → 'en'. None si le code est vide ou invalide."""
+    if not code:
+        return None
+    code = code.strip().lower().replace("_", "-").split("-")[0]
+    return code if code.isalpha() and 2 <= len(code) <= 3 else None
+
+
+class TranslationCache:
+    def __init__(self):
+        self._entries = {}
+
+    def get(self, lang: Optional[str], canonical_msg: str) -> Optional[str]:
+        if lang == SOURCE_LANGUAGE:
+            return canonical_msg
+        return self._entries.get((lang, canonical_msg))
+
+    def has_all(self, lang: str, canonical_msgs: list) -> bool:
+        return all(self.get(lang, m) is not None for m in canonical_msgs)
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def load(self):
+        """Charge toutes les traductions persistées (démarrage du worker)."""
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(select(Translation))).scalars().all()
+        for row in rows:
+            self._entries[(row.lang, row.canonical)] = row.text
+
+    async def store(self, lang: str, translations: dict):
+        """Ajoute {message canonique: traduction} pour une langue, en mémoire et en base."""
+        new = {m: t for m, t in translations.items() if t and (lang, m) not in self._entries}
+        self._entries.update({(lang, m): t for m, t in new.items()})
+        if not new:
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                for canonical_msg, translated in new.items():
+                    db.add(Translation(lang=lang, canonical=canonical_msg, text=translated))
+                await db.commit()
+        except IntegrityError:
+            pass  # un autre worker l'a enregistrée entre-temps
+        except Exception as e:
+            print("TRANSLATION STORE ERROR:", e)
+
+
+translation_cache = TranslationCache()
@@ -0,0 +1,178 @@
+"""
+Chargement et sauvegarde d'un tour de conversation.
+
+Un tour de /chat se fait en deux accès base :
+- lecture : une seule requête ramène la conversation (état, langue, résumé)
+  et ses derniers messages non résumés ; la config client vient du cache
+  de tenants.py ;
+- écriture : un seul commit avec le message du visiteur, la réponse, le
+  nouvel état, les colonnes de résumé de la conversation, l'événement
+  du dashboard admin (admin_events.py) et l'index de recherche (search.py).
+Entre les deux (appels GPT), aucune connexion n'est tenue.
+"""
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select, update, func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from admin_events import conversation_item, event_hub, turn_event
+from history import HISTORY_FETCH_LIMIT
+from metrics import stage, STAGE_SECONDS
+from models import Conversation, Message
+from retention import restore_conversation
+from search import index_messages
+from tenants import TenantConfig, get_tenant_async, tenant_label
+
+
+class HistoryMessage(NamedTuple):
+    role: str
+    content: str
+    created_at: datetime
+
+
+@dataclass
+class TurnContext:
+    conv_id: str
+    client_token: str
+    tenant: Optional[TenantConfig]
+    exists: bool = False
+    state: str = "normal"
+    start_state: str = "normal"  # état au chargement (label des métriques)
+    language: Optional[str] = None
+    summary: Optional[str] = None
+    summary_upto: Optional[datetime] = None
+    # Messages non encore résumés, ordre chronologique (message du tour inclus)
+    history: list = field(default_factory=list)
+    user_message: Optional[HistoryMessage] = None
+
+    @property
+    def tenant_label(self) -> str:
+        """Label des métriques : token du client, "unknown" s'il n'existe pas."""
+        return tenant_label(self.client_token, self.tenant)
+
+    def visitor_messages(self) -> list:
+        return [m.content for m in self.history if m.role == "user"]
+
+    def add_user_message(self, content: str):
+        self.user_message = HistoryMessage("user", content, datetime.utcnow())
+        self.history.append(self.user_message)
+
+
+async def load_turn(conv_id: str, client_token: str, db: AsyncSession) -> TurnContext:
+    """Phase de lecture : conversation + derniers messages en une requête."""
+    started = time.perf_counter()
+    ctx = await _load_turn(conv_id, client_token, db)
+    # Mesurée après coup : le label dépend du client trouvé
+    STAGE_SECONDS.observe(time.perf_counter() - started, "db_read", ctx.tenant_label, "")
+    return ctx
+
+
+async def _load_turn(conv_id: str, client_token: str, db: AsyncSession) -> TurnContext:
+    tenant = await get_tenant_async(client_token, db)
+    recent = (
+        select(Message.conversation_id, Message.role, Message.content, Message.created_at)
+        .where(Message.conversation_id == conv_id)
+        .order_by(Message.created_at.desc())
+        .limit(HISTORY_FETCH_LIMIT)
+        .subquery()
+    )
+    rows = (await db.execute(
+        select(
+            Conversation.state, Conversation.language, Conversation.summary, Conversation.summary_upto,
+            Conversation.archived_at, recent.c.role, recent.c.content, recent.c.created_at
+        )
+        .outerjoin(recent, (recent.c.conversation_id == Conversation.id) & or_(
+            Conversation.summary_upto.is_(None), recent.c.created_at > Conversation.summary_upto
+        ))
+        .where(Conversation.id == conv_id)
+        .order_by(recent.c.created_at)
+    )).all()
+    if rows and rows[0].archived_at is not None:
+        # Visiteur de retour sur une conversation archivée (retention.py)
+        restored = await db.run_sync(restore_conversation, conv_id)
+        await db.commit()
+        if restored:
+            return await _load_turn(conv_id, client_token, db)
+    # Aucune transaction ne reste ouverte pendant les appels GPT
+    await db.commit()
+
+    ctx = TurnContext(conv_id=conv_id, client_token=client_token, tenant=tenant)
+    if rows:
+        first = rows[0]
+        ctx.exists = True
+        ctx.state = ctx.start_state = first.state or "normal"
+        ctx.language = first.language
+        ctx.summary = first.summary
+        ctx.summary_upto = first.summary_upto
+        ctx.history = [HistoryMessage(r.role, r.content, r.created_at) for r in rows if r.role]
+    return ctx
+
+
+async def save_turn(ctx: TurnContext, db: AsyncSession, reply: Optional[str] = None,
+                    contact_info: Optional[str] = None):
+    """
+    Phase d'écriture : message du visiteur (s'il y en a un), réponse, état,
+    langue et résumé dénormalisé de la conversation, en un seul commit.
+    """
+    messages = []
+    if ctx.user_message:
+        messages.append(ctx.user_message)
+    if reply is not None:
+        messages.append(HistoryMessage("assistant", reply, datetime.utcnow()))
+    if not messages:
+        return
+
+    values = {"state": ctx.state, "language": ctx.language, "last_message_at": messages[-1].created_at}
+    if ctx.user_message:
+        values["last_user_message_at"] = ctx.user_message.created_at
+    if contact_info:
+        values["contact_info"] = contact_info
+
+    with stage("db_write", ctx.tenant_label, ctx.start_state):
+        await _write_turn(ctx, db, messages, values)
+    ctx.exists = True
+    event_hub.notify(ctx.client_token)
+
+
+async def _write_turn(ctx: TurnContext, db: AsyncSession, messages: list, values: dict):
+    created = not ctx.exists
+    if ctx.exists:
+        row = (await db.execute(
+            update(Conversation).where(Conversation.id == ctx.conv_id)
+            .values(message_count=func.coalesce(Conversation.message_count, 0) + len(messages), **values)
+            .returning(Conversation.created_at, Conversation.message_count, Conversation.contact_info)
+            .execution_options(synchronize_session=False)
+        )).first()
+        created_at, message_count, contact_info = row if row else (None, len(messages), values.get("contact_info"))
+    else:
+        created_at, message_count, contact_info = datetime.utcnow(), len(messages), values.get("contact_info")
+        db.add(Conversation(id=ctx.conv_id, title="Conversation client", client_token=ctx.client_token,
+                            created_at=created_at, message_count=message_count, **values))
+    indexed = []
+    for m in messages:
+        message_id = str(uuid.uuid4())
+        db.add(Message(id=message_id, conversation_id=ctx.conv_id,
+                       role=m.role, content=m.content, created_at=m.created_at))
+        indexed.append(message_id)
+    # Delta pour le dashboard admin (admin_events.py), dans la même transaction
+    db.add(turn_event(ctx, messages, conversation_item(
+        ctx.conv_id, created_at, ctx.state, message_count, contact_info
+    ), created))
+    try:
+        # La session n'a pas d'autoflush : les messages doivent exister avant
+        # que l'index plein texte (search.py) les relise, même transaction
+        await db.flush()
+        await index_messages(db, ctx.client_token, indexed)
+        await db.commit()
+    except IntegrityError:
+        if ctx.exists:
+            raise
+        # Conversation créée entre-temps par un tour concurrent : on la met à jour
+        await db.rollback()
+        ctx.exists = True
+        await _write_turn(ctx, db, messages, values)
@@ -0,0 +1,102 @@
+"""
+Classification locale OUI / NON de la réponse du visiteur à MSG_PROPOSAL.
+
+La grande majorité des réponses sont courtes ("oui", "ok", "non merci",
+"yes please", "ja gerne"…) : un lexique multilingue suffit, sans appel GPT.
+classify_yes_no_local() retourne (réponse, confiance) ; l'appelant ne
+remonte vers GPT que si la confiance est sous son seuil.
+"""
+import re
+import unicodedata
+from typing import Optional, Tuple
+
+# Expressions à tester avant les mots isolés ("why not" contient "not")
+YES_PHRASES = [
+    "pourquoi pas", "why not", "perche no", "por que no", "porque no", "warum nicht", "waarom niet",
+    "bien sur", "avec plaisir", "of course", "go ahead", "por supuesto", "con gusto", "va bene",
+    "claro que si", "na klar", "ja graag", "ja gerne", "com certeza", "pode ser",
+    "vas y", "allez y", "rappelez moi", "contactez moi", "call me", "contact me", "sure thing",
+]
+NO_PHRASES = [
+    "non merci", "pas du tout", "pas maintenant", "plus tard", "pas besoin", "pas la peine", "ca ira",
+    "no thanks", "no thank you", "not now", "maybe later", "not needed", "no need",
+    "no grazie", "no gracias", "nein danke", "nee dank", "nao obrigado", "nao obrigada", "ahora no",
+]
+YES_WORDS = set(
+    "oui ouais ouep ok okay oki dac daccord volontiers parfait super carrement absolument "
+    "yes yeah yep yup sure please definitely absolutely alright "
+    "si claro vale dale bueno certo certamente perfetto "
+    "ja jawohl gerne genau klar natuurlijk graag prima "
+    "sim claro pode "
+    "da hai evet tak".split()
+)
+NO_WORDS = set(
+    "non no nope nah nan jamais pas never not nein nee nej niet nao nunca mai "
+    "ne nie hayir iie".split()
+)
+# Mots neutres qui accompagnent souvent un oui/non sans en changer le sens
+NEUTRAL_WORDS = set(
+    "merci thanks thank you grazie gracias danke dank bedankt obrigado obrigada "
+    "je i me moi a c est it s its that de du le la les the svp s il vous plait "
+    "bien tres very much beaucoup mille muchas vielen hartelijk muito "
+    "bonjour hello hi salut ciao hola hallo ola".split()
+)
+YES_EMOJI = ("👍", "👌", "✅", "🙏")
+NO_EMOJI = ("👎", "❌", "🚫")
+
+WORD_RE = re.compile(r"[a-z]+")
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(WORD_RE.findall(text.replace("'", "")))
+
+
+def classify_yes_no_local(message: str) -> Tuple[Optional[bool], float]:
+    """
+    (True, confiance) / (False, confiance) / (None, 0.0) si rien de reconnu.
+    La confiance baisse avec la part de mots hors lexique : "oui mais avant,
+    quel est le prix ?" n'est pas un simple oui.
+    """
+    yes_emoji = any(e in message for e in YES_EMOJI)
+    no_emoji = any(e in message for e in NO_EMOJI)
+    text = _normalize(message)
+    padded = " " + text + " "
+
+    yes = no = 0
+    for phrase in YES_PHRASES:
+        if " " + phrase + " " in padded:
+            yes += 1
+            padded = padded.replace(" " + phrase + " ", " ")
+    for phrase in NO_PHRASES:
+        if " " + phrase + " " in padded:
+            no += 1
+            padded = padded.replace(" " + phrase + " ", " ")
+
+    unknown = 0
+    words = padded.split()
+    for w in words:
+        if w in NO_WORDS:
+            no += 1
+        elif w in YES_WORDS:
+            yes += 1
+        elif w not in NEUTRAL_WORDS:
+            unknown += 1
+    yes += yes_emoji
+    no += no_emoji
+
+    if yes == no:
+        return None, 0.0
+    answer = yes > no
+    # Un oui ET un non dans la même réponse : on n'est sûr de rien
+    confidence = 0.95 if min(yes, no) == 0 else 0.5
+    if unknown:
+        confidence *= max(0.0, 1.0 - unknown / (len(words) + 1)) ** 2
+    if "?" in message:
+        confidence *= 0.7  # le visiteur pose une question plutôt que de répondre
+    return answer, round(confidence, 3)
+
+
+# Compteurs exposés par /superadmin/stats
+yesno_stats = {"fast_path": 0, "llm": 0}